@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_cypnest_reader.py - Compares the streaming CypNest reader with full openpyxl loading.
+
+Usage:
+    python bench_cypnest_reader.py [folder] [--repeat N]
+
+The folder defaults to the sample exports in Wycena/. For every file the
+openpyxl path (load_workbook(data_only=True) + thumbnail extraction, as done by
+the old analyze_xlsx_folder) and the streaming reader are timed, and both
+records are compared field by field.
+"""
+import argparse
+import dataclasses
+import os
+import sys
+import time
+
+from cypnest_reader import read_cypnest_export
+
+
+def _best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, result
+
+
+def _same_record(a, b):
+    da, db = dataclasses.asdict(a), dataclasses.asdict(b)
+    for d in (da, db):
+        d.pop("backend")
+        d.pop("warnings")
+    return da == db
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("folder", nargs="?", default=os.path.join(here, "Wycena"))
+    parser.add_argument("--repeat", type=int, default=5, help="runs per file, best time is reported")
+    args = parser.parse_args(argv)
+
+    files = sorted(f for f in os.listdir(args.folder) if f.lower().endswith(".xlsx"))
+    if not files:
+        print(f"No .xlsx files in {args.folder}")
+        return 1
+
+    total_full = total_stream = 0.0
+    mismatches = 0
+    print(f"{'file':<60} {'openpyxl [ms]':>14} {'stream [ms]':>12} {'speed-up':>9}")
+    for fname in files:
+        path = os.path.join(args.folder, fname)
+        t_full, rec_full = _best_of(lambda: read_cypnest_export(path, streaming=False), args.repeat)
+        t_stream, rec_stream = _best_of(lambda: read_cypnest_export(path), args.repeat)
+        total_full += t_full
+        total_stream += t_stream
+        same = _same_record(rec_full, rec_stream)
+        mismatches += 0 if same else 1
+        name = fname if len(fname) <= 58 else "…" + fname[-57:]
+        print(f"{name:<60} {t_full * 1000:>14.1f} {t_stream * 1000:>12.1f} "
+              f"{t_full / t_stream:>8.1f}x{'' if same else '  MISMATCH'}")
+
+    print("-" * 98)
+    print(f"{'TOTAL (' + str(len(files)) + ' files)':<60} {total_full * 1000:>14.1f} "
+          f"{total_stream * 1000:>12.1f} {total_full / total_stream:>8.1f}x")
+    if mismatches:
+        print(f"{mismatches} file(s) produced different records")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+costing.py - Costing engine: every cost of every part of an order as NumPy arrays.
+
+The parts of an order are dicts (see wycena.py); PartCostArrays takes the
+columns the unit cost depends on out of them once (the prices in it are the
+ones the price indexes gave for the part's file), and unit_costs() then
+prices every part in one vectorised step:
+
+    material  = weight x PLN/kg x 1.07 (mandatory 7%) x (1 + material margin)
+    cutting   = cut length x PLN/m x (1 + cutting margin)
+    + contours, marking, defilm at their rates
+    + order overheads spread over the part count
+
+The element-wise operations are the ones the per-part code did, in the same
+order, so the results are identical to the last bit. breakdown() returns the
+cost components one by one (CostBreakdown) for the analysis, the cost
+report and the log; nothing outside this module repeats the formulas.
+
+tkw_unit_costs() is the own cost (TKW) of the cost report: material without
+margins, cutting time x the own hourly rate of the part's gas, overheads and
+a share of bending. sweep() evaluates the order total and the TKW result for
+a whole grid of margins and hourly rates at once by broadcasting the margin
+and rate axes against the parts axis. quantity_tiers() reprices every part
+for a list of order quantities (tiers x parts), with the sheet count and the
+order overheads of each tier. order_costs() is the cost summary of Panel 2:
+the order's cutting time per gas at the hourly rates, material and the
+operating costs.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, Sequence, Tuple
+
+import numpy as np
+
+import money
+
+MATERIAL_MIN_MARGIN = 1.07  # 7% always added to the material price
+
+PART_COST_FIELDS = (
+    "adj_weight", "base_price_per_kg",
+    "cut_length", "base_rate_per_cut_length",
+    "contours_qty", "rate_per_contour",
+    "marking_length", "rate_per_marking_length",
+    "defilm_length", "rate_per_defilm_length",
+    "cuuting_speed_m_min",
+)
+
+# own (TKW) hourly rate buckets: oxygen, nitrogen, nitrogen on aluminium
+GAS_O, GAS_N, GAS_AL_N = 0, 1, 2
+
+
+def gas_bucket(gas_key, material) -> int:
+    """Hourly rate bucket of a part, as the cost report picks the TKW rate."""
+    if gas_key == "N":
+        return GAS_AL_N if "AL" in (material or "").upper() else GAS_N
+    return GAS_O
+
+
+class PartCostArrays:
+    """One float array per PART_COST_FIELDS column (missing values are 0)."""
+
+    def __init__(self, columns: Dict[str, np.ndarray], gas: np.ndarray = None):
+        self.columns = columns
+        self.gas = gas if gas is not None else np.zeros(len(self), dtype=int)
+
+    @classmethod
+    def from_parts(cls, parts: Iterable[dict], chunk_size: int = 4096) -> "PartCostArrays":
+        """Columns of ``parts``, iterated once and converted ``chunk_size`` parts
+        at a time (a parts_store.StoredParts view is never held in memory)."""
+        blocks, gas_blocks = [], []
+        rows, gas = [], []
+        for p in parts:
+            rows.append(tuple(p.get(f, 0.0) or 0.0 for f in PART_COST_FIELDS))
+            gas.append(gas_bucket(p.get("gas_key"), p.get("material")))
+            if len(rows) >= chunk_size:
+                blocks.append(np.array(rows, dtype=float))
+                gas_blocks.append(np.array(gas, dtype=int))
+                rows, gas = [], []
+        blocks.append(np.array(rows, dtype=float).reshape(len(rows), len(PART_COST_FIELDS)))
+        gas_blocks.append(np.array(gas, dtype=int).reshape(len(gas)))
+        data = np.concatenate(blocks)
+        return cls({f: data[:, i] for i, f in enumerate(PART_COST_FIELDS)}, np.concatenate(gas_blocks))
+
+    def take(self, index) -> "PartCostArrays":
+        """The parts at ``index`` (positions in the order)."""
+        index = np.asarray(index, dtype=int)
+        return PartCostArrays({f: column[index] for f, column in self.columns.items()}, self.gas[index])
+
+    def __len__(self):
+        return len(self.columns[PART_COST_FIELDS[0]])
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.columns[field]
+
+
+def overhead_per_part(total_sheets, total_parts_qty, op_cost_per_sheet, tech_per_order, add_costs_order) -> Tuple[float, float]:
+    """(order extras, sheet operating cost) per part; both 0 for an empty order."""
+    if total_parts_qty > 0:
+        return ((tech_per_order + add_costs_order) / total_parts_qty,
+                (total_sheets * op_cost_per_sheet) / total_parts_qty)
+    return 0.0, 0.0
+
+
+def base_material_costs(parts: PartCostArrays) -> np.ndarray:
+    """Material of one piece at the price-list price (no 7%, no margin)."""
+    return parts["adj_weight"] * parts["base_price_per_kg"]
+
+
+def material_costs(parts: PartCostArrays, material_margin: float = 0.0) -> np.ndarray:
+    """Material of one piece with the mandatory 7% and the margin [%]."""
+    material = parts["adj_weight"] * parts["base_price_per_kg"] * MATERIAL_MIN_MARGIN
+    return material * (1.0 + material_margin / 100.0)
+
+
+def base_cutting_costs(parts: PartCostArrays) -> np.ndarray:
+    """Cutting of one piece at the price-list rate per metre."""
+    return parts["cut_length"] * parts["base_rate_per_cut_length"]
+
+
+def cutting_costs(parts: PartCostArrays, cutting_margin: float = 0.0) -> np.ndarray:
+    return base_cutting_costs(parts) * (1.0 + cutting_margin / 100.0)
+
+
+def process_costs(parts: PartCostArrays) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(contours, marking, defilm) of one piece."""
+    return (parts["contours_qty"] * parts["rate_per_contour"],
+            parts["marking_length"] * parts["rate_per_marking_length"],
+            parts["defilm_length"] * parts["rate_per_defilm_length"])
+
+
+def unit_costs(parts: PartCostArrays, material_margin: float = 0.0, cutting_margin: float = 0.0,
+               extra_per_part: float = 0.0, op_cost_per_part: float = 0.0) -> np.ndarray:
+    """Unit cost of every part with the margins [%] applied (unrounded)."""
+    material = material_costs(parts, material_margin)
+    cutting = cutting_costs(parts, cutting_margin)
+    contour, marking, defilm = process_costs(parts)
+    return material + cutting + contour + marking + defilm + extra_per_part + op_cost_per_part
+
+
+def cutting_hours(parts: PartCostArrays) -> np.ndarray:
+    """Cutting time of one piece [h] (0 where the price list has no speed)."""
+    speed = parts["cuuting_speed_m_min"]
+    minutes = np.divide(parts["cut_length"], speed, out=np.zeros(len(parts)), where=speed > 0)
+    return minutes / 60.0
+
+
+def tkw_unit_costs(parts: PartCostArrays, bending: np.ndarray, hourly_rates: Sequence[float],
+                   bending_percent: float, extra_per_part: float = 0.0, op_cost_per_part: float = 0.0) -> np.ndarray:
+    """Own cost of one piece of every part.
+
+    hourly_rates: (O2, N2, AL N2) own rates [PLN/h]; an array of shape
+    (..., 3) gives one row of unit costs per rate set.
+    """
+    material = base_material_costs(parts)
+    cutting = tkw_cutting_costs(parts, hourly_rates)
+    return material + cutting + op_cost_per_part + extra_per_part + tkw_bending_costs(bending, bending_percent)
+
+
+def tkw_cutting_costs(parts: PartCostArrays, hourly_rates: Sequence[float]) -> np.ndarray:
+    """Cutting time of one piece at the own hourly rate of its gas."""
+    rates = np.asarray(hourly_rates, dtype=float)
+    return cutting_hours(parts) * rates[..., parts.gas]
+
+
+def tkw_bending_costs(bending, bending_percent: float) -> np.ndarray:
+    """Own share of the bending price of one piece."""
+    return np.asarray(bending, dtype=float) * (bending_percent / 100.0)
+
+
+@dataclass
+class OrderCosts:
+    """Cost summary of a whole order [PLN] (Panel 2)."""
+    material: float
+    oxygen: float       # O2 cutting time x hourly rate
+    nitrogen: float     # N2 and AL N2 cutting time x hourly rate
+    operational: float  # sheets x operating cost + order costs
+
+    @property
+    def cutting(self) -> float:
+        return self.oxygen + self.nitrogen
+
+    @property
+    def total(self) -> float:
+        return self.material + self.cutting + self.operational
+
+
+def order_costs(hours_by_gas: Sequence[float], hourly_rates: Sequence[float], material: float,
+                total_sheets, op_cost_per_sheet, tech_per_order, add_costs_order) -> OrderCosts:
+    """OrderCosts from the cutting time of the order per gas bucket [h] and the
+    hourly rates [PLN/h], both (O2, N2, AL N2)."""
+    cutting = np.asarray(hours_by_gas, dtype=float) * np.asarray(hourly_rates, dtype=float)
+    return OrderCosts(
+        material=float(material),
+        oxygen=float(cutting[GAS_O]),
+        nitrogen=float(cutting[GAS_N] + cutting[GAS_AL_N]),
+        operational=float((total_sheets * op_cost_per_sheet) + tech_per_order + add_costs_order),
+    )
+
+
+DEFAULT_TKW_RATES = (262.50, 412.50, 487.50)  # O2, N2, AL N2 [PLN/h]
+DEFAULT_BENDING_PERCENT = 75.0
+
+
+@dataclass
+class CostBreakdown:
+    """Cost components of one piece of every part, shape (n,) each [PLN]."""
+    material_base: np.ndarray  # price-list material
+    material: np.ndarray       # with 7% and the material margin
+    cutting_base: np.ndarray   # price-list cutting
+    cutting: np.ndarray        # with the cutting margin
+    contours: np.ndarray
+    marking: np.ndarray
+    defilm: np.ndarray
+    extra: np.ndarray          # tech/order + additional order costs
+    operational: np.ndarray    # sheet operating cost
+    cutting_hours: np.ndarray
+    tkw_cutting: np.ndarray    # cutting time x own hourly rate
+    tkw_bending: np.ndarray    # own share of bending
+
+    @property
+    def unit(self) -> np.ndarray:
+        """Price of one piece before bending / additional costs, as unit_costs()."""
+        return (self.material + self.cutting + self.contours + self.marking + self.defilm
+                + self.extra + self.operational)
+
+    @property
+    def base_unit(self) -> np.ndarray:
+        """Price-list cost of one piece: no 7%, no margins, no overheads."""
+        return self.material_base + self.contours + self.cutting_base + self.marking + self.defilm
+
+    @property
+    def tkw(self) -> np.ndarray:
+        """Own cost of one piece, as tkw_unit_costs()."""
+        return self.material_base + self.tkw_cutting + self.operational + self.extra + self.tkw_bending
+
+
+def breakdown(parts: PartCostArrays, material_margin: float = 0.0, cutting_margin: float = 0.0,
+              extra_per_part: float = 0.0, op_cost_per_part: float = 0.0, bending=0.0,
+              hourly_rates: Sequence[float] = DEFAULT_TKW_RATES,
+              bending_percent: float = DEFAULT_BENDING_PERCENT) -> CostBreakdown:
+    """Every cost component of every part (margins [%], own hourly rates (O2, N2, AL N2))."""
+    n = len(parts)
+    contours, marking, defilm = process_costs(parts)
+    return CostBreakdown(
+        material_base=base_material_costs(parts),
+        material=material_costs(parts, material_margin),
+        cutting_base=base_cutting_costs(parts),
+        cutting=cutting_costs(parts, cutting_margin),
+        contours=contours,
+        marking=marking,
+        defilm=defilm,
+        extra=np.full(n, float(extra_per_part)),
+        operational=np.full(n, float(op_cost_per_part)),
+        cutting_hours=cutting_hours(parts),
+        tkw_cutting=tkw_cutting_costs(parts, hourly_rates),
+        tkw_bending=np.broadcast_to(tkw_bending_costs(bending, bending_percent), (n,)).copy(),
+    )
+
+
+@dataclass
+class SweepResult:
+    material_margins: np.ndarray  # (a,) %
+    cutting_margins: np.ndarray   # (b,) %
+    rate_factors: np.ndarray      # (c,) % of the own hourly rates
+    totals: np.ndarray            # (a, b) order total for the customer
+    tkw: np.ndarray               # (c,) own cost of the order
+
+    @property
+    def results(self) -> np.ndarray:
+        """(a, b, c) order total minus own cost."""
+        return self.totals[:, :, None] - self.tkw[None, None, :]
+
+
+def sweep(parts: PartCostArrays, qty, bending, additional,
+          material_margins, cutting_margins, rate_factors, hourly_rates: Sequence[float],
+          bending_percent: float, extra_per_part: float = 0.0, op_cost_per_part: float = 0.0) -> SweepResult:
+    """Order total and own cost for every margin pair and hourly-rate factor.
+
+    qty / bending / additional: per-piece values of every part as they stand
+    in the table; rate_factors scale all three own hourly rates together.
+    """
+    qty = np.asarray(qty, dtype=float)
+    per_piece = np.asarray(bending, dtype=float) + np.asarray(additional, dtype=float)
+    mat = np.asarray(material_margins, dtype=float).ravel()
+    cut = np.asarray(cutting_margins, dtype=float).ravel()
+    factors = np.asarray(rate_factors, dtype=float).ravel()
+    unit = unit_costs(parts, mat[:, None, None], cut[None, :, None], extra_per_part, op_cost_per_part)
+    totals = (unit + per_piece) @ qty
+    rates = factors[:, None] / 100.0 * np.asarray(hourly_rates, dtype=float)[None, :]
+    tkw = tkw_unit_costs(parts, np.asarray(bending, dtype=float), rates, bending_percent,
+                         extra_per_part, op_cost_per_part) @ qty
+    return SweepResult(mat, cut, factors, totals.reshape(len(mat), len(cut)), tkw.reshape(len(factors)))
+
+
+@dataclass
+class QuantityTiers:
+    tiers: np.ndarray        # (t,) pieces of every part
+    sheets: np.ndarray       # (t,) sheets of the whole order
+    unit_grosze: np.ndarray  # (t, n) price of one piece [gr]
+
+    @property
+    def unit_prices(self) -> np.ndarray:
+        """(t, n) price of one piece [PLN]."""
+        return money.to_pln(self.unit_grosze)
+
+    @property
+    def order_total_grosze(self) -> np.ndarray:
+        """(t,) order value at every tier [gr] (exact)."""
+        return (self.unit_grosze * self.tiers.astype(np.int64)[:, None]).sum(axis=1)
+
+    @property
+    def order_totals(self) -> np.ndarray:
+        """(t,) order value at every tier [PLN]."""
+        return money.to_pln(self.order_total_grosze)
+
+
+def quantity_tiers(unit_prices, part_file, file_sheets, file_parts_qty, tiers,
+                   op_cost_per_sheet, tech_per_order, add_costs_order) -> QuantityTiers:
+    """Unit prices of all parts when every part is ordered in each tier quantity.
+
+    unit_prices: current price of one piece (incl. bending and additional
+    costs and the order overheads of the current order); part_file: index of
+    the export file of every part; file_sheets / file_parts_qty: sheets and
+    pieces of every file as nested. A file needs its sheets in proportion to
+    the pieces (rounded up to whole sheets); the current overheads are taken
+    out of the prices and those of the tier put in.
+    """
+    unit = np.asarray(unit_prices, dtype=float)
+    part_file = np.asarray(part_file, dtype=int)
+    sheets = np.asarray(file_sheets, dtype=float)
+    nested = np.asarray(file_parts_qty, dtype=float)
+    tiers = np.asarray(tiers, dtype=float).ravel()
+    parts_per_file = np.bincount(part_file, minlength=len(sheets)).astype(float)
+
+    pieces = tiers[:, None] * parts_per_file[None, :]
+    tier_sheets = np.ceil(np.divide(sheets * pieces, nested, out=np.zeros_like(pieces), where=nested > 0))
+    tier_sheets = tier_sheets.sum(axis=1)
+    tier_pieces = tiers * len(unit)
+    fixed = tech_per_order + add_costs_order
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tier_overhead = np.where(tier_pieces > 0, (fixed + tier_sheets * op_cost_per_sheet) / tier_pieces, 0.0)
+    extra_now, op_now = overhead_per_part(sheets.sum(), nested.sum(), op_cost_per_sheet,
+                                          tech_per_order, add_costs_order)
+    prices = unit[None, :] + (tier_overhead - (extra_now + op_now))[:, None]
+    return QuantityTiers(tiers, tier_sheets, money.to_grosze(prices).reshape(prices.shape))
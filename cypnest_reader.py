@@ -0,0 +1,738 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cypnest_reader.py - Fast reader for CypNest nesting exports (.xlsx).
+
+wycena.py only needs three sheets of every export: "All Task List", "Cost List"
+and the column-B thumbnails of "All Parts List" (only their zip members are
+recorded; the pictures are read on demand, see thumbnails.py). Loading the file with
+openpyxl in full mode materialises every ResultN sheet and every embedded PNG,
+so this module opens the xlsx zip directly, streams only the required sheet
+XMLs (plus sharedStrings) with iterparse and returns a CypNestExport record.
+
+read_export_header() reads only the sheet names and the All Task List row 4
+(material, thickness, gas), for the pre-flight check before a batch is parsed.
+
+openpyxl is kept as a fallback for files the streaming reader cannot handle.
+"""
+from __future__ import annotations
+
+import os
+import posixpath
+import re
+import zipfile
+from dataclasses import dataclass, field
+from typing import ClassVar, Dict, List, Optional, Tuple
+from xml.etree.ElementTree import ParseError, fromstring, iterparse
+
+TASK_SHEET = "All Task List"
+COST_SHEET = "Cost List"
+PARTS_SHEET = "All Parts List"
+# one sheet per nest: Result1, Result2, ..., Result1(1)
+RESULT_SHEET_RE = re.compile(r"^Result\d+(\(\d+\))?$")
+
+# Bump whenever CypNestExport or the extraction logic changes: cached records
+# written by another version are ignored (see parse_cache.py)
+PARSER_VERSION = "4"
+
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_NS_XDR = "{http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing}"
+_NS_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+
+_ROW = _NS_MAIN + "row"
+_C = _NS_MAIN + "c"
+_V = _NS_MAIN + "v"
+_T = _NS_MAIN + "t"
+_R = _NS_MAIN + "r"
+_IS = _NS_MAIN + "is"
+_SI = _NS_MAIN + "si"
+
+
+# ---------- Data structures ----------
+class SheetGrid:
+    """Sparse, read-only cell grid of one worksheet.
+
+    Rows and columns are 1-based like in openpyxl; ``cell()`` returns None for
+    cells that are not present in the sheet.
+
+    Both readers store the cells row-major. Label lookups
+    (``find_containing``, ``first_number_row``) are answered from an index
+    built on first use in a single pass over the cells, instead of walking
+    the sheet once per query.
+    """
+
+    __slots__ = ("title", "cells", "max_row", "max_column", "_labels", "_first_number")
+
+    def __init__(self, title: str, cells: Dict[Tuple[int, int], object],
+                 max_row: Optional[int] = None, max_column: Optional[int] = None):
+        self.title = title
+        self.cells = cells
+        self.max_row = max_row if max_row is not None else max((r for r, _ in cells), default=0)
+        self.max_column = max_column if max_column is not None else max((c for _, c in cells), default=0)
+        self._labels: Optional[Dict[Tuple[str, int], int]] = None
+        self._first_number: Dict[int, int] = {}
+
+    def cell(self, row: int, col: int):
+        return self.cells.get((row, col))
+
+    def _index(self) -> Dict[Tuple[str, int], int]:
+        """{(text, col): first row} of the text cells, plus the first numeric row per column."""
+        if self._labels is None:
+            labels = {}
+            first_row = labels.setdefault
+            first_number = self._first_number
+            for pos, v in self.cells.items():
+                if v.__class__ is str:
+                    first_row((v, pos[1]), pos[0])
+                elif pos[1] not in first_number and _is_number(v):
+                    first_number[pos[1]] = pos[0]
+            self._labels = labels
+        return self._labels
+
+    def find_containing(self, fragment: str, col: Optional[int] = None,
+                        ignore_case: bool = False) -> Optional[Tuple[int, int]]:
+        """First (row, col), row-major, of a text cell containing ``fragment``."""
+        best = None
+        for (text, c), r in self._index().items():
+            if (col is None or c == col) and (best is None or (r, c) < best) \
+                    and fragment in (text.lower() if ignore_case else text):
+                best = (r, c)
+        return best
+
+    def first_number_row(self, col: int) -> Optional[int]:
+        """First row holding a number (not a bool) in column ``col``."""
+        self._index()
+        return self._first_number.get(col)
+
+
+@dataclass
+class TaskRow:
+    """One "Cut Plan" row (row 8 onwards) of the All Task List sheet (raw cell values)."""
+    row: int
+    plate_size: object
+    sheets_qty: object
+    cut_length: object  # column H, metres
+
+
+@dataclass
+class PartRow:
+    """One row of the Cost List "Part Summary" table."""
+    lp: int
+    name: object
+    qty: int
+    weight: float
+    contours_qty: float
+    cut_length: float
+    marking_length: float
+    defilm_length: float
+
+
+@dataclass
+class PlatePart:
+    """One "Part List" row of a Result sheet: a part nested on that plate."""
+    part_id: object         # CypNest part ID (column A)
+    name: object
+    size: Optional[Tuple[float, float]]  # part bounding box, mm
+    qty_on_plate: int       # "2 / 48" -> 2 per plate ...
+    qty_total: int          # ... of 48 ordered
+    cut_length: float       # m, per piece
+    marking_length: float
+    defilm_length: float
+
+
+@dataclass
+class PlateLayout:
+    """One nest (ResultN sheet): a plate format cut ``cut_number`` times."""
+    sheet: str
+    task_row: Optional[int] = None   # All Task List row listing this nest
+    material: object = None
+    thickness: Optional[float] = None
+    plate_size: Optional[Tuple[float, float]] = None   # mm
+    nested_size: Optional[Tuple[float, float]] = None  # used part of the plate, mm
+    cut_number: int = 0               # how many plates are cut with this layout
+    cut_time: object = None           # per plate, raw ("13min35s")
+    part_qty: int = 0                 # pieces on one plate
+    parts: List[PlatePart] = field(default_factory=list)
+
+
+@dataclass
+class CypNestExport:
+    """Everything wycena.py reads from a single CypNest export.
+
+    Values that could not be located in the workbook are left as None so the
+    caller decides how to report them.
+    """
+    FORMAT: ClassVar[str] = "cypnest"
+
+    path: str
+    file_name: str
+    sheet_names: List[str] = field(default_factory=list)
+    backend: str = "stream"
+    # All Task List header (row 4)
+    material: object = None         # B4
+    thickness: object = None        # C4
+    gas: object = None              # E4
+    cut_time: object = None         # F4
+    total_cut_length: Optional[float] = None  # column H of the first "Total" row
+    # All Task List cut plan (row 7 header, rows 8+)
+    plate_size_col: Optional[int] = None
+    sheets_qty_col: Optional[int] = None
+    task_rows: List[TaskRow] = field(default_factory=list)
+    sheets_in_file: int = 0
+    # Cost List
+    has_utilization: bool = False
+    utilization: object = None      # raw value of column K in the "Average utilization:" row
+    rate_per_contour: Optional[float] = None        # "Material Price" row, column G
+    rate_per_marking_length: Optional[float] = None  # column I
+    rate_per_defilm_length: Optional[float] = None   # column J
+    parts: Optional[List[PartRow]] = None           # None when no numeric ID row exists
+    # All Parts List thumbnails: sheet row -> zip member of the PNG (column B only)
+    thumbnail_members: Dict[int, str] = field(default_factory=dict)
+    # Result sheets, in All Task List order
+    layouts: List[PlateLayout] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+    @property
+    def has_task_sheet(self) -> bool:
+        return TASK_SHEET in self.sheet_names
+
+    @property
+    def has_cost_sheet(self) -> bool:
+        return COST_SHEET in self.sheet_names
+
+    @property
+    def has_parts_sheet(self) -> bool:
+        return PARTS_SHEET in self.sheet_names
+
+
+@dataclass
+class ExportHeader:
+    """Sheet names and the All Task List row 4 of an export (read_export_header)."""
+    path: str
+    file_name: str
+    sheet_names: List[str] = field(default_factory=list)
+    material: object = None         # B4
+    thickness: object = None        # C4
+    gas: object = None              # E4
+
+    @property
+    def has_task_sheet(self) -> bool:
+        return TASK_SHEET in self.sheet_names
+
+    @property
+    def has_cost_sheet(self) -> bool:
+        return COST_SHEET in self.sheet_names
+
+
+# ---------- Cell helpers ----------
+def _split_ref(ref: str) -> Tuple[int, int]:
+    """'AB12' -> (12, 28)."""
+    col = 0
+    i = 0
+    for i, ch in enumerate(ref):
+        if "A" <= ch <= "Z":
+            col = col * 26 + (ord(ch) - 64)
+        else:
+            return int(ref[i:]), col
+    raise ValueError(f"Invalid cell reference: {ref}")
+
+
+def parse_num(value, warnings: Optional[List[str]] = None) -> float:
+    """Parses '3.26 PLN/kg', '12,5' or a number to float (0.0 when impossible)."""
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    tokens = str(value).strip().split()
+    if not tokens:
+        return 0.0
+    s = "".join(ch for ch in tokens[0] if ch.isdigit() or ch in (".", ",")).replace(",", ".")
+    try:
+        return float(s or "0.0")
+    except Exception:
+        if warnings is not None:
+            warnings.append(f"Failed to parse number: {value}")
+        return 0.0
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def parse_size(value) -> Optional[Tuple[float, float]]:
+    """'1500.00 * 3000.00' -> (1500.0, 3000.0); None when not a size."""
+    if value is None:
+        return None
+    dims = str(value).replace("x", "*").replace("X", "*").split("*")
+    if len(dims) < 2:
+        return None
+    try:
+        return float(dims[0].strip().replace(",", ".")), float(dims[1].strip().replace(",", "."))
+    except ValueError:
+        return None
+
+
+def parse_plate_qty(value) -> Tuple[int, int]:
+    """'\u30002 / 48\u3000' -> (2, 48); a plain number is (n, n)."""
+    if _is_number(value):
+        return int(value), int(value)
+    parts = str(value or "").strip().split("/")
+    nums = []
+    for part in parts[:2]:
+        try:
+            nums.append(int(float(part.strip())))
+        except ValueError:
+            nums.append(0)
+    if len(nums) == 1:
+        nums.append(nums[0])
+    return nums[0], nums[1]
+
+
+# ---------- Zip / XML plumbing ----------
+def _rels_path(part: str) -> str:
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, "_rels", name + ".rels")
+
+
+def _read_rels(zf: zipfile.ZipFile, part: str) -> Dict[str, Tuple[str, str]]:
+    """Returns {rId: (type, absolute member name)} for the given package part."""
+    try:
+        data = zf.read(_rels_path(part))
+    except KeyError:
+        return {}
+    base = posixpath.dirname(part)
+    rels = {}
+    for rel in fromstring(data).iter(_NS_PKG + "Relationship"):
+        target = rel.get("Target", "")
+        if rel.get("TargetMode") == "External":
+            continue
+        if target.startswith("/"):
+            member = target.lstrip("/")
+        else:
+            member = posixpath.normpath(posixpath.join(base, target))
+        rels[rel.get("Id")] = (rel.get("Type", ""), member)
+    return rels
+
+
+def _workbook_part(zf: zipfile.ZipFile) -> str:
+    for rel_type, member in _read_rels(zf, "").values():
+        if rel_type.endswith("/officeDocument"):
+            return member
+    return "xl/workbook.xml"
+
+
+def workbook_sheets(zf: zipfile.ZipFile) -> Tuple[List[str], Dict[str, str], Optional[str]]:
+    """Returns (sheet names in order, {sheet name: member}, sharedStrings member)."""
+    wb_part = _workbook_part(zf)
+    rels = _read_rels(zf, wb_part)
+    names, members = [], {}
+    for sheet in fromstring(zf.read(wb_part)).iter(_NS_MAIN + "sheet"):
+        name = sheet.get("name")
+        names.append(name)
+        rel = rels.get(sheet.get(_NS_REL + "id"))
+        if rel:
+            members[name] = rel[1]
+    shared = next((m for t, m in rels.values() if t.endswith("/sharedStrings")), None)
+    return names, members, shared
+
+
+def _read_shared_strings(zf: zipfile.ZipFile, member: Optional[str], count: Optional[int] = None) -> List[str]:
+    """The shared strings (only the first ``count`` when given)."""
+    if not member:
+        return []
+    strings = []
+    with zf.open(member) as fh:
+        for _, elem in iterparse(fh, events=("end",)):
+            if count is not None and len(strings) >= count:
+                break
+            if elem.tag != _SI:
+                continue
+            # plain <t> or rich text runs <r><t>; phonetic <rPh> is skipped
+            parts = []
+            for child in elem:
+                if child.tag == _T:
+                    parts.append(child.text or "")
+                elif child.tag == _R:
+                    t = child.find(_T)
+                    if t is not None:
+                        parts.append(t.text or "")
+            strings.append("".join(parts))
+            elem.clear()
+    return strings
+
+
+def _cell_value(elem, shared: List[str]):
+    """Converts a <c> element the same way openpyxl does with data_only=True."""
+    t = elem.get("t", "n")
+    if t == "inlineStr":
+        node = elem.find(_IS)
+        return "".join(x.text or "" for x in node.iter(_T)) if node is not None else None
+    v = elem.find(_V)
+    if v is None or v.text is None:
+        return None
+    text = v.text
+    if t == "s":
+        return shared[int(text)]
+    if t in ("str", "e"):
+        return text
+    if t == "b":
+        return text == "1"
+    if "." in text or "E" in text or "e" in text:
+        return float(text)
+    return int(text)
+
+
+def _read_sheet(zf: zipfile.ZipFile, title: str, member: str, shared: List[str]) -> SheetGrid:
+    """Streams one worksheet XML into a SheetGrid."""
+    cells = {}
+    row_idx = 0
+    col_idx = 0
+    with zf.open(member) as fh:
+        for event, elem in iterparse(fh, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == _ROW:
+                    r = elem.get("r")
+                    row_idx = int(r) if r else row_idx + 1
+                    col_idx = 0
+                continue
+            if tag == _C:
+                ref = elem.get("r")
+                if ref:
+                    row_idx, col_idx = _split_ref(ref)
+                else:
+                    col_idx += 1
+                cells[(row_idx, col_idx)] = _cell_value(elem, shared)
+                elem.clear()
+            elif tag == _ROW:
+                elem.clear()
+    return SheetGrid(title, cells)
+
+
+def _read_top_rows(zf: zipfile.ZipFile, member: str, shared_member: Optional[str],
+                   last_row: int) -> Dict[Tuple[int, int], object]:
+    """Cells of rows 1..``last_row`` of one worksheet; parsing stops after that row.
+
+    Only the shared strings up to the highest index these cells use are read.
+    """
+    elems = {}
+    row_idx = 0
+    col_idx = 0
+    with zf.open(member) as fh:
+        for event, elem in iterparse(fh, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == _ROW:
+                    r = elem.get("r")
+                    row_idx = int(r) if r else row_idx + 1
+                    col_idx = 0
+                    if row_idx > last_row:
+                        break
+                continue
+            if tag == _C:
+                ref = elem.get("r")
+                if ref:
+                    row_idx, col_idx = _split_ref(ref)
+                else:
+                    col_idx += 1
+                elems[(row_idx, col_idx)] = elem
+    indices = [int(e.findtext(_V)) for e in elems.values() if e.get("t") == "s" and e.findtext(_V)]
+    shared = _read_shared_strings(zf, shared_member, count=max(indices) + 1) if indices else []
+    return {pos: _cell_value(elem, shared) for pos, elem in elems.items()}
+
+
+def read_worksheet(zf: zipfile.ZipFile, title: Optional[str] = None) -> Optional[SheetGrid]:
+    """Streams one worksheet (default: the first) of an open export into a SheetGrid."""
+    names, members, shared_member = workbook_sheets(zf)
+    title = names[0] if title is None and names else title
+    if title not in members:
+        return None
+    return _read_sheet(zf, title, members[title], _read_shared_strings(zf, shared_member))
+
+
+def _read_column_b_images(zf: zipfile.ZipFile, sheet_member: str) -> Dict[int, str]:
+    """Returns {sheet row (1-based): media member} for pictures anchored in column B.
+
+    Only the drawing XML is parsed; the pictures themselves stay in the zip.
+    """
+    images = {}
+    for rel_type, drawing in _read_rels(zf, sheet_member).values():
+        if not rel_type.endswith("/drawing"):
+            continue
+        media = _read_rels(zf, drawing)
+        root = fromstring(zf.read(drawing))
+        for anchor in root:
+            start = anchor.find(_NS_XDR + "from")
+            if start is None:
+                continue
+            col = int(start.findtext(_NS_XDR + "col", "0"))
+            row = int(start.findtext(_NS_XDR + "row", "0"))
+            if col != 1:  # Column B
+                continue
+            blip = anchor.find(f"{_NS_XDR}pic/{_NS_XDR}blipFill/{_NS_A}blip")
+            if blip is None:
+                continue
+            rel = media.get(blip.get(_NS_REL + "embed"))
+            if rel:
+                images[row + 1] = rel[1]
+    return images
+
+
+# ---------- Header layouts ----------
+def _header_columns(ws: SheetGrid, row: int, resolve) -> Dict[str, Optional[int]]:
+    """``resolve(header values)`` for header ``row`` (one row of the grid, trailing blanks dropped)."""
+    header = [ws.cell(row, col) for col in range(1, ws.max_column + 1)]
+    while header and header[-1] is None:
+        header.pop()
+    return resolve(header)
+
+
+def _task_header(header: list) -> Dict[str, Optional[int]]:
+    """All Task List row 7: last matching column wins."""
+    columns = {"plate": None, "sheets": None}
+    for col, header_val in enumerate(header, 1):
+        if header_val and "Plate Size" in str(header_val):
+            columns["plate"] = col
+        if header_val and ("Sheets" in str(header_val) or col == 4):
+            columns["sheets"] = col
+    return columns
+
+
+def _result_header(header: list) -> Dict[str, Optional[int]]:
+    """Result sheet Cut Plan header (row 3): first matching column wins."""
+    columns = {}
+    for col, value in enumerate(header, 1):
+        label = str(value or "")
+        if "Nested" in label:
+            columns.setdefault("nested", col)
+        elif "Plate Size" in label:
+            columns.setdefault("plate", col)
+        elif label.startswith("Material"):
+            columns.setdefault("material", col)
+        elif label.startswith("Thickness"):
+            columns.setdefault("thickness", col)
+        elif label.startswith("Cut number"):
+            columns.setdefault("cut_number", col)
+        elif label.startswith("Cut time"):
+            columns.setdefault("cut_time", col)
+        elif label.startswith("Part Qty"):
+            columns.setdefault("part_qty", col)
+    return columns
+
+
+# ---------- Record extraction (shared by both backends) ----------
+def _extract_task(rec: CypNestExport, ws: SheetGrid) -> None:
+    rec.material = ws.cell(4, 2)
+    rec.thickness = ws.cell(4, 3)
+    rec.gas = ws.cell(4, 5)
+    rec.cut_time = ws.cell(4, 6)
+
+    # first "Total" row in column A, value from column H
+    total = ws.find_containing("total", col=1, ignore_case=True)
+    if total is not None:
+        raw = ws.cell(total[0], 8)
+        if _is_number(raw):
+            rec.total_cut_length = float(raw)
+        else:
+            try:
+                rec.total_cut_length = float(str(raw).replace(" ", "").replace("\xa0", "").replace(",", "."))
+            except Exception:
+                rec.total_cut_length = 0.0
+
+    header = _header_columns(ws, 7, _task_header)
+    rec.plate_size_col = header["plate"]
+    rec.sheets_qty_col = header["sheets"]
+
+    plate_col = rec.plate_size_col or 3
+    sheets_col = rec.sheets_qty_col or 4
+    row_idx = 8
+    while ws.cell(row_idx, sheets_col) is not None:
+        rec.task_rows.append(TaskRow(row_idx, ws.cell(row_idx, plate_col),
+                                     ws.cell(row_idx, sheets_col), ws.cell(row_idx, 8)))
+        row_idx += 1
+
+    row_idx = 8
+    while ws.cell(row_idx, 4) is not None:
+        v = ws.cell(row_idx, 4)
+        if _is_number(v):
+            rec.sheets_in_file += int(v)
+        row_idx += 1
+
+
+def _extract_cost(rec: CypNestExport, ws: SheetGrid) -> None:
+    # "Average utilization:" anywhere in the sheet (row-major), value in column K
+    found = ws.find_containing("Average utilization:")
+    if found is not None:
+        rec.has_utilization = True
+        rec.utilization = ws.cell(found[0], 11)
+
+    found = ws.find_containing("Material Price", col=1)
+    if found is not None:
+        r = found[0]
+        rec.rate_per_contour = parse_num(ws.cell(r, 7), rec.warnings)
+        rec.rate_per_marking_length = parse_num(ws.cell(r, 9), rec.warnings)
+        rec.rate_per_defilm_length = parse_num(ws.cell(r, 10), rec.warnings)
+
+    start_row = ws.first_number_row(1)
+    if start_row is None:
+        return
+    parts = []
+    row = start_row
+    while row <= ws.max_row and _is_number(ws.cell(row, 1)):
+        qty = ws.cell(row, 5) or 0
+        parts.append(PartRow(
+            lp=len(parts) + 1,
+            name=ws.cell(row, 2),
+            qty=int(qty) if _is_number(qty) else 0,
+            weight=parse_num(ws.cell(row, 6), rec.warnings),
+            contours_qty=parse_num(ws.cell(row, 7), rec.warnings),
+            cut_length=parse_num(ws.cell(row, 8), rec.warnings),
+            marking_length=parse_num(ws.cell(row, 9), rec.warnings),
+            defilm_length=parse_num(ws.cell(row, 10), rec.warnings),
+        ))
+        row += 1
+    rec.parts = parts
+
+
+def _extract_layout(ws: SheetGrid) -> PlateLayout:
+    """Reads the Cut Plan header (rows 3-4) and the Part List of one Result sheet."""
+    layout = PlateLayout(sheet=ws.title)
+    header = _header_columns(ws, 3, _result_header)
+
+    def value(key, default_col):
+        return ws.cell(4, header.get(key, default_col))
+
+    layout.material = value("material", 1)
+    thickness = value("thickness", 2)
+    layout.thickness = parse_num(thickness) if thickness is not None else None
+    layout.plate_size = parse_size(value("plate", 3))
+    layout.nested_size = parse_size(value("nested", 5))
+    layout.cut_number = int(parse_num(value("cut_number", 7)))
+    layout.cut_time = value("cut_time", 8)
+    layout.part_qty = int(parse_num(value("part_qty", 9)))
+
+    # Part List: header row with "ID" in column A below the Cut Plan, rows until column A is empty
+    start = None
+    for r in range(5, ws.max_row + 1):
+        if str(ws.cell(r, 1) or "").strip() == "ID":
+            start = r + 1
+            break
+    if start is None:
+        return layout
+    for r in range(start, ws.max_row + 1):
+        part_id = ws.cell(r, 1)
+        if part_id in (None, ""):
+            break
+        on_plate, total = parse_plate_qty(ws.cell(r, 5))
+        layout.parts.append(PlatePart(
+            part_id=part_id,
+            name=ws.cell(r, 3),
+            size=parse_size(ws.cell(r, 4)),
+            qty_on_plate=on_plate,
+            qty_total=total,
+            cut_length=parse_num(ws.cell(r, 6)),
+            marking_length=parse_num(ws.cell(r, 7)),
+            defilm_length=parse_num(ws.cell(r, 8)),
+        ))
+    return layout
+
+
+def _order_layouts(layouts: List[PlateLayout], task: Optional[SheetGrid]) -> List[PlateLayout]:
+    """Links every layout to its All Task List row ("<task>-Result1" in column B) and sorts by it."""
+    if task is not None:
+        by_sheet = {layout.sheet: layout for layout in layouts}
+        for r in range(8, task.max_row + 1):
+            nest = str(task.cell(r, 2) or "")
+            sheet = nest.rsplit("-", 1)[-1]
+            if sheet in by_sheet and by_sheet[sheet].task_row is None:
+                by_sheet[sheet].task_row = r
+    order = {id(layout): i for i, layout in enumerate(layouts)}
+    return sorted(layouts, key=lambda l: (l.task_row is None, l.task_row or 0, order[id(l)]))
+
+
+def _build_record(rec: CypNestExport, task: Optional[SheetGrid], cost: Optional[SheetGrid],
+                  results: Optional[List[SheetGrid]] = None) -> CypNestExport:
+    if task is not None:
+        _extract_task(rec, task)
+    if cost is not None:
+        _extract_cost(rec, cost)
+    if results:
+        rec.layouts = _order_layouts([_extract_layout(ws) for ws in results], task)
+    return rec
+
+
+# ---------- Backends ----------
+def _read_streaming(path: str) -> CypNestExport:
+    with zipfile.ZipFile(path) as zf:
+        names, members, shared_member = workbook_sheets(zf)
+        rec = CypNestExport(path=path, file_name=os.path.basename(path), sheet_names=names)
+        result_sheets = [n for n in names if RESULT_SHEET_RE.match(n or "") and n in members]
+        needed = [n for n in (TASK_SHEET, COST_SHEET) if n in members] + result_sheets
+        shared = _read_shared_strings(zf, shared_member) if needed else []
+        grids = {n: _read_sheet(zf, n, members[n], shared) for n in needed}
+        if PARTS_SHEET in members:
+            rec.thumbnail_members = _read_column_b_images(zf, members[PARTS_SHEET])
+    return _build_record(rec, grids.get(TASK_SHEET), grids.get(COST_SHEET),
+                         [grids[n] for n in result_sheets])
+
+
+def _grid_from_openpyxl(ws) -> SheetGrid:
+    cells = {(c.row, c.column): c.value for row in ws.iter_rows() for c in row}
+    return SheetGrid(ws.title, cells, ws.max_row, ws.max_column)
+
+
+def _read_openpyxl(path: str) -> CypNestExport:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, data_only=True)
+    rec = CypNestExport(path=path, file_name=os.path.basename(path),
+                        sheet_names=list(wb.sheetnames), backend="openpyxl")
+    task = _grid_from_openpyxl(wb[TASK_SHEET]) if TASK_SHEET in wb.sheetnames else None
+    cost = _grid_from_openpyxl(wb[COST_SHEET]) if COST_SHEET in wb.sheetnames else None
+    if PARTS_SHEET in wb.sheetnames:
+        # openpyxl does not keep the media member names, so they are taken
+        # from the package itself
+        try:
+            with zipfile.ZipFile(path) as zf:
+                _, members, _ = workbook_sheets(zf)
+                rec.thumbnail_members = _read_column_b_images(zf, members[PARTS_SHEET])
+        except (KeyError, ValueError, ParseError, zipfile.BadZipFile) as e:
+            rec.warnings.append(f"Thumbnails not readable ({e})")
+    results = [_grid_from_openpyxl(wb[n]) for n in wb.sheetnames if RESULT_SHEET_RE.match(n)]
+    return _build_record(rec, task, cost, results)
+
+
+def read_export_header(path: str) -> ExportHeader:
+    """Sheet names and All Task List B4 / C4 / E4 of an export, for pre-flight checks.
+
+    Only workbook.xml, the first four rows of All Task List and the shared
+    strings they use are read - no other sheet is parsed.
+    """
+    with zipfile.ZipFile(path) as zf:
+        names, members, shared_member = workbook_sheets(zf)
+        header = ExportHeader(path=path, file_name=os.path.basename(path), sheet_names=names)
+        if TASK_SHEET in members:
+            cells = _read_top_rows(zf, members[TASK_SHEET], shared_member, 4)
+            header.material = cells.get((4, 2))
+            header.thickness = cells.get((4, 3))
+            header.gas = cells.get((4, 5))
+    return header
+
+
+def read_cypnest_export(path: str, streaming: bool = True) -> CypNestExport:
+    """Reads one CypNest export.
+
+    The streaming zip/XML reader is used by default; when it fails (unusual
+    package layout, broken XML) the file is re-read with openpyxl and the reason
+    is recorded in ``warnings``.
+    """
+    if streaming:
+        try:
+            return _read_streaming(path)
+        except (KeyError, ValueError, IndexError, ParseError) as e:
+            rec = _read_openpyxl(path)
+            rec.warnings.insert(0, f"Streaming reader failed ({e}), used openpyxl")
+            return rec
+    return _read_openpyxl(path)
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+folder_watcher.py - Watches an order folder for new or changed CypNest exports.
+
+FolderWatcher reports an export only once it is complete: after the last
+change it must keep the same size and mtime for ``settle`` seconds and be
+a readable zip (the central directory is written last, so a half-copied
+xlsx fails that check). On Linux the folder is watched with inotify
+through ctypes; elsewhere, or if inotify is unavailable, it is polled.
+
+AutoIngest puts a background parser behind the watcher: every reported
+export is parsed on a worker thread, and the records are queued for the
+GUI to pick up (e.g. from ``root.after()``). FileReloader does the same for
+a few named files (the price lists) with a loader of the caller's choice.
+"""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+import zipfile
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from importers import read_export
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+               | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """(size, mtime_ns) of a file, None when it does not exist."""
+    try:
+        st = os.stat(path)
+        return (st.st_size, st.st_mtime_ns)
+    except OSError:
+        return None
+
+
+class _Inotify:
+    """Minimal inotify binding (Linux, via ctypes)."""
+
+    def __init__(self, folder: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed for {folder}")
+
+    def read(self, timeout: float):
+        """Yields (mask, name) of pending events, waiting at most ``timeout`` seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].split(b"\0", 1)[0]
+            offset += length
+            yield mask, os.fsdecode(name)
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class FolderWatcher:
+    """Watches ``folder`` (not recursive) for .xlsx files.
+
+    Stable changes are put on ``events`` as ("changed", path) or
+    ("removed", path). Files present when the watcher starts are not
+    reported.
+    """
+
+    def __init__(self, folder: str, settle: float = 1.0, poll_interval: float = 1.0,
+                 max_wait: float = 60.0, use_inotify: bool = True):
+        self.folder = os.path.abspath(folder)
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.use_inotify = use_inotify and sys.platform.startswith("linux")
+        self.backend = None
+        self.events: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+        self._known: Dict[str, Tuple[int, int]] = {}
+        self._pending: Dict[str, list] = {}  # path -> [first seen, last change, last signature]
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def is_export_name(name: str) -> bool:
+        # "~$name.xlsx" are Excel lock files, dot files are temporary copies
+        return name.lower().endswith(".xlsx") and not name.startswith(("~$", "."))
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        try:
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    if entry.is_file() and self.is_export_name(entry.name):
+                        st = entry.stat()
+                        snapshot[entry.path] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            pass
+        return snapshot
+
+    # ---------- Control ----------
+    def start(self) -> "FolderWatcher":
+        self._known = self._scan()
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = _Inotify(self.folder)
+            except (OSError, AttributeError):
+                inotify = None  # no inotify in libc, watch limit reached, ...
+        self.backend = "inotify" if inotify else "polling"
+        self._thread = threading.Thread(target=self._run, args=(inotify,), name="FolderWatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    # ---------- Worker ----------
+    def _touch(self, path: str) -> None:
+        now = time.monotonic()
+        entry = self._pending.get(path)
+        if entry is None:
+            self._pending[path] = [now, now, None]
+        else:
+            entry[1] = now
+
+    def _rescan(self, since: Dict[str, Tuple[int, int]]) -> Dict[str, Tuple[int, int]]:
+        """Marks files that differ from the ``since`` snapshot as pending; returns the new snapshot."""
+        snapshot = self._scan()
+        for path in set(snapshot) | set(since):
+            if snapshot.get(path) != since.get(path):
+                self._touch(path)
+        return snapshot
+
+    def _run(self, inotify: Optional[_Inotify]) -> None:
+        last_scan = dict(self._known)
+        try:
+            while not self._stop.is_set():
+                if inotify is not None:
+                    for mask, name in inotify.read(min(self.poll_interval, self.settle / 2 or 0.1)):
+                        if mask & (IN_Q_OVERFLOW | IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                            self._rescan(self._known)  # events were lost
+                        elif self.is_export_name(name):
+                            self._touch(os.path.join(self.folder, name))
+                else:
+                    last_scan = self._rescan(last_scan)
+                    self._stop.wait(self.poll_interval)
+                self._flush()
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _flush(self) -> None:
+        """Reports pending files that have settled."""
+        now = time.monotonic()
+        for path, entry in list(self._pending.items()):
+            first_seen, last_change, last_sig = entry
+            if now - last_change < self.settle:
+                continue
+            sig = file_signature(path)
+            if sig is None:
+                del self._pending[path]
+                if self._known.pop(path, None) is not None:
+                    self.events.put(("removed", path))
+                continue
+            if sig != last_sig:
+                # still being written - wait another settle period
+                entry[1], entry[2] = now, sig
+                continue
+            if not zipfile.is_zipfile(path) and now - first_seen < self.max_wait:
+                entry[1] = now
+                continue
+            del self._pending[path]
+            if self._known.get(path) != sig:
+                self._known[path] = sig
+                self.events.put(("changed", path))
+
+
+class AutoIngest:
+    """FolderWatcher plus a background parser thread.
+
+    ``results`` receives (kind, path, signature, record, error): for
+    "changed" the record parsed by importers.read_export() (or the
+    exception raised while reading) and the (size, mtime_ns) the file had
+    before it was read; for "removed" only kind and path are set.
+    """
+
+    def __init__(self, folder: str, **watcher_options):
+        self.watcher = FolderWatcher(folder, **watcher_options)
+        self.results: "queue.Queue[tuple]" = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def folder(self) -> str:
+        return self.watcher.folder
+
+    @property
+    def backend(self) -> Optional[str]:
+        return self.watcher.backend
+
+    def start(self) -> "AutoIngest":
+        self.watcher.start()
+        self._thread = threading.Thread(target=self._run, name="AutoIngestParser", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.watcher.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                kind, path = self.watcher.events.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if kind == "removed":
+                self.results.put((kind, path, None, None, None))
+                continue
+            signature = file_signature(path)
+            try:
+                self.results.put((kind, path, signature, read_export(path), None))
+            except Exception as e:
+                self.results.put((kind, path, signature, None, e))
+
+
+class FileReloader:
+    """Re-loads a few named files on a background thread when they change.
+
+    ``files`` maps a key to the path of an .xlsx file; for every settled
+    change of a path ``load(key)`` is called on the reloader thread.
+    ``results`` receives (key, path, signature, value, error) as
+    AutoIngest.results does; a removed file is reported with a
+    FileNotFoundError.
+    """
+
+    def __init__(self, files: Dict[str, str], load: Callable[[str], Any], **watcher_options):
+        self.files = {key: os.path.abspath(path) for key, path in files.items()}
+        self.load = load
+        self.results: "queue.Queue[tuple]" = queue.Queue()
+        self._keys = {os.path.normcase(path): key for key, path in self.files.items()}
+        self._events: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+        self.watchers: List[FolderWatcher] = []
+        for folder in sorted({os.path.dirname(path) for path in self.files.values()}):
+            watcher = FolderWatcher(folder, **watcher_options)
+            watcher.events = self._events  # one queue for all folders
+            self.watchers.append(watcher)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def backend(self) -> Optional[str]:
+        return ", ".join(sorted({w.backend for w in self.watchers if w.backend})) or None
+
+    def start(self) -> "FileReloader":
+        for watcher in self.watchers:
+            watcher.start()
+        self._thread = threading.Thread(target=self._run, name="FileReloader", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        for watcher in self.watchers:
+            watcher.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                kind, path = self._events.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            key = self._keys.get(os.path.normcase(path))
+            if key is None:
+                continue  # another workbook in the same folder
+            if kind == "removed":
+                self.results.put((key, path, None, None, FileNotFoundError(f"File not found: {path}")))
+                continue
+            signature = file_signature(path)
+            try:
+                self.results.put((key, path, signature, self.load(key), None))
+            except Exception as e:
+                self.results.put((key, path, signature, None, e))
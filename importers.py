@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+importers.py - Registry of export formats and batch ingestion.
+
+Every supported format registers an Importer: a sniffer that recognises the
+format from the zip member list and the sheet names in workbook.xml alone
+(no worksheet is read), and a parser that returns the format's record.
+read_export() sniffs a file and runs the matching parser, and
+read_exports() does that for a whole folder, so classifying a mixed folder
+costs one small XML read per file and a new nesting / CAM export format is
+added with register_importer() without touching the ingestion loop.
+
+Importers are tried in descending ``priority``; the first whose sniffer
+accepts the file wins. Register them at import time of a module: with
+parallel ingestion the files are parsed in worker processes, which only see
+importers registered on import.
+"""
+from __future__ import annotations
+
+import importlib.util
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from xml.etree.ElementTree import ParseError
+
+from cypnest_reader import COST_SHEET, PARSER_VERSION, PARTS_SHEET, TASK_SHEET, read_cypnest_export, workbook_sheets
+from item_list_reader import ITEM_LIST_VERSION, read_item_list
+
+# Below this many files a process pool costs more to start than it saves
+PARALLEL_MIN_FILES = 3
+
+
+@dataclass(frozen=True)
+class Importer:
+    name: str
+    description: str
+    # sniff(zip member names, sheet names) -> True when the file is in this format
+    sniff: Callable[[List[str], List[str]], bool]
+    # parse(path) -> record; raises when the file cannot be read
+    parse: Callable[[str], object]
+    priority: int = 0
+    # bump when the parser's record changes; cached records of other versions
+    # are ignored (see parse_cache.py). ``name`` must equal the record's FORMAT.
+    version: str = "1"
+
+
+class UnknownFormatError(ValueError):
+    """No registered importer recognises the file."""
+
+
+_IMPORTERS: List[Importer] = []
+
+
+def register_importer(importer: Importer) -> Importer:
+    """Adds ``importer`` (replacing one with the same name)."""
+    _IMPORTERS[:] = [i for i in _IMPORTERS if i.name != importer.name] + [importer]
+    _IMPORTERS.sort(key=lambda i: -i.priority)
+    return importer
+
+
+def registered_importers() -> List[Importer]:
+    return list(_IMPORTERS)
+
+
+def importer_versions() -> Dict[str, str]:
+    """{importer name: parser version} of the registered importers."""
+    return {i.name: i.version for i in _IMPORTERS}
+
+
+def sniff(path: str) -> Optional[Importer]:
+    """The importer for ``path``, from its zip directory and workbook.xml only."""
+    try:
+        with zipfile.ZipFile(path) as zf:
+            members = zf.namelist()
+            sheet_names = workbook_sheets(zf)[0]
+    except (OSError, KeyError, ParseError, zipfile.BadZipFile):
+        return None
+    for importer in _IMPORTERS:
+        if importer.sniff(members, sheet_names):
+            return importer
+    return None
+
+
+def classify(paths) -> Dict[str, Optional[str]]:
+    """{path: importer name or None} for every file, without parsing any of them."""
+    result = {}
+    for path in paths:
+        importer = sniff(path)
+        result[path] = importer.name if importer is not None else None
+    return result
+
+
+def read_export(path: str):
+    """Reads one file with the importer its sniffer picks."""
+    importer = sniff(path)
+    if importer is None:
+        raise UnknownFormatError("not a supported export format")
+    return importer.parse(path)
+
+
+# ---------- Built-in formats ----------
+def _is_cypnest(members: List[str], sheet_names: List[str]) -> bool:
+    return any(name in sheet_names for name in (TASK_SHEET, COST_SHEET, PARTS_SHEET))
+
+
+def _is_item_list(members: List[str], sheet_names: List[str]) -> bool:
+    # no sheet names to go by: any other workbook may be a list, the parser
+    # rejects the ones without an Lp / Symbol / Nazwa / Ilość header
+    return bool(sheet_names)
+
+
+register_importer(Importer("cypnest", "CypNest nesting export", _is_cypnest, read_cypnest_export, priority=100,
+                           version=PARSER_VERSION))
+register_importer(Importer("item_list", "Item list (Lp, Symbol, Nazwa, Ilość)", _is_item_list, read_item_list,
+                           version=ITEM_LIST_VERSION))
+
+
+# ---------- Batch ingestion ----------
+def _read_safe(path: str):
+    """Pool worker: returns (record, None) or (None, exception) - never raises."""
+    try:
+        return read_export(path), None
+    except Exception as e:
+        return None, e
+
+
+@contextmanager
+def _spawn_safe_main():
+    """Keeps spawned workers from re-running the GUI script.
+
+    With the "spawn" start method (Windows) every worker re-executes the
+    __main__ script before it can unpickle a task; for wycena.py that would
+    build the whole Tk window in each worker. While the pool starts its
+    processes, __main__ is presented as this module so workers import only
+    the readers.
+    """
+    main = sys.modules.get("__main__")
+    if main is None or getattr(main, "__spec__", None) is not None or not getattr(main, "__file__", None):
+        yield
+        return
+    main.__spec__ = importlib.util.find_spec(__name__)
+    try:
+        yield
+    finally:
+        main.__spec__ = None
+
+
+def read_exports(paths, parallel: bool = False, max_workers: Optional[int] = None, cache=None,
+                 prefetched: Optional[Dict[str, object]] = None):
+    """Reads several exports and yields (path, record, error) in the order of ``paths``.
+
+    Every file is sniffed and parsed by its registered importer (read_export).
+    With ``parallel=True`` the files are parsed in a ProcessPoolExecutor, but
+    results are still yielded in input order, so whatever the caller numbers
+    or accumulates while merging comes out identical to a sequential run.
+    ``error`` is the exception raised while reading (record is then None).
+
+    ``cache`` is an optional parse_cache.ParseCache: hits are returned without
+    parsing and freshly parsed records are stored in it. It is only used from
+    this (the calling) process; call ``cache.save()`` afterwards.
+
+    ``prefetched`` maps paths to records parsed elsewhere (e.g. by the folder
+    watcher); they are returned as is and stored in the cache.
+    """
+    paths = list(paths)
+    cached = {}
+    for path, record in (prefetched or {}).items():
+        if path in paths:
+            cached[path] = record
+            if cache is not None:
+                cache.store(path, record)
+    if cache is not None:
+        for path in paths:
+            if path in cached:
+                continue
+            record = cache.lookup(path)
+            if record is not None:
+                cached[path] = record
+    to_parse = [p for p in paths if p not in cached]
+
+    def _finish(path, record, error):
+        if cache is not None and record is not None:
+            cache.store(path, record)
+        return path, record, error
+
+    if not parallel or len(to_parse) < PARALLEL_MIN_FILES:
+        for path in paths:
+            if path in cached:
+                yield path, cached[path], None
+            else:
+                yield _finish(path, *_read_safe(path))
+        return
+
+    workers = max_workers or min(len(to_parse), os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        with _spawn_safe_main():
+            futures = {path: pool.submit(_read_safe, path) for path in to_parse}
+        for path in paths:
+            if path in cached:
+                yield path, cached[path], None
+                continue
+            try:
+                yield _finish(path, *futures[path].result())
+            except Exception as e:  # worker died (BrokenProcessPool)
+                yield path, None, e
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+item_list_reader.py - Reader for plain item lists (Lp, Symbol, Nazwa, Ilość).
+
+Customer and ERP item lists put these four columns under a header row
+somewhere in the first rows of the first worksheet. The sheet is streamed
+with cypnest_reader.read_worksheet(); the header row is found in one pass
+over the streamed cells instead of probing a fixed block cell by cell, and
+rows are read until one has all four columns empty.
+"""
+from __future__ import annotations
+
+import os
+import zipfile
+from dataclasses import dataclass, field
+from typing import ClassVar, List, Optional
+
+from cypnest_reader import SheetGrid, read_worksheet
+
+# header label (lower case, spaces and dots removed) -> field
+HEADER_LABELS = {"lp": "lp", "symbol": "symbol", "nazwa": "name", "ilość": "qty", "ilosc": "qty"}
+HEADER_MAX_ROW = 20
+
+# Bump whenever ItemListExport or the extraction logic changes: cached records
+# written by another version are ignored (see parse_cache.py)
+ITEM_LIST_VERSION = "1"
+
+
+@dataclass
+class ItemRow:
+    lp: int
+    symbol: str
+    name: str
+    qty: int
+    unit: str = "szt."
+
+
+@dataclass
+class ItemListExport:
+    FORMAT: ClassVar[str] = "item_list"
+
+    path: str
+    file_name: str
+    sheet_names: List[str] = field(default_factory=list)
+    backend: str = "stream"
+    header_row: Optional[int] = None
+    items: List[ItemRow] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+
+def _label(value) -> str:
+    return str(value).strip().lower().replace(" ", "").replace(".", "") if value is not None else ""
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def find_header(ws: SheetGrid):
+    """(header row, {field: column}) of the first row holding all four labels, or (None, {})."""
+    rows = {}
+    for (row, col), value in ws.cells.items():
+        key = HEADER_LABELS.get(_label(value)) if isinstance(value, str) else None
+        if key and row <= HEADER_MAX_ROW:
+            rows.setdefault(row, {}).setdefault(key, col)
+    for row in sorted(rows):
+        if len(rows[row]) == 4:
+            return row, rows[row]
+    return None, {}
+
+
+def read_item_list(path: str) -> ItemListExport:
+    """Reads the items of one list; raises ValueError when there is no header row."""
+    with zipfile.ZipFile(path) as zf:
+        ws = read_worksheet(zf)
+        rec = ItemListExport(path=path, file_name=os.path.basename(path),
+                             sheet_names=[ws.title] if ws is not None else [])
+    header_row, cols = find_header(ws) if ws is not None else (None, {})
+    if header_row is None:
+        raise ValueError("no header row with columns Lp, Symbol, Nazwa, Ilość")
+    rec.header_row = header_row
+    row = header_row + 1
+    while True:
+        lp_val, sym_val, name_val, qty_val = (_text(ws.cell(row, cols[k])) for k in ("lp", "symbol", "name", "qty"))
+        row += 1
+        if not (lp_val or sym_val or name_val or qty_val):
+            break
+        if not sym_val:
+            continue
+        try:
+            lp = int(lp_val) if lp_val else len(rec.items) + 1
+        except ValueError:
+            lp = len(rec.items) + 1
+        try:
+            qty = int(float(qty_val.replace(",", "."))) if qty_val else 0
+        except ValueError:
+            rec.warnings.append(f"row {row - 1}: quantity '{qty_val}' is not a number")
+            qty = 0
+        rec.items.append(ItemRow(lp=lp, symbol=sym_val, name=name_val or "", qty=qty))
+    return rec
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+margin_policy.py - Suggested-margin curves, built once from the settings.
+
+The margin suggestion maps every Task List row to a material margin (from
+the plate area, m²) and a cutting margin (from the row's cut length, mm).
+A MarginCurve is either piecewise linear through its points - constant
+before the first and after the last - or a step function that holds each
+point's margin from its x up to the next point. The default curves are the
+two ramps of the margin panel: 250% -> 0% over [min area, max area] and
+200% -> 0% over [min length, max length].
+
+MarginPolicy evaluates whole arrays of rows with NumPy and round-trips
+through to_dict()/from_dict() (project files). Curves can also be written
+as text, e.g. "0:250; 0.5:100; 1:0" or "step 0:150; 2000:50; 5000:0".
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Sequence, Tuple
+
+import numpy as np
+
+CURVE_KINDS = ("linear", "step")
+DEFAULT_AREA_MARGIN = 250.0     # % at (and below) the minimum plate area
+DEFAULT_CUTTING_MARGIN = 200.0  # % at (and below) the minimum cut length
+
+
+@dataclass(frozen=True)
+class MarginCurve:
+    xs: Tuple[float, ...]
+    ys: Tuple[float, ...]
+    kind: str = "linear"
+
+    def __post_init__(self):
+        if self.kind not in CURVE_KINDS:
+            raise ValueError(f"unknown curve kind '{self.kind}'")
+        if not self.xs or len(self.xs) != len(self.ys):
+            raise ValueError("a margin curve needs the same number (>= 1) of x and margin values")
+        if any(b <= a for a, b in zip(self.xs, self.xs[1:])):
+            raise ValueError("margin curve x values must be increasing")
+
+    @classmethod
+    def ramp(cls, x0: float, x1: float, y0: float, y1: float = 0.0) -> "MarginCurve":
+        """y0 up to x0, linear to y1 at x1, y1 beyond (a step at x0 when x1 <= x0)."""
+        if x1 > x0:
+            return cls((float(x0), float(x1)), (float(y0), float(y1)))
+        return cls((float(x0), float(np.nextafter(x0, np.inf))), (float(y0), float(y1)), "step")
+
+    @classmethod
+    def parse(cls, text: str) -> "MarginCurve":
+        """Curve from "x:margin; x:margin; ..." (optionally prefixed with "step")."""
+        body = text.strip()
+        kind = "linear"
+        for k in CURVE_KINDS:
+            if body.lower().startswith(k):
+                kind, body = k, body[len(k):]
+                break
+        points = []
+        for item in body.replace("\n", ";").split(";"):
+            if not item.strip():
+                continue
+            x, sep, y = item.partition(":")
+            if not sep:
+                raise ValueError(f"'{item.strip()}' is not x:margin")
+            points.append((float(x.strip().replace(",", ".")), float(y.strip().replace(",", "."))))
+        points.sort()
+        return cls(tuple(p[0] for p in points), tuple(p[1] for p in points), kind)
+
+    def __str__(self):
+        points = "; ".join(f"{x:g}:{y:g}" for x, y in zip(self.xs, self.ys))
+        return points if self.kind == "linear" else f"step {points}"
+
+    def evaluate(self, x) -> np.ndarray:
+        """Margins [%] for an array (or scalar) of x values."""
+        x = np.asarray(x, dtype=float)
+        xs = np.asarray(self.xs)
+        ys = np.asarray(self.ys)
+        if len(xs) == 1:
+            return np.full(x.shape, ys[0])
+        i = np.clip(np.searchsorted(xs, x, side="right") - 1, 0, len(xs) - 1)
+        if self.kind == "step":
+            return ys[i]
+        i = np.minimum(i, len(xs) - 2)
+        t = (x - xs[i]) / (xs[i + 1] - xs[i])
+        inner = ys[i] * (1.0 - t) + ys[i + 1] * t
+        return np.where(x <= xs[0], ys[0], np.where(x >= xs[-1], ys[-1], inner))
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "points": [[x, y] for x, y in zip(self.xs, self.ys)]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MarginCurve":
+        points = data["points"]
+        return cls(tuple(float(p[0]) for p in points), tuple(float(p[1]) for p in points), data.get("kind", "linear"))
+
+
+@dataclass(frozen=True)
+class MarginPolicy:
+    area: MarginCurve        # plate area [m²] -> material margin [%]
+    cut_length: MarginCurve  # cut length of a row [mm] -> cutting margin [%]
+
+    @classmethod
+    def ramps(cls, min_area=0.0, max_area=1.0, min_length=0.0, max_length=5000.0) -> "MarginPolicy":
+        """The margin panel's linear ramps (250% / 200% down to 0%)."""
+        return cls(MarginCurve.ramp(min_area, max_area, DEFAULT_AREA_MARGIN),
+                   MarginCurve.ramp(min_length, max_length, DEFAULT_CUTTING_MARGIN))
+
+    def material_margins(self, areas_m2) -> np.ndarray:
+        return self.area.evaluate(areas_m2)
+
+    def cutting_margins(self, lengths_mm) -> np.ndarray:
+        return self.cut_length.evaluate(lengths_mm)
+
+    def suggest(self, areas_m2: Sequence[float], sheets: Sequence[float], lengths_mm: Sequence[float]):
+        """(material margins, cutting margins, sheet-weighted material average,
+        length-weighted cutting average) of a set of Task List rows."""
+        areas = np.asarray(areas_m2, dtype=float)
+        weights = np.asarray(sheets, dtype=float)
+        lengths = np.asarray(lengths_mm, dtype=float)
+        material = self.material_margins(areas)
+        cutting = self.cutting_margins(lengths)
+        avg_material = float(material @ weights / weights.sum()) if weights.sum() > 0 else 0.0
+        avg_cutting = float(cutting @ lengths / lengths.sum()) if lengths.sum() > 0 else 0.0
+        return material, cutting, avg_material, avg_cutting
+
+    def to_dict(self) -> dict:
+        return {"area": self.area.to_dict(), "cut_length": self.cut_length.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MarginPolicy":
+        return cls(MarginCurve.from_dict(data["area"]), MarginCurve.from_dict(data["cut_length"]))
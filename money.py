@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+money.py - Exact money amounts as int64 grosze.
+
+Prices are computed in floats (costing.py) and rounded to whole grosze
+exactly once, with an explicit rounding mode; from there on everything -
+order totals, the Treeview, the DOCX offer, the client XLSX - adds and
+multiplies integers, so every output shows the same total.
+
+    HALF_UP    half away from zero (the commercial rule; the default)
+    HALF_EVEN  half to the even grosz
+    DOWN       towards minus infinity
+    UP         towards plus infinity
+
+A float PLN amount times 100 is off by a few ulps (0.29 x 100 =
+28.999999999999996), so values within 1e-6 gr of a whole or a half grosz are
+taken as exactly on it.
+
+PriceTable holds the quantity and the L+M unit, bending and additional
+prices of every part of an order as int64 columns; line and order totals are
+exact integer sums. format_grosze() / parse_grosze() convert to and from the
+Polish "1 234,56" notation without going through floats.
+"""
+from __future__ import annotations
+
+from decimal import ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+GROSZE = 100
+
+HALF_UP = "half_up"
+HALF_EVEN = "half_even"
+DOWN = "down"
+UP = "up"
+ROUNDING_MODES = (HALF_UP, HALF_EVEN, DOWN, UP)
+_DECIMAL_ROUNDING = {HALF_UP: ROUND_HALF_UP, HALF_EVEN: ROUND_HALF_EVEN, DOWN: ROUND_FLOOR, UP: ROUND_CEILING}
+
+_EPS = 1e-6  # grosz
+
+
+def to_grosze(pln, rounding: str = HALF_UP) -> np.ndarray:
+    """PLN (scalar or array) -> int64 grosze."""
+    v = np.asarray(pln, dtype=float) * GROSZE
+    if rounding == HALF_UP:
+        r = np.sign(v) * np.floor(np.abs(v) + 0.5 + _EPS)
+    elif rounding == HALF_EVEN:
+        low = np.floor(v + _EPS)
+        on_half = np.abs(v - low - 0.5) < _EPS
+        even = np.where(np.mod(low, 2) == 0, low, low + 1)
+        r = np.where(on_half, even, np.floor(v + 0.5))
+    elif rounding == DOWN:
+        r = np.floor(v + _EPS)
+    elif rounding == UP:
+        r = np.ceil(v - _EPS)
+    else:
+        raise ValueError(f"unknown rounding mode '{rounding}'")
+    return r.astype(np.int64)
+
+
+def grosz(pln, rounding: str = HALF_UP) -> int:
+    """One PLN amount -> int grosze."""
+    return int(to_grosze(pln, rounding))
+
+
+def to_pln(grosze):
+    """int grosze -> PLN (float for a scalar, float array otherwise)."""
+    pln = np.asarray(grosze, dtype=np.int64) / GROSZE
+    return float(pln) if pln.ndim == 0 else pln
+
+
+def round_pln(pln, rounding: str = HALF_UP):
+    """PLN rounded to whole grosze (the float closest to the exact amount)."""
+    return to_pln(to_grosze(pln, rounding))
+
+
+def format_grosze(grosze: int, thousands: str = "", decimal: str = ",") -> str:
+    """1234567 -> "12345,67" ("12 345,67" with thousands=" ")."""
+    grosze = int(grosze)
+    sign = "-" if grosze < 0 else ""
+    whole, frac = divmod(abs(grosze), GROSZE)
+    whole_text = f"{whole:,}".replace(",", thousands)
+    return f"{sign}{whole_text}{decimal}{frac:02d}"
+
+
+def parse_grosze(text, rounding: str = HALF_UP) -> Optional[int]:
+    """ "1 234,56" / "1234.56" / 12.5 -> int grosze; None when it is not a number."""
+    if text is None:
+        return None
+    if isinstance(text, (int, float, np.integer, np.floating)):
+        return grosz(text, rounding)
+    s = str(text).strip().replace(" ", "").replace("\xa0", "").replace(",", ".")
+    try:
+        amount = Decimal(s) * GROSZE
+    except InvalidOperation:
+        return None
+    if not amount.is_finite():
+        return None
+    return int(amount.quantize(Decimal(1), rounding=_DECIMAL_ROUNDING[rounding]))
+
+
+class PriceTable:
+    """Quantity and unit / bending / additional price [gr] of every part (int64 columns)."""
+
+    def __init__(self, qty: Sequence[int], unit: Sequence[int], bending: Sequence[int],
+                 additional: Sequence[int]):
+        self.qty = np.asarray(qty, dtype=np.int64).copy()
+        self.unit = np.asarray(unit, dtype=np.int64).copy()
+        self.bending = np.asarray(bending, dtype=np.int64).copy()
+        self.additional = np.asarray(additional, dtype=np.int64).copy()
+
+    @classmethod
+    def from_parts(cls, parts: Iterable[dict], rounding: str = HALF_UP) -> "PriceTable":
+        """Table of the part dicts' qty, cost_per_unit, bending_per_unit and additional_per_unit.
+
+        ``parts`` is iterated once, so a disk-backed parts view is streamed."""
+        fields = ("cost_per_unit", "bending_per_unit", "additional_per_unit")
+        qty, prices = [], {f: [] for f in fields}
+        for p in parts:
+            qty.append(int(p.get("qty") or 0))
+            for f in fields:
+                prices[f].append(float(p.get(f) or 0.0))
+        def column(field):
+            return to_grosze(prices[field], rounding).reshape(len(qty))
+        return cls(qty, column("cost_per_unit"), column("bending_per_unit"), column("additional_per_unit"))
+
+    def __len__(self):
+        return len(self.qty)
+
+    def piece_prices(self, index=None) -> np.ndarray:
+        """Price of one piece incl. bending and additional costs [gr]."""
+        piece = self.unit + self.bending + self.additional
+        return piece if index is None else piece[np.asarray(index, dtype=int)]
+
+    def line_totals(self, index=None) -> np.ndarray:
+        """Price of the whole quantity of every part [gr]."""
+        qty = self.qty if index is None else self.qty[np.asarray(index, dtype=int)]
+        return self.piece_prices(index) * qty
+
+    def total(self, index=None) -> int:
+        """Order value of the parts in ``index`` (all by default) [gr]."""
+        return int(self.line_totals(index).sum())
+
+    def set(self, i: int, qty: Optional[int] = None, unit: Optional[int] = None,
+            bending: Optional[int] = None, additional: Optional[int] = None):
+        for column, value in ((self.qty, qty), (self.unit, unit), (self.bending, bending),
+                              (self.additional, additional)):
+            if value is not None:
+                column[i] = value
+
+    def update_parts(self, parts):
+        """Writes the table back into the part dicts (PLN floats)."""
+        for i, part in enumerate(parts):
+            part['qty'] = int(self.qty[i])
+            part['cost_per_unit'] = to_pln(self.unit[i])
+            part['bending_per_unit'] = to_pln(self.bending[i])
+            part['additional_per_unit'] = to_pln(self.additional[i])
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+order_batch.py - Order discovery and summary index for batch analysis.
+
+The shared drive keeps one sub-folder per inquiry (``Wycena/``,
+``K221220_Orrin/``, ...), each with its CypNest exports and a ``Raporty/``
+output folder. discover_order_folders() finds every folder under a root
+that directly contains exports; report folders are not entered.
+write_summary_index() writes one row per analysed order into an XLSX index.
+"""
+from __future__ import annotations
+
+import os
+from typing import Dict, Iterable, List
+
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+from folder_watcher import FolderWatcher
+
+REPORT_DIR = "Raporty"
+
+# (key, header, number format) of the summary index columns
+SUMMARY_COLUMNS = [
+    ("order", "Zamówienie", None),
+    ("folder", "Folder", None),
+    ("files", "Pliki", "0"),
+    ("skipped", "Pominięte", "0"),
+    ("parts", "Pozycje", "0"),
+    ("qty", "Ilość [szt]", "0"),
+    ("sheets", "Arkusze", "0"),
+    ("o2_hours", "Czas cięcia O₂ [h]", "0.00"),
+    ("n2_hours", "Czas cięcia N₂ [h]", "0.00"),
+    ("material_cost", "Koszt materiału [PLN]", "#,##0.00"),
+    ("total", "Wartość zamówienia [PLN]", "#,##0.00"),
+    ("result_file", "Plik wyników", None),
+    ("status", "Status", None),
+]
+
+
+def order_exports(folder: str) -> List[str]:
+    """Exports of one order folder, sorted by name (Excel lock files excluded)."""
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
+    return [os.path.join(folder, n) for n in sorted(names)
+            if FolderWatcher.is_export_name(n) and os.path.isfile(os.path.join(folder, n))]
+
+
+def discover_order_folders(root: str, skip_dirs: Iterable[str] = (REPORT_DIR,)) -> List[str]:
+    """Every folder under ``root`` (root included) that directly holds exports.
+
+    Folders named in ``skip_dirs`` (case-insensitive) and dot folders are not
+    entered. The result is sorted, so batch output does not depend on the
+    directory order.
+    """
+    skip = {d.lower() for d in skip_dirs}
+    orders = []
+    for dirpath, dirnames, _ in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d.lower() not in skip and not d.startswith(".")]
+        if order_exports(dirpath):
+            orders.append(dirpath)
+    return sorted(orders)
+
+
+def write_summary_index(path: str, rows: List[Dict]) -> str:
+    """Writes the batch summary (one row per order, keys from SUMMARY_COLUMNS)."""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Podsumowanie"
+    for col, (_, header, _) in enumerate(SUMMARY_COLUMNS, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+    for r, row in enumerate(rows, 2):
+        for col, (key, _, number_format) in enumerate(SUMMARY_COLUMNS, 1):
+            cell = ws.cell(row=r, column=col, value=row.get(key))
+            if number_format:
+                cell.number_format = number_format
+    if rows:
+        total_col = [k for k, _, _ in SUMMARY_COLUMNS].index("total") + 1
+        letter = get_column_letter(total_col)
+        r = len(rows) + 2
+        ws.cell(row=r, column=total_col - 1, value="Razem").font = Font(bold=True)
+        cell = ws.cell(row=r, column=total_col, value=f"=SUM({letter}2:{letter}{r - 1})")
+        cell.font = Font(bold=True)
+        cell.number_format = "#,##0.00"
+    for col, (key, header, _) in enumerate(SUMMARY_COLUMNS, 1):
+        width = max([len(header)] + [len(str(row.get(key) or "")) for row in rows])
+        ws.column_dimensions[get_column_letter(col)].width = min(width + 2, 60)
+    ws.freeze_panes = "A2"
+    wb.save(path)
+    return path
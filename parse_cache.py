@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+parse_cache.py - Persistent on-disk cache of parsed CypNest exports.
+
+Each successfully parsed export (the importer's record, e.g. a CypNestExport) is
+pickled into the cache directory as ``<sha1>-<format>-v<version>.pkl``, where
+format and version are those of the importer that produced it. An
+index maps every source path to the (size, mtime_ns, sha1) it had when it
+was cached, so unchanged files are recognised from os.stat() alone; a file
+whose size or mtime changed is re-hashed and still hits when its content
+is the same. Bumping an importer's version (cypnest_reader.PARSER_VERSION,
+item_list_reader.ITEM_LIST_VERSION) invalidates the entries of that format.
+
+Entries unused for ``max_age_days`` are removed, and the least recently
+used ones go first when the cache grows over ``max_size_mb``.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+from typing import Dict, Optional, Tuple
+
+from importers import importer_versions
+
+INDEX_FILE = "index.json"
+ENTRY_SUFFIX = ".pkl"
+
+
+def file_sha1(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class ParseCache:
+    """Cache of parsed exports stored in ``cache_dir``.
+
+    Only the process that owns the object reads and writes the index, so
+    worker processes never touch the cache. Call ``save()`` once a batch is
+    done; it writes the index and prunes old entries.
+    """
+
+    def __init__(self, cache_dir: str, versions: Optional[Dict[str, str]] = None,
+                 max_age_days: float = 30, max_size_mb: float = 512):
+        self.cache_dir = cache_dir
+        # record format -> parser version; defaults to the registered importers
+        self.versions = {fmt: str(v) for fmt, v in (versions if versions is not None else importer_versions()).items()}
+        self.max_age_days = max_age_days
+        self.max_size_mb = max_size_mb
+        self.hits = 0
+        self.misses = 0
+        self._keys: Dict[str, Tuple[int, int, str]] = {}
+        self._dirty = False
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    # ---------- Index ----------
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, INDEX_FILE)
+
+    def _load_index(self) -> Dict[str, list]:
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _entry_path(self, sha1: str, fmt: str) -> str:
+        return os.path.join(self.cache_dir, f"{sha1}-{fmt}-v{self.versions[fmt]}{ENTRY_SUFFIX}")
+
+    def _key(self, path: str) -> Tuple[int, int, str]:
+        """(size, mtime_ns, sha1); the hash is reused while size and mtime are unchanged."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        known = self._index.get(path)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return st.st_size, st.st_mtime_ns, known[2]
+        key = (st.st_size, st.st_mtime_ns, file_sha1(path))
+        self._index[path] = list(key)
+        self._dirty = True
+        return key
+
+    # ---------- Lookup / store ----------
+    def lookup(self, path: str):
+        """Returns the cached record for ``path`` or None."""
+        try:
+            key = self._key(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self._keys[os.path.abspath(path)] = key
+        for fmt in self.versions:
+            entry = self._entry_path(key[2], fmt)
+            try:
+                with open(entry, "rb") as f:
+                    record = pickle.load(f)
+                break
+            except FileNotFoundError:
+                continue
+            except Exception:
+                # truncated or written by an incompatible build - drop it
+                self._remove(entry)
+        else:
+            self.misses += 1
+            return None
+        try:
+            os.utime(entry)  # keeps recently used entries out of pruning
+        except OSError:
+            pass
+        # the record was cached from whichever copy had this content first
+        record.path = path
+        record.file_name = os.path.basename(path)
+        self.hits += 1
+        return record
+
+    def store(self, path: str, record) -> None:
+        """Caches ``record`` under the key computed by the last lookup() of ``path``.
+
+        The entry is versioned by the importer of the record's FORMAT; records
+        of a format without a registered importer are not cached."""
+        fmt = getattr(record, "FORMAT", None)
+        if fmt not in self.versions:
+            return
+        key = self._keys.get(os.path.abspath(path))
+        try:
+            if key is None:
+                key = self._key(path)
+            atomic_write(self._entry_path(key[2], fmt), pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError:
+            pass  # a read-only or full disk only costs speed
+
+    # ---------- Maintenance ----------
+    def _remove(self, entry: str) -> None:
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+    def _entries(self):
+        out = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            full = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            out.append((st.st_mtime, st.st_size, full, name))
+        return out
+
+    def prune(self) -> int:
+        """Removes stale, old and least recently used entries. Returns the number removed."""
+        now = time.time()
+        entries = sorted(self._entries())
+        removed = 0
+        keep = []
+        current = tuple(f"-{fmt}-v{v}{ENTRY_SUFFIX}" for fmt, v in self.versions.items())
+        for mtime, size, full, name in entries:
+            stale_version = not name.endswith(current)
+            too_old = self.max_age_days is not None and now - mtime > self.max_age_days * 86400
+            if stale_version or too_old:
+                self._remove(full)
+                removed += 1
+            else:
+                keep.append((mtime, size, full, name))
+        if self.max_size_mb is not None:
+            budget = self.max_size_mb * 1024 * 1024
+            total = sum(size for _, size, _, _ in keep)
+            for mtime, size, full, name in keep:  # oldest first
+                if total <= budget:
+                    break
+                self._remove(full)
+                total -= size
+                removed += 1
+        # forget paths that no longer exist
+        for path in [p for p in self._index if not os.path.exists(p)]:
+            del self._index[path]
+            self._dirty = True
+        return removed
+
+    def save(self) -> None:
+        """Prunes the cache and writes the index."""
+        self.prune()
+        if not self._dirty:
+            return
+        try:
+            atomic_write(self._index_path(), json.dumps(self._index, ensure_ascii=False).encode("utf-8"))
+            self._dirty = False
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        for _, _, full, _ in self._entries():
+            self._remove(full)
+        self._index = {}
+        self._keys = {}
+        self._dirty = True
+        self.save()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+parts_store.py - Disk-backed parts list for very large orders.
+
+all_parts is a list of ~35-key dicts, one per part of the order. For orders
+with thousands of parts the store owns the part data instead of memory:
+
+- add_file_parts() keeps the parts of one analysed export (costs before
+  overhead) as the file is costed; the per-file result only remembers the
+  returned row range, which incremental re-analysis reads back with
+  file_parts().
+- replace() writes the merged order from any iterable, ``chunk_size`` rows
+  at a time, and returns a StoredParts sequence that wycena.py uses in place
+  of the list. Parts are fetched by index or in chunks through a cursor, so
+  only the parts currently in use are in memory; changed parts are written
+  back in batches.
+- iter_parts() / distinct() answer the table filters from the indexed
+  columns; columns() reads indexed columns of every part without
+  unpickling the parts.
+
+Inline thumbnail bytes (projects loaded from .lpf) go to a separate blob
+table and are read only when asked for.
+
+The database is a scratch file: it is deleted by close() and nothing in it
+is meant to survive the session.
+"""
+from __future__ import annotations
+
+import os
+import pickle
+import sqlite3
+import tempfile
+from collections.abc import Sequence
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Part keys kept in the thumbnails table instead of the pickled row
+_BLOB_KEYS = ("thumb_data",)
+# Part keys with their own (indexed) column in the parts table
+_COLUMNS = ("subnr", "id", "name", "material", "thickness", "file_name")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS parts (
+    seq INTEGER PRIMARY KEY,        -- position in the order (index in all_parts)
+    subnr INTEGER,
+    id INTEGER,
+    name TEXT,
+    material TEXT,
+    thickness REAL,
+    file_name TEXT,
+    data BLOB NOT NULL              -- pickled part dict without _BLOB_KEYS
+);
+CREATE INDEX IF NOT EXISTS parts_subnr_id ON parts (subnr, id);
+CREATE INDEX IF NOT EXISTS parts_material_thickness ON parts (material, thickness);
+CREATE INDEX IF NOT EXISTS parts_file_name ON parts (file_name);
+CREATE INDEX IF NOT EXISTS parts_name ON parts (name);
+CREATE TABLE IF NOT EXISTS thumbnails (
+    seq INTEGER PRIMARY KEY,
+    png BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_parts (
+    seq INTEGER PRIMARY KEY,        -- rows of one export are consecutive
+    data BLOB NOT NULL              -- pickled part dict as costed from its file
+);
+"""
+
+
+class StoredPart(dict):
+    """A part read from the store; assignments are written back to it."""
+
+    __slots__ = ("_store", "_seq")
+
+    @property
+    def index(self) -> int:
+        """Position in the order (index in all_parts)."""
+        return self._seq
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._store._touch(self._seq, self)
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._store._touch(self._seq, self)
+
+    def __missing__(self, key):
+        if key in _BLOB_KEYS:
+            return self._store.thumbnail(self._seq)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None and key in _BLOB_KEYS else value
+
+
+class StoredParts(Sequence):
+    """Read/write view of the parts in a PartsStore, usable in place of all_parts."""
+
+    def __init__(self, store: "PartsStore"):
+        self.store = store
+
+    def __len__(self):
+        return self.store.count()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.store.get(i) for i in range(*index.indices(len(self)))]
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("part index out of range")
+        return self.store.get(index)
+
+    def __iter__(self):
+        return self.store.iter_parts()
+
+    def first_named(self, name):
+        """First part called ``name`` (index lookup), or None."""
+        return next(self.store.iter_parts(name=name), None)
+
+
+class PartsStore:
+    """SQLite file with the parts of one order (see module docstring)."""
+
+    def __init__(self, path: Optional[str] = None, chunk_size: int = 500):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="wycena_parts_", suffix=".sqlite")
+            os.close(fd)
+        self.path = path
+        self.chunk_size = chunk_size
+        self._conn = sqlite3.connect(path)
+        # scratch data: no journal on disk, no fsync
+        self._conn.execute("PRAGMA journal_mode=MEMORY")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.executescript(_SCHEMA)
+        self._count = self._conn.execute("SELECT COUNT(*) FROM parts").fetchone()[0]
+        self._dirty: Dict[int, StoredPart] = {}
+
+    # ---------- writing ----------
+    def replace(self, parts) -> StoredParts:
+        """Stores ``parts`` (in order) in place of the current ones."""
+        self._dirty.clear()
+        conn = self._conn
+        conn.execute("DELETE FROM parts")
+        conn.execute("DELETE FROM thumbnails")
+        rows, blobs = [], []
+        count = 0
+        for seq, part in enumerate(parts):
+            rows.append(self._row(seq, part))
+            png = part.get("thumb_data")
+            if png:
+                blobs.append((seq, png))
+            count += 1
+            if len(rows) >= self.chunk_size:
+                self._insert(rows, blobs)
+                rows, blobs = [], []
+        self._insert(rows, blobs)
+        conn.commit()
+        self._count = count
+        return StoredParts(self)
+
+    def add_file_parts(self, parts) -> Tuple[int, int]:
+        """Stores the parts of one export; returns their row range (first, count)."""
+        conn = self._conn
+        first = conn.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM file_parts").fetchone()[0]
+        rows = [(first + k, pickle.dumps(dict(part), protocol=pickle.HIGHEST_PROTOCOL))
+                for k, part in enumerate(parts)]
+        conn.executemany("INSERT INTO file_parts VALUES (?, ?)", rows)
+        conn.commit()
+        return first, len(rows)
+
+    def file_parts(self, rows: Tuple[int, int]) -> Iterator[dict]:
+        """The parts stored by add_file_parts() under ``rows``, in order; read in chunks."""
+        first, count = rows
+        cur = self._conn.execute("SELECT data FROM file_parts WHERE seq >= ? AND seq < ? ORDER BY seq",
+                                 (first, first + count))
+        while True:
+            chunk = cur.fetchmany(self.chunk_size)
+            if not chunk:
+                return
+            for (data,) in chunk:
+                yield pickle.loads(data)
+
+    def drop_file_parts(self, rows: Optional[Tuple[int, int]] = None):
+        """Deletes one export's parts (all of them without ``rows``)."""
+        if rows is None:
+            self._conn.execute("DELETE FROM file_parts")
+        else:
+            first, count = rows
+            self._conn.execute("DELETE FROM file_parts WHERE seq >= ? AND seq < ?", (first, first + count))
+        self._conn.commit()
+
+    def _insert(self, rows, blobs):
+        if rows:
+            self._conn.executemany("INSERT INTO parts VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        if blobs:
+            self._conn.executemany("INSERT INTO thumbnails VALUES (?, ?)", blobs)
+
+    @staticmethod
+    def _row(seq, part):
+        data = {k: v for k, v in part.items() if k not in _BLOB_KEYS}
+        return (seq, part.get("subnr"), part.get("id"), part.get("name"), part.get("material"),
+                part.get("thickness"), part.get("file_name"),
+                pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def _touch(self, seq, part):
+        self._dirty[seq] = part
+        if len(self._dirty) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Writes parts changed since the last flush back to the file."""
+        if not self._dirty:
+            return
+        rows = [self._row(seq, part) for seq, part in self._dirty.items()]
+        self._dirty.clear()
+        self._conn.executemany(
+            "UPDATE parts SET subnr = ?, id = ?, name = ?, material = ?, thickness = ?, "
+            "file_name = ?, data = ? WHERE seq = ?", [r[1:] + r[:1] for r in rows])
+        self._conn.commit()
+
+    # ---------- reading ----------
+    def count(self) -> int:
+        return self._count
+
+    def _part(self, seq, data) -> StoredPart:
+        part = self._dirty.get(seq)
+        if part is None:
+            part = StoredPart(pickle.loads(data))
+            part._store = self
+            part._seq = seq
+        return part
+
+    def get(self, seq: int) -> StoredPart:
+        part = self._dirty.get(seq)
+        if part is not None:
+            return part
+        row = self._conn.execute("SELECT data FROM parts WHERE seq = ?", (seq,)).fetchone()
+        if row is None:
+            raise IndexError(seq)
+        return self._part(seq, row[0])
+
+    def iter_parts(self, **where) -> Iterator[StoredPart]:
+        """Parts in order, optionally filtered on indexed columns
+        (subnr, id, name, material, thickness, file_name); read in chunks."""
+        self.flush()
+        sql = "SELECT seq, data FROM parts"
+        if where:
+            sql += " WHERE " + " AND ".join(f"{col} = ?" for col in where)
+        cur = self._conn.execute(sql + " ORDER BY seq", tuple(where.values()))
+        while True:
+            chunk = cur.fetchmany(self.chunk_size)
+            if not chunk:
+                return
+            for seq, data in chunk:
+                yield self._part(seq, data)
+
+    def columns(self, *names: str) -> Iterator[Tuple]:
+        """Tuples of the indexed columns ``names`` of every part, in order; read in chunks."""
+        bad = [n for n in names if n not in _COLUMNS]
+        if bad or not names:
+            raise ValueError(bad or names)
+        self.flush()
+        cur = self._conn.execute(f"SELECT {', '.join(names)} FROM parts ORDER BY seq")
+        while True:
+            chunk = cur.fetchmany(self.chunk_size)
+            if not chunk:
+                return
+            yield from chunk
+
+    def find(self, subnr, part_id) -> Optional[StoredPart]:
+        """The part with Lp ``part_id`` of file number ``subnr``."""
+        return next(self.iter_parts(subnr=subnr, id=part_id), None)
+
+    def distinct(self, column: str) -> List:
+        """Sorted distinct values of ``material``, ``thickness`` or ``file_name``."""
+        if column not in ("material", "thickness", "file_name"):
+            raise ValueError(column)
+        self.flush()
+        return [r[0] for r in self._conn.execute(
+            f"SELECT DISTINCT {column} FROM parts WHERE {column} IS NOT NULL ORDER BY {column}")]
+
+    def thumbnail(self, seq: int) -> Optional[bytes]:
+        row = self._conn.execute("SELECT png FROM thumbnails WHERE seq = ?", (seq,)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        """Closes and deletes the database file."""
+        self._dirty.clear()
+        self._conn.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
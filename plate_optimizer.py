@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+plate_optimizer.py - Cheapest plate format and supplier for every nest.
+
+Each plate row of an order (a Result sheet: plate size, used "nested" size,
+number of plates) must be cut from a purchased sheet that covers the nest.
+The material price list quotes several formats (1500x3000, 1500x2500, ...)
+per material and thickness, each from its own supplier, in PLN/kg. A sheet
+costs format area x thickness x density x price.
+
+optimize() evaluates every (plate row, quote) pair of the order in one
+NumPy pass - rows and quotes of different material/thickness are masked
+out, as are formats the nest does not fit in either orientation - and picks
+the cheapest quote per row. The current choice is the quote the price list
+uses today; a row's saving is its current cost minus the best cost.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from price_history import MaterialQuote
+
+# kg/dm³ (= g/cm³); materials not listed are priced as structural steel
+STEEL_DENSITY = 7.85
+STAINLESS_DENSITY = 7.90
+ALUMINIUM_DENSITY = 2.70
+FIT_TOLERANCE = 0.5  # mm
+
+_FORMAT_RE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*[xX*×]\s*(\d+(?:[.,]\d+)?)\s*$")
+
+
+def parse_format(text) -> Optional[Tuple[float, float]]:
+    """(width, height) in mm of a format like '1500x3000'; None if it is not one."""
+    m = _FORMAT_RE.match(str(text or ""))
+    if not m:
+        return None
+    return float(m.group(1).replace(",", ".")), float(m.group(2).replace(",", "."))
+
+
+def material_density(material: str) -> float:
+    """Density [kg/dm³] from the material name (AL... aluminium, 1.4... stainless)."""
+    name = (material or "").upper()
+    if "AL" in name:
+        return ALUMINIUM_DENSITY
+    if name.startswith("1.4") or "INOX" in name:
+        return STAINLESS_DENSITY
+    return STEEL_DENSITY
+
+
+@dataclass
+class PlateRow:
+    label: str                 # where the row comes from (file, Result sheet)
+    material: str
+    thickness: float           # mm
+    size: Tuple[float, float]  # mm, area the purchased sheet has to cover
+    sheets: int
+
+
+@dataclass
+class FormatChoice:
+    row: PlateRow
+    current: Optional[MaterialQuote]
+    current_cost: Optional[float]  # None: the current format does not fit the nest
+    best: Optional[MaterialQuote]  # None: no quoted format fits
+    best_cost: Optional[float]
+
+    @property
+    def saving(self) -> float:
+        if self.current_cost is None or self.best_cost is None:
+            return 0.0
+        return self.current_cost - self.best_cost
+
+
+@dataclass
+class FormatPlan:
+    choices: List[FormatChoice] = field(default_factory=list)
+
+    @property
+    def current_cost(self) -> float:
+        return sum(c.current_cost for c in self.choices if c.current_cost is not None and c.best_cost is not None)
+
+    @property
+    def best_cost(self) -> float:
+        return sum(c.best_cost for c in self.choices if c.current_cost is not None and c.best_cost is not None)
+
+    @property
+    def saving(self) -> float:
+        return sum(c.saving for c in self.choices)
+
+    def unfitted(self) -> List[FormatChoice]:
+        return [c for c in self.choices if c.best is None]
+
+
+def sheet_cost(quote: MaterialQuote, size: Tuple[float, float]) -> float:
+    """Price of one sheet of ``size`` mm of the quoted material."""
+    return size[0] * size[1] * quote.thickness * material_density(quote.material) * 1e-6 * quote.price
+
+
+def optimize(rows: Sequence[PlateRow], offers: Dict[Tuple[str, float], List[MaterialQuote]],
+             current: Dict[Tuple[str, float], Optional[MaterialQuote]]) -> FormatPlan:
+    """Cheapest quote per plate row.
+
+    offers / current: (material, thickness) -> the quotes in force / the
+    quote priced today, for every (material, thickness) of ``rows``.
+    """
+    group_ids: Dict[Tuple[str, float], int] = {}
+    for r in rows:
+        group_ids.setdefault((r.material, r.thickness), len(group_ids))
+
+    quotes: List[MaterialQuote] = []
+    q_group, q_size = [], []
+    for key, gid in group_ids.items():
+        for q in offers.get(key, ()):
+            size = parse_format(q.format)
+            if size is not None:
+                quotes.append(q)
+                q_group.append(gid)
+                q_size.append(size)
+    n, m = len(rows), len(quotes)
+    plan = FormatPlan()
+    if not n:
+        return plan
+
+    r_group = np.array([group_ids[(r.material, r.thickness)] for r in rows])
+    r_w = np.array([min(r.size) for r in rows], dtype=float)
+    r_h = np.array([max(r.size) for r in rows], dtype=float)
+    sheets = np.array([r.sheets for r in rows], dtype=float)
+    q_group = np.array(q_group, dtype=int).reshape(m)
+    q_w = np.array([min(s) for s in q_size], dtype=float).reshape(m)
+    q_h = np.array([max(s) for s in q_size], dtype=float).reshape(m)
+    q_cost = np.array([sheet_cost(q, s) for q, s in zip(quotes, q_size)], dtype=float).reshape(m)
+
+    # (n, m): same material/thickness and the nest fits (both sides sorted, so one orientation check)
+    valid = ((r_group[:, None] == q_group[None, :])
+             & (q_w[None, :] >= r_w[:, None] - FIT_TOLERANCE)
+             & (q_h[None, :] >= r_h[:, None] - FIT_TOLERANCE))
+    cost = np.where(valid, sheets[:, None] * q_cost[None, :], np.inf)
+    best = np.argmin(cost, axis=1) if m else np.zeros(n, dtype=int)
+    best_cost = cost[np.arange(n), best] if m else np.full(n, np.inf)
+
+    position = {q: j for j, q in enumerate(quotes)}
+    for i, r in enumerate(rows):
+        cur = current.get((r.material, r.thickness))
+        j = position.get(cur) if cur is not None else None
+        cur_cost = cost[i, j] if j is not None else np.inf
+        plan.choices.append(FormatChoice(
+            row=r,
+            current=cur,
+            current_cost=float(cur_cost) if np.isfinite(cur_cost) else None,
+            best=quotes[best[i]] if np.isfinite(best_cost[i]) else None,
+            best_cost=float(best_cost[i]) if np.isfinite(best_cost[i]) else None,
+        ))
+    return plan
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+price_history.py - Dated, multi-supplier view of the material price list.
+
+Every row of "materials prices.xlsx" is a quote: a price for a material and
+thickness in a plate format, from a supplier (column ``from``), valid from
+its ``date``. material_prices keeps only the last row per (material,
+thickness); MaterialPriceHistory keeps all of them.
+
+For every (material, thickness, format, supplier) - and for the same key
+with the format and/or supplier left open - the quotes are kept as a
+timeline sorted by date, so "the price as of a date" is one binary search.
+For every (material, thickness, format) - and with the format left open - a
+second timeline holds the cheapest quote in force after each date, so
+"the cheapest supplier as of a date" is a binary search as well. Thicknesses
+are matched to 1e-6 mm. Undated rows count as valid since ever; of several
+quotes for the same key and day the later row wins, as in the workbook.
+"""
+from __future__ import annotations
+
+import datetime
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d-%m-%Y", "%Y.%m.%d", "%d/%m/%Y")
+
+
+def parse_date(value) -> Optional[datetime.date]:
+    """Date of a cell or an entry (date, datetime or text); None when empty.
+
+    Raises ValueError for text in none of DATE_FORMATS.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    text = str(value).strip()
+    if not text:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"'{text}' is not a date (use YYYY-MM-DD or DD.MM.YYYY)")
+
+
+@dataclass(frozen=True)
+class MaterialQuote:
+    material: str
+    thickness: float
+    format: str
+    supplier: str
+    date: Optional[datetime.date]
+    price: float
+    note: str = ""
+
+
+def _day(when) -> int:
+    if when is None:
+        return datetime.date.max.toordinal()
+    if isinstance(when, datetime.datetime):
+        when = when.date()
+    return when.toordinal()
+
+
+def _thk(thickness) -> float:
+    return round(float(thickness), 6)
+
+
+class _Timeline:
+    """Quotes in force from each date on (dates non-decreasing)."""
+
+    __slots__ = ("days", "quotes")
+
+    def __init__(self):
+        self.days: List[int] = []
+        self.quotes: List[MaterialQuote] = []
+
+    def add(self, day: int, quote: MaterialQuote):
+        if self.days and self.days[-1] == day:
+            self.quotes[-1] = quote
+        else:
+            self.days.append(day)
+            self.quotes.append(quote)
+
+    def at(self, day: int) -> Optional[MaterialQuote]:
+        i = bisect_right(self.days, day) - 1
+        return self.quotes[i] if i >= 0 else None
+
+
+class MaterialPriceHistory:
+    """All quotes of the material price list (see module docstring)."""
+
+    def __init__(self):
+        # (material, thickness, format|None, supplier|None) -> latest quote timeline
+        self._latest: Dict[Tuple, _Timeline] = {}
+        # (material, thickness, format|None) -> cheapest quote timeline
+        self._cheapest: Dict[Tuple, _Timeline] = {}
+        # (material, thickness) -> (format, supplier) pairs quoted for it
+        self._offers: Dict[Tuple, List[Tuple[str, str]]] = {}
+        self._count = 0
+
+    @classmethod
+    def build(cls, quotes: Iterable[MaterialQuote]) -> "MaterialPriceHistory":
+        history = cls()
+        undated = datetime.date.min.toordinal()
+        events = sorted(enumerate(quotes),
+                        key=lambda e: (e[1].date.toordinal() if e[1].date else undated, e[0]))
+        in_force: Dict[Tuple, Dict[Tuple[str, str], MaterialQuote]] = {}
+        for _, q in events:
+            day = q.date.toordinal() if q.date else undated
+            thk = _thk(q.thickness)
+            offers = history._offers.setdefault((q.material, thk), [])
+            if (q.format, q.supplier) not in offers:
+                offers.append((q.format, q.supplier))
+            for fmt in (q.format, None):
+                for supplier in (q.supplier, None):
+                    history._latest.setdefault((q.material, thk, fmt, supplier), _Timeline()).add(day, q)
+                current = in_force.setdefault((q.material, thk, fmt), {})
+                current[(q.format, q.supplier)] = q
+                history._cheapest.setdefault((q.material, thk, fmt), _Timeline()).add(
+                    day, min(current.values(), key=lambda c: c.price))
+        history._count = len(events)
+        return history
+
+    def __len__(self):
+        return self._count
+
+    def as_of(self, material, thickness, when=None, format: Optional[str] = None,
+              supplier: Optional[str] = None) -> Optional[MaterialQuote]:
+        """Latest quote dated on or before ``when`` (None: the newest one);
+        any format / supplier unless given."""
+        timeline = self._latest.get((material, _thk(thickness), format, supplier))
+        return timeline.at(_day(when)) if timeline else None
+
+    def cheapest(self, material, thickness, when=None, format: Optional[str] = None) -> Optional[MaterialQuote]:
+        """Cheapest quote in force on ``when`` across suppliers (and formats unless given)."""
+        timeline = self._cheapest.get((material, _thk(thickness), format))
+        return timeline.at(_day(when)) if timeline else None
+
+    def offers(self, material, thickness, when=None) -> List[MaterialQuote]:
+        """Latest quote of every (format, supplier) for the material and thickness on ``when``."""
+        day = _day(when)
+        thk = _thk(thickness)
+        quotes = (self._latest[(material, thk, fmt, supplier)].at(day)
+                  for fmt, supplier in self._offers.get((material, thk), ()))
+        return [q for q in quotes if q is not None]
+
+    def prices_as_of(self, when=None) -> Dict[Tuple[str, float], float]:
+        """{(material, thickness): price} of the latest quotes on ``when``, i.e. the
+        price list as it stood that day."""
+        day = _day(when)
+        prices = {}
+        for (material, thk, fmt, supplier), timeline in self._latest.items():
+            if fmt is None and supplier is None:
+                quote = timeline.at(day)
+                if quote is not None:
+                    prices[(material, thk)] = quote.price
+        return prices
+
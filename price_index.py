@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+price_index.py - Compiled price-list lookups over sorted thickness arrays.
+
+The price lists are loaded into dicts keyed by exact float tuples, so a
+thickness of 1.5 vs 1.50000001, or one that is missing from the list, finds
+no price. PriceIndex keeps, per group (the material for the material list,
+(material, gas) for the cutting list), the thicknesses as a sorted NumPy
+array with one value column per field and answers lookups with a binary
+search. What happens when there is no table thickness within ``tolerance``
+is decided by the policy:
+
+    exact        no price
+    nearest      value at the closest table thickness
+    interpolate  linear between the neighbouring thicknesses, no price
+                 outside the table
+    clamp        as interpolate; first / last value outside the table
+    extrapolate  as interpolate; linear through the two end points outside
+
+lookup_many() prices whole arrays of (group, thickness) pairs in one call;
+missing prices come back as NaN (None from lookup()).
+"""
+from __future__ import annotations
+
+from typing import Dict, Hashable, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+POLICIES = ("exact", "nearest", "interpolate", "clamp", "extrapolate")
+DEFAULT_TOLERANCE = 1e-6  # mm
+
+
+class PriceIndex:
+    """Sorted per-group thickness tables (see module docstring)."""
+
+    def __init__(self, fields: Sequence[str] = ("price",), tolerance: float = DEFAULT_TOLERANCE,
+                 policy: str = "exact"):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown price policy '{policy}'")
+        self.fields = tuple(fields)
+        self.tolerance = tolerance
+        self.policy = policy
+        # group -> (thicknesses, shape (n,); values, shape (n, len(fields)))
+        self._tables: Dict[Hashable, Tuple[np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    def build(cls, points: Iterable[Tuple[Hashable, float, Sequence[Optional[float]]]],
+              fields: Sequence[str] = ("price",), **options) -> "PriceIndex":
+        """Index of ``points`` = (group, thickness, values in ``fields`` order).
+
+        Missing values (None) are stored as NaN. Of several points of a group
+        whose thicknesses are within the tolerance the last one wins, as with
+        repeated rows of a price list.
+        """
+        index = cls(fields, **options)
+        grouped: Dict[Hashable, list] = {}
+        for group, thickness, values in points:
+            grouped.setdefault(group, []).append(
+                (float(thickness), [np.nan if v is None else float(v) for v in values]))
+        for group, rows in grouped.items():
+            order = sorted(range(len(rows)), key=lambda i: (rows[i][0], i))
+            thk, vals, kept = [], [], []
+            for i in order:
+                t, v = rows[i]
+                if thk and t - thk[-1] <= index.tolerance:
+                    if i > kept[-1]:
+                        thk[-1], vals[-1], kept[-1] = t, v, i
+                else:
+                    thk.append(t)
+                    vals.append(v)
+                    kept.append(i)
+            index._tables[group] = (np.array(thk), np.array(vals, dtype=float).reshape(len(thk), len(index.fields)))
+        return index
+
+    def __len__(self):
+        return sum(len(t) for t, _ in self._tables.values())
+
+    def __contains__(self, group):
+        return group in self._tables
+
+    def groups(self):
+        return list(self._tables)
+
+    def thicknesses(self, group) -> np.ndarray:
+        table = self._tables.get(group)
+        return table[0].copy() if table is not None else np.empty(0)
+
+    def lookup(self, group, thickness, field: str = "price", policy: Optional[str] = None) -> Optional[float]:
+        """One value, or None when the policy finds none."""
+        if thickness is None or group not in self._tables:
+            return None
+        value = self.lookup_many([group], [thickness], field, policy)[0]
+        return None if np.isnan(value) else float(value)
+
+    def lookup_many(self, groups: Sequence[Hashable], thicknesses, field: str = "price",
+                    policy: Optional[str] = None) -> np.ndarray:
+        """Values for every (groups[i], thicknesses[i]); NaN where there is none."""
+        policy = policy or self.policy
+        if policy not in POLICIES:
+            raise ValueError(f"unknown price policy '{policy}'")
+        col = self.fields.index(field)
+        x = np.asarray(thicknesses, dtype=float)
+        out = np.full(x.shape, np.nan)
+        rows: Dict[Hashable, list] = {}
+        for i, group in enumerate(groups):
+            rows.setdefault(group, []).append(i)
+        for group, idx in rows.items():
+            table = self._tables.get(group)
+            if table is not None:
+                idx = np.asarray(idx)
+                out[idx] = self._resolve(table[0], table[1][:, col], x[idx], policy)
+        return out
+
+    def _resolve(self, thk: np.ndarray, y: np.ndarray, x: np.ndarray, policy: str) -> np.ndarray:
+        n = len(thk)
+        pos = np.searchsorted(thk, x)
+        lo = np.clip(pos - 1, 0, n - 1)
+        hi = np.clip(pos, 0, n - 1)
+        d_lo = np.abs(x - thk[lo])
+        d_hi = np.abs(thk[hi] - x)
+        nearest = np.where(d_hi < d_lo, hi, lo)
+        exact = np.minimum(d_lo, d_hi) <= self.tolerance
+        if policy == "exact":
+            return np.where(exact, y[nearest], np.nan)
+        if policy == "nearest":
+            return y[nearest]
+        span = thk[hi] - thk[lo]
+        t = np.divide(x - thk[lo], span, out=np.zeros_like(x), where=span > 0)
+        result = np.where((x >= thk[0]) & (x <= thk[-1]), y[lo] + t * (y[hi] - y[lo]), np.nan)
+        below, above = x < thk[0], x > thk[-1]
+        if policy == "clamp":
+            result = np.where(below, y[0], np.where(above, y[-1], result))
+        elif policy == "extrapolate":
+            if n > 1:
+                slope_lo = (y[1] - y[0]) / (thk[1] - thk[0])
+                slope_hi = (y[-1] - y[-2]) / (thk[-1] - thk[-2])
+                result = np.where(below, y[0] + (x - thk[0]) * slope_lo,
+                                  np.where(above, y[-1] + (x - thk[-1]) * slope_hi, result))
+            else:
+                result = np.where(below | above, y[0], result)
+        return np.where(exact, y[nearest], result)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+price_snapshot.py - Binary snapshots of the parsed price lists.
+
+Reading "materials prices.xlsx" or "cutting prices.xlsx" with openpyxl
+takes far longer than using the few hundred rows it yields. After a list
+has been parsed, its rows are pickled next to the workbook as
+``<workbook>.snapshot`` together with the workbook's (size, mtime_ns);
+load() returns them for as long as the workbook is unchanged, so the xlsx
+is only read again after it has been edited. Bumping SNAPSHOT_VERSION (or
+changing the row layout of a ``kind``) invalidates all snapshots.
+
+A snapshot that cannot be read or written is ignored: the workbook stays
+the source of truth.
+"""
+from __future__ import annotations
+
+import os
+import pickle
+from typing import List, Optional, Tuple
+
+from parse_cache import atomic_write
+
+SNAPSHOT_VERSION = 2
+SNAPSHOT_SUFFIX = ".snapshot"
+
+
+def snapshot_path(source: str) -> str:
+    return source + SNAPSHOT_SUFFIX
+
+
+def source_signature(source: str) -> Tuple[int, int]:
+    """(size, mtime_ns) of ``source``; take it before reading the file."""
+    st = os.stat(source)
+    return st.st_size, st.st_mtime_ns
+
+
+def load(source: str, kind: str) -> Optional[List[tuple]]:
+    """Rows stored for ``source``, or None when there is no snapshot or the file changed."""
+    try:
+        signature = source_signature(source)
+        with open(snapshot_path(source), "rb") as f:
+            payload = pickle.load(f)
+    except Exception:
+        return None
+    if (not isinstance(payload, dict) or payload.get("version") != SNAPSHOT_VERSION
+            or payload.get("kind") != kind or tuple(payload.get("signature", ())) != signature):
+        return None
+    return payload["rows"]
+
+
+def save(source: str, kind: str, rows: List[tuple], signature: Tuple[int, int]) -> bool:
+    """Stores ``rows`` parsed from ``source`` as it was at ``signature``."""
+    payload = {"version": SNAPSHOT_VERSION, "kind": kind, "signature": tuple(signature), "rows": list(rows)}
+    try:
+        atomic_write(snapshot_path(source), pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        return False
+    return True
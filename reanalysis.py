@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+reanalysis.py - Which exports an incremental re-analysis has to re-cost.
+
+wycena.py keeps one result per analysed export (file_results). A result
+records the file's signature and the price-list values its costs were
+computed with ('price_key' -> 'price_inputs'). plan() splits the exports of
+a folder into results that are reused and files that are read and costed
+again; price_changes() names the files whose price-list values differ after
+a price list was reloaded, so only those are re-costed (in memory, from
+their results - see wycena._apply_reloaded_prices).
+
+The table prices of an order (money.PriceTable, one row per part) may have
+been edited, margined or set by the target solver since the analysis.
+spans() locates each file's rows, and carry_prices() moves the rows of the
+reused files to their new positions after an incremental run instead of
+rebuilding them from the analysed costs; reprice_rows() sets new unit
+prices on the rows of one re-costed file and leaves locked rows alone.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+import money
+
+
+@dataclass
+class Plan:
+    reused: Dict[str, dict]   # file name -> result kept as is
+    to_read: List[str]        # files to read and cost, in folder order
+    stale: List[dict]         # previous results that are replaced or gone
+
+
+def price_changes(results: Dict[str, dict], price_inputs: Callable[..., object]) -> List[str]:
+    """Sorted names of the files whose price-list values changed.
+
+    price_inputs(*price_key) returns the current values of one file's
+    price key (wycena._file_price_inputs)."""
+    return sorted(f for f, res in results.items() if res['price_inputs'] != price_inputs(*res['price_key']))
+
+
+def plan(files: Iterable[str], previous: Dict[str, dict], is_current: Callable[[str, dict], bool]) -> Plan:
+    """Reused results and files to (re)read for the exports ``files``.
+
+    previous: {file name: result} of the last analysis ({} for a full run).
+    is_current(file name, result) tells whether a result still holds (same
+    signature, margin settings and prices).
+    """
+    files = list(files)
+    reused = {f: previous[f] for f in files if f in previous and is_current(f, previous[f])}
+    to_read = [f for f in files if f not in reused]
+    stale = [res for f, res in previous.items() if f not in reused]
+    return Plan(reused, to_read, stale)
+
+
+def spans(results: Iterable[dict]) -> Dict[str, Tuple[int, int]]:
+    """{file name: (first row, part count)} of per-file results merged in order."""
+    out = {}
+    first = 0
+    for res in results:
+        out[res['file_name']] = (first, res['part_count'])
+        first += res['part_count']
+    return out
+
+
+def carry_prices(fresh: money.PriceTable, previous: money.PriceTable, old_spans: Dict[str, Tuple[int, int]],
+                 new_spans: Dict[str, Tuple[int, int]], files: Iterable[str]) -> money.PriceTable:
+    """``fresh`` (the prices of the merged order as analysed) with the rows of
+    ``files`` taken over from ``previous``, where they were at ``old_spans``."""
+    out = money.PriceTable(fresh.qty, fresh.unit, fresh.bending, fresh.additional)
+    for f in files:
+        (old, count), (new, new_count) = old_spans[f], new_spans[f]
+        if count != new_count:
+            raise ValueError(f"{f}: {count} rows before, {new_count} now")
+        for column in ("qty", "unit", "bending", "additional"):
+            getattr(out, column)[new:new + count] = getattr(previous, column)[old:old + count]
+    return out
+
+
+def reprice_rows(prices: money.PriceTable, span: Tuple[int, int], unit_grosze, keep: Iterable[int] = ()) -> List[int]:
+    """Sets the unit price [gr] of the rows in ``span`` (first row, count), one
+    per row; rows in ``keep`` (locked) keep theirs, and quantities, bending
+    and additional costs are not touched. Returns the rows that were set."""
+    first, count = span
+    unit = np.asarray(unit_grosze, dtype=np.int64)
+    if len(unit) != count:
+        raise ValueError(f"{len(unit)} prices for {count} rows")
+    keep = set(keep)
+    rows = [first + k for k in range(count) if first + k not in keep]
+    prices.unit[rows] = unit[[row - first for row in rows]]
+    return rows
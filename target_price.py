@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+target_price.py - Spread a target order value over the parts of an order.
+
+The price of one piece of a part is its L+M unit price plus the fixed
+bending and additional costs; the order value is the sum of price x qty.
+solve() sets the L+M unit prices of the free (not locked) parts so that the
+order value is exactly the target, in whole grosze:
+
+  * each free unit price stays at or above its floor - e.g. the price that
+    keeps the piece at a minimum margin over its own (TKW) cost, see
+    margin_floor();
+  * bending, additional costs and the prices of locked parts do not change;
+  * above their floors the free prices keep their current proportions: one
+    scale factor s gives max(floor, s x current price), and s is found in
+    closed form from the sorted breakpoints floor / current price.
+
+The scaled prices are rounded down to grosze and the missing grosze handed
+out by largest remainder. What is left (less than the quantity of every part
+not yet raised) is closed with a few +/-1 gr moves on parts whose quantity
+adds up to it; when no such moves exist (e.g. all free quantities are
+multiples of 10 and the gap is not) the result is the closest reachable
+value and ``exact`` is False. A target below the sum of the floors cannot be
+met: all free parts are set to their floors.
+"""
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+from money import UP, to_grosze, to_pln
+
+
+def margin_floor(tkw_unit, bending, additional, min_margin_percent: float) -> np.ndarray:
+    """Lowest L+M unit price that keeps a piece at ``min_margin_percent`` over its TKW cost."""
+    floor = (np.asarray(tkw_unit, dtype=float) * (1.0 + min_margin_percent / 100.0)
+             - np.asarray(bending, dtype=float) - np.asarray(additional, dtype=float))
+    return np.maximum(floor, 0.0)
+
+
+@dataclass
+class TargetPrices:
+    unit_grosze: np.ndarray  # L+M unit price of every part [gr]
+    total_grosze: int        # order value with these prices [gr]
+    target_grosze: int
+    minimum_grosze: int      # lowest order value the floors and locked parts allow [gr]
+    changed: np.ndarray      # parts whose unit price was changed
+
+    @property
+    def exact(self) -> bool:
+        return self.total_grosze == self.target_grosze
+
+    @property
+    def unit_prices(self) -> np.ndarray:
+        return to_pln(self.unit_grosze)
+
+    @property
+    def total(self) -> float:
+        return to_pln(self.total_grosze)
+
+    @property
+    def target(self) -> float:
+        return to_pln(self.target_grosze)
+
+    @property
+    def minimum(self) -> float:
+        return to_pln(self.minimum_grosze)
+
+    @property
+    def shortfall(self) -> float:
+        """Target minus the reached value [PLN] (0 when exact)."""
+        return to_pln(self.target_grosze - self.total_grosze)
+
+
+def _scale_to(remaining: int, qty: np.ndarray, weight: np.ndarray, floor: np.ndarray) -> np.ndarray:
+    """Prices x = max(floor, s * weight) [gr] with sum(qty * x) == remaining (>= sum(qty * floor))."""
+    qw = qty * weight
+    with np.errstate(divide="ignore", invalid="ignore"):
+        breaks = np.where(weight > 0, floor / weight, np.inf)
+    order = np.argsort(breaks, kind="stable")
+    b = breaks[order]
+    finite = np.isfinite(b)
+    if not finite.any():
+        return floor.astype(float)
+    # value at each breakpoint: parts up to k scaled, the rest at their floors
+    scaled = np.cumsum(qw[order])
+    at_floor = np.concatenate((np.cumsum((qty * floor)[order][::-1])[::-1][1:], [0]))
+    value = b * scaled + at_floor
+    k = int(np.searchsorted(value[finite], remaining, side="right")) - 1
+    k = max(k, 0)
+    s = b[k] + (remaining - value[k]) / scaled[k]
+    return np.maximum(floor, s * weight)
+
+
+def _close_gap(gap: int, qty: np.ndarray, units: np.ndarray, floor: np.ndarray, frac: np.ndarray) -> int:
+    """+/-1 gr moves on free parts (in place) that bring ``gap`` to zero, or as close
+    as the quantities allow; returns the gap left."""
+    up = sorted(set(qty.tolist()))
+    room = units - floor
+    down = sorted(set(qty[room > 0].tolist()))
+    # a part can only be lowered down to its floor
+    capacity = [int(room[qty == q].sum()) for q in down]
+    step = int(np.gcd.reduce(np.asarray(up)))
+    goal = gap % step
+    if goal > step // 2:
+        goal -= step
+    bound = abs(gap) + max(up + down)
+    # breadth-first search: fewest moves from gap to goal
+    parent = {gap: None}
+    lowered = {gap: (0,) * len(down)}
+    queue = deque([gap])
+    while queue and goal not in parent:
+        g = queue.popleft()
+        for q in up:
+            nxt = g - q
+            if -bound <= nxt <= bound and nxt not in parent:
+                parent[nxt] = (g, q, 1)
+                lowered[nxt] = lowered[g]
+                queue.append(nxt)
+        for j, q in enumerate(down):
+            nxt = g + q
+            if lowered[g][j] < capacity[j] and -bound <= nxt <= bound and nxt not in parent:
+                parent[nxt] = (g, q, -1)
+                lowered[nxt] = lowered[g][:j] + (lowered[g][j] + 1,) + lowered[g][j + 1:]
+                queue.append(nxt)
+    end = goal if goal in parent else min(parent, key=abs)
+    moves = []
+    while parent[end] is not None:
+        g, q, sign = parent[end]
+        moves.append((q, sign))
+        end = g
+    # raise the parts with the largest remainders first, lower the smallest
+    by_frac = np.argsort(-frac, kind="stable")
+    for q, sign in moves:
+        candidates = by_frac if sign > 0 else by_frac[::-1]
+        for i in candidates:
+            if qty[i] == q and (sign > 0 or units[i] > floor[i]):
+                units[i] += sign
+                gap -= sign * q
+                break
+    return gap
+
+
+def solve(target: float, qty: Sequence[float], unit_prices: Sequence[float],
+          bending: Sequence[float], additional: Sequence[float],
+          floors: Optional[Sequence[float]] = None, locked: Optional[Sequence[bool]] = None) -> TargetPrices:
+    """L+M unit prices that make sum((unit + bending + additional) * qty) == target."""
+    qty = np.rint(np.asarray(qty, dtype=float)).astype(np.int64)
+    n = len(qty)
+    current = to_grosze(unit_prices).reshape(n)
+    fixed = (to_grosze(bending) + to_grosze(additional)).reshape(n)
+    floor = np.zeros(n, dtype=np.int64) if floors is None else \
+        to_grosze(floors, UP).reshape(n)
+    floor = np.maximum(floor, 0)
+    locked = np.zeros(n, dtype=bool) if locked is None else np.asarray(locked, dtype=bool).reshape(n)
+    free = ~locked & (qty > 0)
+
+    target_gr = int(to_grosze(target))
+    base = int(qty @ fixed + qty[~free] @ current[~free])
+    remaining = target_gr - base
+    q, f = qty[free], floor[free]
+    minimum = base + int(q @ f)
+    units = current.copy()
+
+    if not free.any():
+        reached = base
+    elif remaining <= q @ f:
+        units[free] = f
+        reached = minimum
+    else:
+        weight = current[free].astype(float)
+        if q @ weight <= 0:
+            weight = f.astype(float)
+        if q @ weight <= 0:
+            weight = np.ones(len(q))
+        x = _scale_to(remaining, q, weight, f)
+        u = np.maximum(np.floor(x + 1e-9).astype(np.int64), f)
+        gap = remaining - int(q @ u)
+        frac = x - u
+        # largest remainder: one more grosz on the parts that lost the most to rounding
+        for i in np.argsort(-frac, kind="stable"):
+            if gap <= 0:
+                break
+            if q[i] <= gap:
+                u[i] += 1
+                gap -= int(q[i])
+        if gap:
+            gap = _close_gap(gap, q, u, f, frac)
+        units[free] = u
+        reached = target_gr - gap
+
+    return TargetPrices(units, reached, target_gr, minimum, units != current)
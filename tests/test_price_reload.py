@@ -0,0 +1,188 @@
+"""Price list reload (wycena._apply_reloaded_prices) on an analysed order.
+
+wycena.py builds its Tk window on import, so the functions of the reload
+path are compiled from its source into a namespace with the real costing,
+money and reanalysis modules and small fakes for the table and the log.
+"""
+import ast
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+import costing
+import money
+import reanalysis
+
+RELOAD_FUNCTIONS = {
+    "_apply_reloaded_prices", "_reprice_file_result", "_set_base_costs", "_material_cost",
+    "_part_price_fields", "_file_parts", "_file_price_inputs", "_merge_file_results",
+    "_merged_groups", "_with_table_prices", "_price_change_lines", "format_grosze_pln", "format_pln",
+}
+
+
+class FakeTree:
+    def __init__(self):
+        self.rows = {}
+
+    def insert(self, values):
+        iid = f"I{len(self.rows):03d}"
+        self.rows[iid] = {"values": list(values), "tags": ()}
+        return iid
+
+    def item(self, iid, option=None, **kw):
+        row = self.rows[iid]
+        if kw:
+            row.update({k: list(v) if k == "values" else tuple(v) for k, v in kw.items()})
+            return None
+        return row[option] if option else dict(row)
+
+
+class FakeLog:
+    def __init__(self):
+        self.lines = []
+
+    def log(self, text, level="INFO"):
+        self.lines.append((level, text))
+
+
+def _namespace():
+    with open(os.path.join(ROOT, "wycena.py"), encoding="utf-8") as f:
+        module = ast.parse(f.read())
+    defs = [node for node in module.body if isinstance(node, ast.FunctionDef) and node.name in RELOAD_FUNCTIONS]
+    assert {d.name for d in defs} == RELOAD_FUNCTIONS
+    prices = {("S235", 6.0): 3.20, ("S235", 5.0): 3.10}
+    ns = {
+        "os": os, "np": np, "costing": costing, "money": money, "reanalysis": reanalysis,
+        "PLN_THOUSANDS_SEP": " ", "LOCKED_TAG": "locked", "PRICE_CHANGES_LOGGED": 20,
+        "MATERIALS_FILE": "materials prices.xlsx", "CUTTING_FILE": "cutting prices.xlsx",
+        "analysis_logger": FakeLog(), "tree": FakeTree(), "parts_store": None, "applied_margins": None,
+        "total_sheets": 4, "total_parts_qty": 20, "op_cost_per_sheet": 40.0, "tech_per_order": 50.0,
+        "add_costs_order": 10.0, "material_prices": dict(prices), "cutting_prices": {},
+        "get_material_price": lambda mat, thk: ns["material_prices"].get((mat, thk)),
+        "get_cutting_price": lambda thk, mat, gas: 2.0,
+        "get_cutting_speed": lambda thk, mat, gas: 5.0,
+        "get_cutting_hour_price": lambda thk, mat, gas: 300.0,
+        "get_cutting_utilization": lambda thk, mat, gas: 0.8,
+        "_cutting_entry": lambda thk, mat, gas: (2.0, 5.0, 300.0, 0.8),
+        "_material_price_text": str,
+        "_refresh_price_list_widgets": lambda: None,
+        "_tree_shows_file_results": lambda: True,
+        "update_cost_calculations": lambda: None,
+        "update_total": lambda: None,
+        "store_original_data": lambda: None,
+    }
+    ns["_install_material_tables"] = lambda tables: ns.update(material_prices=tables)
+    exec(compile(ast.Module(defs, type_ignores=[]), "wycena.py", "exec"), ns)
+    return ns
+
+
+def _file_result(ns, name, thk, count):
+    key = ("S235", "S235", thk, "O")
+    fields = ns["_part_price_fields"](*key)
+    parts = [dict(fields, id=i + 1, name=f"{name}-{i + 1}", material="S235", thickness=thk, qty=4,
+                  adj_weight=1.5 + i, cut_length=2.0, contours_qty=3, rate_per_contour=0.5,
+                  marking_length=0.0, rate_per_marking_length=0.0, defilm_length=0.0,
+                  rate_per_defilm_length=0.0, file_name=name, bending_per_unit=0.0,
+                  additional_per_unit=0.0) for i in range(count)]
+    costs = ns["_set_base_costs"](parts)
+    return {"file_name": name, "parts": parts, "part_count": count, "price_key": key,
+            "price_inputs": ns["_file_price_inputs"](*key), "material_cost": ns["_material_cost"](costs, parts),
+            "group": ("S235", thk, [(p["name"], p["cost_per_unit"], p["qty"]) for p in parts]),
+            "gas_bucket": "O", "cut_time": 1.0, "sheets": 2, "parts_qty": 4 * count, "layouts": [],
+            "margin": {"total_area": 1.0, "total_cutting": 1.0, "material_margin": 0.0, "cutting_margin": 0.0}}
+
+
+def _analysed_order():
+    """a.xlsx (3 parts, 6 mm) and b.xlsx (2 parts, 5 mm) as after an analysis."""
+    ns = _namespace()
+    results = [_file_result(ns, "a.xlsx", 6.0, 3), _file_result(ns, "b.xlsx", 5.0, 2)]
+    order = ns["_merge_file_results"](results, ns["op_cost_per_sheet"], ns["tech_per_order"], ns["add_costs_order"])
+    ns["file_results"] = {res["file_name"]: res for res in results}
+    ns["all_parts"] = order["parts"]
+    ns["order_prices"] = money.PriceTable.from_parts(order["parts"])
+    index = 0
+    for res in results:
+        res["iids"] = []
+        for _ in range(res["part_count"]):
+            res["iids"].append(ns["tree"].insert(ns["_with_table_prices"]([index + 1] + [""] * 10, index)))
+            index += 1
+    return ns
+
+
+def _reload_material(ns, thickness, price):
+    tables = dict(ns["material_prices"])
+    tables[("S235", thickness)] = price
+    ns["_apply_reloaded_prices"]({"material": tables})
+
+
+def test_reload_reprices_only_the_affected_file():
+    ns = _analysed_order()
+    before = ns["order_prices"].unit.copy()
+    parts_a = ns["file_results"]["a.xlsx"]["parts"]
+
+    _reload_material(ns, 5.0, 3.60)
+
+    prices = ns["order_prices"]
+    assert prices.unit[:3].tolist() == before[:3].tolist()
+    assert all(prices.unit[3:] > before[3:])
+    assert ns["file_results"]["a.xlsx"]["parts"] is parts_a
+    # rows of b.xlsx cost what a fresh analysis at the new prices gives
+    fresh = _namespace()
+    fresh["material_prices"][("S235", 5.0)] = 3.60
+    expected = _file_result(fresh, "b.xlsx", 5.0, 2)["parts"]
+    extra, op = costing.overhead_per_part(4, 20, 40.0, 50.0, 10.0)
+    assert prices.unit[3:].tolist() == [money.grosz(money.round_pln(p["cost_per_unit"] + extra + op))
+                                        for p in expected]
+    assert ns["all_parts"][3]["base_price_per_kg"] == 3.60
+    assert ns["file_results"]["b.xlsx"]["price_inputs"][0] == 3.60
+    assert reanalysis.price_changes(ns["file_results"], ns["_file_price_inputs"]) == []
+
+
+def test_edited_and_locked_rows_survive_a_reload():
+    ns = _analysed_order()
+    prices, tree = ns["order_prices"], ns["tree"]
+    iids_a, iids_b = ns["file_results"]["a.xlsx"]["iids"], ns["file_results"]["b.xlsx"]["iids"]
+    # a.xlsx: row 1 edited (qty, bending), row 2 locked at a hand-set price
+    prices.set(1, qty=9, bending=1250)
+    prices.set(2, unit=4321)
+    tree.item(iids_a[2], tags=["locked"])
+    # b.xlsx: row 4 locked
+    prices.set(4, unit=9999)
+    tree.item(iids_b[1], tags=["locked"])
+    before = {c: getattr(prices, c).copy() for c in ("qty", "unit", "bending", "additional")}
+
+    _reload_material(ns, 5.0, 3.60)
+
+    for column, old in before.items():
+        assert getattr(prices, column)[:3].tolist() == old[:3].tolist(), column
+    assert prices.unit[3] != before["unit"][3]  # b.xlsx, not locked: re-priced
+    assert prices.unit[4] == 9999               # b.xlsx, locked: kept
+    assert tree.item(iids_a[2], "tags") == ("locked",)
+    assert tree.item(iids_b[1], "tags") == ("locked",)
+    assert tree.item(iids_b[0], "values")[6] == ns["format_grosze_pln"](prices.unit[3])
+
+
+def test_reload_keeps_applied_margins_on_repriced_rows():
+    ns = _analysed_order()
+    ns["applied_margins"] = (20.0, 10.0)
+
+    _reload_material(ns, 5.0, 3.60)
+
+    extra, op = costing.overhead_per_part(4, 20, 40.0, 50.0, 10.0)
+    arrays = costing.PartCostArrays.from_parts(ns["all_parts"][3:])
+    expected = money.to_grosze(costing.unit_costs(arrays, 20.0, 10.0, extra, op))
+    assert ns["order_prices"].unit[3:].tolist() == expected.tolist()
+
+
+def test_reload_without_price_changes_touches_nothing():
+    ns = _analysed_order()
+    before = ns["order_prices"].unit.copy()
+
+    _reload_material(ns, 8.0, 5.00)  # a thickness no file uses
+
+    assert ns["order_prices"].unit.tolist() == before.tolist()
+    assert not any(level == "SUCCESS" for level, _ in ns["analysis_logger"].lines)
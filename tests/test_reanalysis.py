@@ -0,0 +1,69 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import money
+import reanalysis
+
+
+def _result(name, key, prices, count=1):
+    return {'file_name': name, 'signature': (100, 1), 'price_key': key, 'price_inputs': prices[key],
+            'part_count': count}
+
+
+def test_price_changes_names_the_files_of_a_changed_row():
+    keys = {'a.xlsx': ('S235', 6.0), 'b.xlsx': ('S235', 5.0), 'c.xlsx': ('1.4301', 2.0)}
+    prices = {('S235', 6.0): 3.20, ('S235', 5.0): 3.10, ('1.4301', 2.0): 14.50}
+    results = {f: _result(f, key, prices) for f, key in keys.items()}
+
+    assert reanalysis.price_changes(results, lambda *key: prices[key]) == []
+    prices[('S235', 5.0)] = 3.45  # one row of the material price list changes
+    assert reanalysis.price_changes(results, lambda *key: prices[key]) == ['b.xlsx']
+
+
+def test_plan_rereads_changed_and_new_files():
+    previous = {'a.xlsx': {'file_name': 'a.xlsx'}, 'b.xlsx': {'file_name': 'b.xlsx'},
+                'gone.xlsx': {'file_name': 'gone.xlsx'}}
+    plan = reanalysis.plan(['a.xlsx', 'b.xlsx', 'new.xlsx'], previous, lambda f, res: f != 'b.xlsx')
+
+    assert plan.to_read == ['b.xlsx', 'new.xlsx']
+    assert list(plan.reused) == ['a.xlsx']
+    assert plan.stale == [previous['b.xlsx'], previous['gone.xlsx']]
+
+
+def test_full_run_reads_every_file():
+    plan = reanalysis.plan(['a.xlsx', 'b.xlsx'], {}, lambda f, res: True)
+
+    assert plan.to_read == ['a.xlsx', 'b.xlsx']
+    assert plan.reused == {} and plan.stale == []
+
+
+def test_incremental_run_carries_edited_rows_of_reused_files():
+    # a.xlsx (3 parts) and c.xlsx (2 parts) analysed; row 1 of a was edited and row 4 of c margined
+    old = {'a.xlsx': {'file_name': 'a.xlsx', 'part_count': 3}, 'c.xlsx': {'file_name': 'c.xlsx', 'part_count': 2}}
+    previous = money.PriceTable([1, 1, 1, 1, 1], [100, 200, 300, 400, 500], [0] * 5, [0] * 5)
+    previous.set(1, qty=7, bending=150)
+    previous.set(4, unit=575)
+
+    # b.xlsx (1 part) is added between them; c.xlsx changed on disk and is re-read
+    new_results = [old['a.xlsx'], {'file_name': 'b.xlsx', 'part_count': 1}, old['c.xlsx']]
+    fresh = money.PriceTable([1] * 6, [101, 201, 301, 900, 401, 501], [0] * 6, [0] * 6)
+    prices = reanalysis.carry_prices(fresh, previous, reanalysis.spans(old.values()),
+                                     reanalysis.spans(new_results), ['a.xlsx'])
+
+    assert prices.qty.tolist() == [1, 7, 1, 1, 1, 1]
+    assert prices.unit.tolist() == [100, 200, 300, 900, 401, 501]
+    assert prices.bending.tolist() == [0, 150, 0, 0, 0, 0]
+    assert fresh.unit.tolist() == [101, 201, 301, 900, 401, 501]  # not modified in place
+
+
+def test_reprice_rows_keeps_locked_rows_and_edits():
+    prices = money.PriceTable([1, 2, 3, 4], [100, 200, 300, 400], [0, 50, 0, 0], [0, 0, 0, 0])
+
+    rows = reanalysis.reprice_rows(prices, (1, 3), [210, 310, 410], keep=[2])
+
+    assert rows == [1, 3]
+    assert prices.unit.tolist() == [100, 210, 300, 410]
+    assert prices.qty.tolist() == [1, 2, 3, 4]
+    assert prices.bending.tolist() == [0, 50, 0, 0]
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+thumbnails.py - On-demand part thumbnails read straight from the export zips.
+
+The reader only records which zip member holds the picture of each part
+(see CypNestExport.thumbnail_members); parts carry a (file, member)
+reference and the PNG is read when the Treeview, the DOCX or an XLSX
+report actually needs it. Decoded images are kept in a small LRU keyed by
+file, member and the file's (size, mtime_ns), so a re-exported file never
+shows an old picture; inline PNGs are keyed by a hash of their bytes.
+
+A source is either such a (path, member) reference or PNG bytes kept
+inline (projects loaded from a .lpf file).
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+from PIL import Image
+
+ThumbnailSource = Union[Tuple[str, str], bytes]
+
+
+class ThumbnailStore:
+    """Reads thumbnails on demand, with an LRU of ``max_images`` decoded images."""
+
+    def __init__(self, max_images: int = 128):
+        self.max_images = max_images
+        self._images: "OrderedDict[tuple, Image.Image]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.reads = 0
+
+    def png(self, source: Optional[ThumbnailSource]) -> Optional[bytes]:
+        """PNG bytes of ``source``; None when there is none or the file is gone."""
+        if not source:
+            return None
+        if isinstance(source, (bytes, bytearray)):
+            return bytes(source)
+        path, member = source
+        try:
+            with zipfile.ZipFile(path) as zf:
+                data = zf.read(member)
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return None
+        self.reads += 1
+        return data
+
+    def image(self, source: Optional[ThumbnailSource]) -> Optional[Image.Image]:
+        """Decoded image of ``source`` (shared - copy before modifying it)."""
+        if not source:
+            return None
+        key = self._key(source)
+        with self._lock:
+            img = self._images.get(key)
+            if img is not None:
+                self._images.move_to_end(key)
+                return img
+        data = self.png(source)
+        if data is None:
+            return None
+        try:
+            img = Image.open(io.BytesIO(data))
+            img.load()
+        except Exception:
+            return None
+        with self._lock:
+            self._images[key] = img
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+        return img
+
+    @staticmethod
+    def _key(source: ThumbnailSource) -> tuple:
+        if isinstance(source, (bytes, bytearray)):
+            # by content: a freed bytes object's id may be reused for another picture
+            return ("inline", hashlib.sha1(source).digest())
+        path, member = source
+        try:
+            st = os.stat(path)
+            return (path, member, st.st_size, st.st_mtime_ns)
+        except OSError:
+            return (path, member, None, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._images.clear()
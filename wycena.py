@@ -44,6 +44,28 @@ from openpyxl.drawing.spreadsheet_drawing import AnchorMarker, TwoCellAnchor
 from openpyxl.utils import get_column_letter
 from openpyxl.utils.units import pixels_to_EMU
 import base64, json
+from importers import read_exports, sniff
+from cypnest_reader import read_export_header
+from parse_cache import ParseCache
+from folder_watcher import AutoIngest, FileReloader
+from order_batch import REPORT_DIR, discover_order_folders, order_exports, write_summary_index
+from thumbnails import ThumbnailStore
+from parts_store import PartsStore, StoredParts
+import reanalysis
+from price_index import POLICIES as PRICE_POLICIES, PriceIndex
+import price_snapshot
+from price_history import MaterialPriceHistory, MaterialQuote, parse_date
+import plate_optimizer
+from margin_policy import MarginCurve, MarginPolicy
+import costing
+import target_price
+import money
+import math
+import time
+import numpy as np
+import queue
+import threading
+from collections import OrderedDict
 
 # Global variables for filtering and sorting
 original_tree_data = []
@@ -61,6 +83,38 @@ def _b64_decode(s: str) -> bytes:
     except Exception:
         return b""
 
+def _project_settings():
+    """Fixed costs, rates and margin fields as stored in project files."""
+    return {
+        "fixed_costs": {
+            "op_cost_per_sheet": op_cost_entry.get(),
+            "tech_order": tech_order_entry.get(),
+            "add_order": add_order_cost_entry.get(),
+        },
+        "rates": {
+            "O_rate": oxygen_rate_entry.get(),
+            "N_rate": nitrogen_rate_entry.get(),
+            "ALN_rate": al_nitrogen_rate_entry.get(),
+            "O_rate_tkw": oxygen_rate_entry_TKW.get(),
+            "N_rate_tkw": nitrogen_rate_entry_TKW.get(),
+            "ALN_rate_tkw": al_nitrogen_rate_entry_TKW.get(),
+            "bend_percent_tkw": bending_percent_entry_TKW.get(),
+            "min_margin_tkw": min_margin_tkw_entry.get(),
+            "quantity_tiers": quantity_tiers_entry.get(),
+        },
+        "margins": {
+            "material": material_margin_var.get(),
+            "cutting": cutting_margin_var.get(),
+            "min_area": min_area_var.get(),
+            "max_area": max_area_var.get(),
+            "min_cut_len": min_cutting_var.get(),
+            "max_cut_len": max_cutting_var.get(),
+            "area_curve": area_curve_var.get(),
+            "cut_curve": cut_curve_var.get(),
+            "policy": _margin_policy().to_dict(),
+        },
+    }
+
 def save_project_ui():
     """Ask for file and save current state (parts, calculations, margins, texts, pictures)."""
 
@@ -96,24 +150,26 @@ def save_project_ui():
         # collect parts from tree + all_parts (thumbs)
         parts_payload = []
         tree_items = list(tree.get_children())
-        for i, iid in enumerate(tree_items):
+        for iid in tree_items:
             # pomijamy wiersz TOTAL jeśli jest
             if iid == total_row_iid:
                 continue
             vals = list(tree.item(iid, "values"))
             # Safeguard dla indeksów
             vals += [""] * (11 - len(vals))
-            # domyślne dane z 'all_parts'
+            # dane części (po kolumnie Nr) i ceny z order_prices
+            i = _row_part_index(vals)
+            priced = i is not None and i < len(order_prices)
             thumb_b64 = ""
-            if i < len(all_parts):
-                thumb_b64 = _b64_encode(all_parts[i].get("thumb_data") or b"")
+            if i is not None:
+                thumb_b64 = _b64_encode(_part_thumb_png(all_parts[i]) or b"")
             parts_payload.append({
                 "values": vals,                # kolumny TreeView
                 "thumb_b64": thumb_b64,        # miniatura (base64)
-                "cost_per_unit": all_parts[i].get("cost_per_unit") if i < len(all_parts) else None,
-                "qty": all_parts[i].get("qty") if i < len(all_parts) else None,
-                "bending_per_unit": all_parts[i].get("bending_per_unit") if i < len(all_parts) else None,
-                "additional_per_unit": all_parts[i].get("additional_per_unit") if i < len(all_parts) else None,
+                "cost_per_unit": money.to_pln(order_prices.unit[i]) if priced else None,
+                "qty": int(order_prices.qty[i]) if priced else None,
+                "bending_per_unit": money.to_pln(order_prices.bending[i]) if priced else None,
+                "additional_per_unit": money.to_pln(order_prices.additional[i]) if priced else None,
             })
 
         payload = {
@@ -134,28 +190,7 @@ def save_project_ui():
                 "preceding": preceding_text_var.get("1.0", "end-1c"),
                 "finishing": finishing_text_var.get("1.0", "end-1c"),
             },
-            "fixed_costs": {
-                "op_cost_per_sheet": op_cost_entry.get(),
-                "tech_order": tech_order_entry.get(),
-                "add_order": add_order_cost_entry.get(),
-            },
-            "rates": {
-                "O_rate": oxygen_rate_entry.get(),
-                "N_rate": nitrogen_rate_entry.get(),
-                "ALN_rate": al_nitrogen_rate_entry.get(),
-                "O_rate_tkw": oxygen_rate_entry_TKW.get(),
-                "N_rate_tkw": nitrogen_rate_entry_TKW.get(),
-                "ALN_rate_tkw": al_nitrogen_rate_entry_TKW.get(),
-                "bend_percent_tkw": bending_percent_entry_TKW.get(),
-            },
-            "margins": {
-                "material": material_margin_var.get(),
-                "cutting": cutting_margin_var.get(),
-                "min_area": min_area_var.get(),
-                "max_area": max_area_var.get(),
-                "min_cut_len": min_cutting_var.get(),
-                "max_cut_len": max_cutting_var.get(),
-            },
+            **_project_settings(),
             "calculated": {
                 "oxygen_cutting_time": oxygen_cutting_time,
                 "nitrogen_cutting_time": nitrogen_cutting_time,
@@ -174,7 +209,9 @@ def save_project_ui():
                     "total_for_correction": total_all_costs_entry.get(),
                 }
             },
-            "parts": parts_payload
+            "parts": parts_payload,
+            # nests from the Result sheets; part_index refers to the order of "parts"
+            "plate_layouts": plate_layouts,
         }
 
         with open(path, "w", encoding="utf-8") as f:
@@ -230,6 +267,8 @@ def load_project_ui():
         nitrogen_rate_entry_TKW.delete(0,"end"); nitrogen_rate_entry_TKW.insert(0, payload["rates"].get("N_rate_tkw", "412,50"))
         al_nitrogen_rate_entry_TKW.delete(0,"end"); al_nitrogen_rate_entry_TKW.insert(0, payload["rates"].get("ALN_rate_tkw", "487,50"))
         bending_percent_entry_TKW.delete(0,"end"); bending_percent_entry_TKW.insert(0, payload["rates"].get("bend_percent_tkw", "75,00"))
+        min_margin_tkw_entry.delete(0,"end"); min_margin_tkw_entry.insert(0, payload["rates"].get("min_margin_tkw", "0,00"))
+        quantity_tiers_entry.delete(0,"end"); quantity_tiers_entry.insert(0, payload["rates"].get("quantity_tiers", ""))
 
         # margins + ranges
         material_margin_var.set(payload["margins"].get("material", "0,00"))
@@ -238,10 +277,12 @@ def load_project_ui():
         max_area_var.set(payload["margins"].get("max_area", "1,00"))
         min_cutting_var.set(payload["margins"].get("min_cut_len", "0,00"))
         max_cutting_var.set(payload["margins"].get("max_cut_len", "5000,00"))
+        area_curve_var.set(payload["margins"].get("area_curve", ""))
+        cut_curve_var.set(payload["margins"].get("cut_curve", ""))
 
         # calculated (restore labels, times, totals)
         global oxygen_cutting_time, nitrogen_cutting_time, aluminum_nitrogen_cutting_time, total_material_cost
-        global total_row_iid, all_parts, total_price_per_order
+        global total_row_iid, all_parts, total_price_per_order, plate_layouts
 
         calc = payload.get("calculated", {})
         oxygen_cutting_time = float(calc.get("oxygen_cutting_time", 0.0))
@@ -265,24 +306,19 @@ def load_project_ui():
         # Rebuild tree + all_parts + thumbnails
         for item in tree.get_children():
             tree.delete(item)
-        thumbnail_imgs.clear()
+        _clear_row_thumbnails()
         all_parts = []
 
         for p in payload.get("parts", []):
             vals = p.get("values", [""]*11)
             # wstaw do tree
             iid = tree.insert('', 'end', values=vals)
-            # odtwórz miniaturę
+            # miniatura wczytywana dopiero gdy wiersz jest widoczny
             b = _b64_decode(p.get("thumb_b64", ""))
-            if b:
-                try:
-                    img = ImageTk.PhotoImage(Image.open(io.BytesIO(b)).resize((80, 80)))
-                    tree.item(iid, image=img)
-                    thumbnail_imgs.append(img)  # prevent GC
-                except Exception:
-                    pass
+            _set_row_thumbnail(iid, b)
             # odtwórz all_parts (tyle ile potrzebujemy do przeliczeń i zapisu)
             all_parts.append({
+                "tree_values": vals,  # wiersz tabeli (filtry przy dyskowym magazynie części)
                 "thumb_data": b if b else None,
                 "cost_per_unit": p.get("cost_per_unit"),
                 "qty": p.get("qty"),
@@ -290,6 +326,11 @@ def load_project_ui():
                 "additional_per_unit": p.get("additional_per_unit"),
                 # można dodać inne pola według potrzeb analizy
             })
+        all_parts = _adopt_parts(all_parts)
+        _reset_order_prices()
+
+        plate_layouts = payload.get("plate_layouts", [])
+        _index_plate_layouts()
 
         # Dodaj / przelicz wiersz sumy
         total_row_iid = None
@@ -313,21 +354,24 @@ try:
 except Exception:
     pass
 
+# thousands separator of the locale ('' when pl_PL is not available)
+PLN_THOUSANDS_SEP = locale.localeconv().get('thousands_sep', '')
+
+def format_grosze_pln(grosze):
+    """Formats an amount in grosze to PLN with a comma and thousands grouping."""
+    return money.format_grosze(grosze, PLN_THOUSANDS_SEP)
+
 def format_pln(value):
-    """Formats the value to PLN with a comma and thousands grouping."""
+    """Formats the value to PLN with a comma and thousands grouping (rounded half up to the grosz)."""
     try:
-        s = locale.format_string('%.2f', float(value), grouping=True)
-        return s.replace('.', ',')
+        return format_grosze_pln(money.grosz(float(value)))
     except Exception:
-        try:
-            return f"{float(value):.2f}".replace('.', ',')
-        except Exception:
-            return "0,00"
+        return "0,00"
 
 def format_excel_number(value):
     """Format number for Excel with Polish notation (comma as decimal separator)"""
     try:
-        return f"{float(value):.2f}".replace('.', ',')
+        return money.format_grosze(money.grosz(float(value)))
     except:
         return "0,00"
 
@@ -367,7 +411,9 @@ class AnalysisLogger:
     def __init__(self, text_widget):
         self.text_widget = text_widget
         self.phase_counter = 0
-        
+        # messages logged from worker threads, written by flush() on the Tk thread
+        self.pending = queue.Queue()
+
     def clear(self):
         """Clear the log widget"""
         self.text_widget.config(state=tk.NORMAL)
@@ -377,9 +423,23 @@ class AnalysisLogger:
         
     def log(self, message, level="INFO"):
         """Log a message with specified level (INFO, WARNING, ERROR, SUCCESS, PHASE)"""
-        self.text_widget.config(state=tk.NORMAL)
-        
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
+        if threading.current_thread() is not threading.main_thread():
+            self.pending.put((timestamp, message, level))
+            return
+        self._write(timestamp, message, level)
+
+    def flush(self):
+        """Writes messages queued by worker threads (call on the Tk thread)."""
+        while True:
+            try:
+                timestamp, message, level = self.pending.get_nowait()
+            except queue.Empty:
+                return
+            self._write(timestamp, message, level)
+
+    def _write(self, timestamp, message, level):
+        self.text_widget.config(state=tk.NORMAL)
         
         # Format and add message based on level
         if level == "PHASE":
@@ -410,12 +470,22 @@ class AnalysisLogger:
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 MATERIALS_FILE = os.path.join(SCRIPT_DIR, "materials prices.xlsx")
 CUTTING_FILE   = os.path.join(SCRIPT_DIR, "cutting prices.xlsx")
+PARSE_CACHE_DIR = os.path.join(SCRIPT_DIR, ".parse_cache")
 material_prices = {}  # (MAT, THK)-> PLN/kg
 cutting_prices  = {}  # (THK, MAT, GAS)-> PLN/m
+# Compiled lookups over the two dicts (price_index.py), rebuilt by the loaders
+CUTTING_FIELDS = ("price", "speed", "hour_price", "utilization")
+material_index = PriceIndex(("price",))
+cutting_index = PriceIndex(CUTTING_FIELDS)
+price_policy = "exact"  # lookup for a thickness that is not in the price list
+# Every row of the material list with format/supplier/date (price_history.py)
+material_history = MaterialPriceHistory()
+price_date = None  # offer date: material prices as of that day instead of the last rows
 _mat_set, _thk_set, _gas_set = set(), set(), set()
 
 # Global variables for shared data
 all_parts = []
+parts_store = None  # PartsStore behind all_parts when "Disk parts store" is ticked
 last_groups = []
 last_total_cost = 0.0
 last_folder_path = ""
@@ -436,6 +506,34 @@ nitrogen_cutting_time = 0.0
 aluminum_nitrogen_cutting_time = 0.0
 total_material_cost = 0.0
 
+# Per-file results of the last analysis (file name -> dict), reused by incremental re-analysis
+file_results = {}
+
+# qty and unit / bending / additional prices [gr] of every part of all_parts (money.PriceTable);
+# the table shows these values, edits go into it and all totals are summed from it
+order_prices = money.PriceTable([], [], [], [])
+# (material, cutting) margins [%] of the last UPDATE WITH DYNAMIC MARGINS since
+# order_prices was built; files re-priced after a price list reload get them too
+applied_margins = None
+
+# Running folder analysis (dict, see analyze_xlsx_folder) or None
+analysis_job = None
+batch_job = None  # multi-order batch in progress (batch_analyze_orders)
+BATCH_MAX_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))  # parser processes shared by all orders
+ANALYSIS_POLL_MS = 50
+
+def _table_busy():
+    """True while an analysis streams rows into the table. Their Nr / SubNr are
+    not final until the merge, so actions that map rows to all_parts wait for it."""
+    if analysis_job is None:
+        return False
+    analysis_logger.log("Analysis running - prices can be edited when it has finished", "WARNING")
+    return True
+
+# Plate layouts (one per CypNest ResultN sheet) of the parts in all_parts
+plate_layouts = []   # list of dicts, see _layout_record()
+plates_by_part = {}  # index in all_parts -> [(index in plate_layouts, pieces on one plate)]
+
 # ---- GUI ----
 root = tk.Tk()
 root.title("Cost Report Generator – AVE 1.0 from 2025.09.08")
@@ -467,6 +565,8 @@ min_area_var = tk.StringVar(value="0,00")          # Minimum area for 250% margi
 max_area_var = tk.StringVar(value="1,00")          # Maximum area for 0% margin (m²)
 min_cutting_var = tk.StringVar(value="0,00")       # Minimum cutting length for 200% margin (mm)
 max_cutting_var = tk.StringVar(value="5000,00")    # Maximum cutting length for 0% margin (mm)
+area_curve_var = tk.StringVar(value="")            # custom area curve "m²:%; ..." (empty = min/max ramp)
+cut_curve_var = tk.StringVar(value="")             # custom cut length curve "mm:%; ..." (empty = min/max ramp)
 
 default_logo_path = os.path.join(SCRIPT_DIR, "Logo.jpg")
 if os.path.exists(default_logo_path):
@@ -509,7 +609,7 @@ ttk.Button(log_frame, text="Clear Log", command=analysis_logger.clear).pack(pady
 def update_file_list(folder_path):
     file_list.delete(0, tk.END)
     try:
-        xlsx_files = [f for f in os.listdir(folder_path) if f.lower().endswith(".xlsx")]
+        xlsx_files = sorted(f for f in os.listdir(folder_path) if f.lower().endswith(".xlsx"))
         for f in xlsx_files:
             file_list.insert(tk.END, f)
         analysis_logger.log(f"Found {len(xlsx_files)} XLSX files in folder", "INFO")
@@ -522,6 +622,8 @@ def select_folder():
         folder_var.set(p)
         update_file_list(p)
         analysis_logger.log(f"Selected folder: {p}", "SUCCESS")
+        if watch_folder_var.get():
+            start_folder_watch()
 
 # Shift all row numbers down by 1 to account for the log panel
 ttk.Label(left_frame, text="Select folder:").grid(row=1, column=0, sticky="e")
@@ -582,9 +684,20 @@ ttk.Entry(margin_frame, textvariable=min_cutting_var, width=15).grid(row=2, colu
 ttk.Label(margin_frame, text="Max length for 0% margin [mm]:").grid(row=2, column=2, sticky="e")
 ttk.Entry(margin_frame, textvariable=max_cutting_var, width=15).grid(row=2, column=3, sticky="w", padx=(5,0))
 
+# Custom curves (piecewise linear "x:margin; ..." or "step x:margin; ...") replace the ramps above
+ttk.Label(margin_frame, text="Area curve [m²:%]:").grid(row=3, column=0, sticky="e")
+area_curve_entry = ttk.Entry(margin_frame, textvariable=area_curve_var, width=40)
+area_curve_entry.grid(row=3, column=1, columnspan=3, sticky="we", padx=(5,0))
+area_curve_entry.bind("<FocusOut>", lambda e: _validate_margin_curve(area_curve_var, "Area"))
+
+ttk.Label(margin_frame, text="Cut length curve [mm:%]:").grid(row=4, column=0, sticky="e")
+cut_curve_entry = ttk.Entry(margin_frame, textvariable=cut_curve_var, width=40)
+cut_curve_entry.grid(row=4, column=1, columnspan=3, sticky="we", padx=(5,0))
+cut_curve_entry.bind("<FocusOut>", lambda e: _validate_margin_curve(cut_curve_var, "Cut length"))
+
 # Display calculated averages
 avg_display_frame = tk.Frame(margin_frame, bg="#2c2c2c")
-avg_display_frame.grid(row=3, column=0, columnspan=4, pady=(10,5), sticky="ew")
+avg_display_frame.grid(row=5, column=0, columnspan=4, pady=(10,5), sticky="ew")
 
 ttk.Label(avg_display_frame, text="Calculated avg material margin:", font=("Arial", 9, "bold")).pack(side="left")
 avg_material_label = ttk.Label(avg_display_frame, text="0.00%", foreground="lime", font=("Arial", 9, "bold"))
@@ -698,7 +811,7 @@ tree.heading("11", text="Cutting length ↕"); tree.column("11", minwidth=50, wi
 
 # Add scrollbar for treeview
 scrollbar = ttk.Scrollbar(subpanel1, orient="vertical", command=tree.yview)
-tree.configure(yscrollcommand=scrollbar.set)
+tree.configure(yscrollcommand=lambda first, last: _on_tree_scroll(first, last))
 tree.pack(side="left", fill="both", expand=True)
 scrollbar.pack(side="right", fill="y")
 
@@ -706,11 +819,16 @@ scrollbar.pack(side="right", fill="y")
 original_tree_data = []
 current_sort_column = None
 current_sort_reverse = False
+# With the disk parts store the filters query the store instead of keeping
+# original_tree_data; only the row tags (locked rows) are kept: part index -> tags
+stored_row_tags = {}
 
 # Sorting functionality
 def sort_treeview(col):
     """Sort treeview by clicked column"""
     global current_sort_column, current_sort_reverse, total_row_iid
+    if _table_busy():
+        return
     
     # Toggle sort direction if same column clicked
     if current_sort_column == col:
@@ -727,22 +845,23 @@ def sort_treeview(col):
     
     # Determine column index (columns are "1", "2", etc.)
     col_index = int(col) - 1
+    # quantity and prices come from the grosze table, not from the shown text
+    table_columns = {5: order_prices.qty, 6: order_prices.unit, 7: order_prices.bending, 8: order_prices.additional}
     
     # Sort items
     def get_sort_key(item_tuple):
         values = item_tuple[1]['values']
+        index = _row_part_index(values)
+        if col_index == 0 and index is not None:
+            return (0, index)
+        if col_index in table_columns and index is not None and index < len(order_prices):
+            return (0, int(table_columns[col_index][index]))
         if col_index < len(values):
             val = values[col_index]
-            # Try to convert to number for numeric columns
-            if col_index in [0, 1, 4, 5, 6, 7, 8, 9, 10]:  # Numeric columns
-                try:
-                    # Remove formatting and convert to float
-                    val_str = str(val).replace(',', '.').replace(' ', '')
-                    return float(val_str) if val_str else 0
-                except:
-                    return 0
-            return str(val).lower()
-        return ""
+            if col_index in [1, 4, 9, 10]:  # Numeric columns
+                return (0, _parse_float(val) or 0)
+            return (1, str(val).lower())
+        return (1, "")
     
     items.sort(key=get_sort_key, reverse=current_sort_reverse)
     
@@ -769,16 +888,27 @@ def sort_treeview(col):
 for col in columns:
     tree.heading(col, command=lambda c=col: sort_treeview(c))
 
+def _filters_use_store():
+    """True when all_parts is in the disk parts store: the filters then read the store."""
+    return parts_store is not None and isinstance(all_parts, StoredParts)
+
 def store_original_data():
     """Store original tree data for filtering"""
     global original_tree_data, total_row_iid
     original_tree_data = []
+    stored_row_tags.clear()
     for item in tree.get_children():
         if item != total_row_iid:
             item_data = tree.item(item)
+            if _filters_use_store():
+                # rows are rebuilt from the store, only their tags are kept
+                index = _row_part_index(item_data['values'])
+                if index is not None and item_data.get('tags'):
+                    stored_row_tags[index] = tuple(item_data['tags'])
+                continue
             original_tree_data.append({
                 'values': item_data['values'],
-                'image': item_data.get('image', ''),
+                'thumb': tree_thumb_sources.get(item),
                 'tags': item_data.get('tags', ()),
             })
 
@@ -789,8 +919,18 @@ def update_original_data(item):
     # Get the current data from the tree item
     item_data = tree.item(item)
     current_values = item_data['values']
-    current_image = item_data.get('image', '')
+    current_thumb = tree_thumb_sources.get(item)
     current_tags = item_data.get('tags', ())
+
+    if _filters_use_store():
+        # values are rebuilt from the store and order_prices; only the tags are kept
+        index = _row_part_index(current_values)
+        if index is not None:
+            if current_tags:
+                stored_row_tags[index] = tuple(current_tags)
+            else:
+                stored_row_tags.pop(index, None)
+        return
     
     # Use Nr (column 1) and SubNr (column 2) as unique key (assuming they are not editable and unique)
     key = (current_values[0], current_values[1])
@@ -799,15 +939,31 @@ def update_original_data(item):
     for data_dict in original_tree_data:
         if tuple(data_dict['values'][0:2]) == key:
             data_dict['values'] = list(current_values)
-            data_dict['image'] = current_image
+            data_dict['thumb'] = current_thumb
             data_dict['tags'] = current_tags
             break
 
+def _filter_rows():
+    """Rows the table filters choose from, as dicts like original_tree_data.
+
+    With the disk parts store every row is built from a store query when it
+    is needed - prices from order_prices, tags from stored_row_tags - so no
+    copy of the rows is kept."""
+    if not _filters_use_store():
+        yield from original_tree_data
+        return
+    for part in parts_store.iter_parts():
+        index = part.index
+        values = _with_table_prices(part.get('tree_values') or _part_tree_values(index + 1, part), index)
+        yield {'values': values, 'thumb': _part_thumb_source(part), 'tags': stored_row_tags.get(index, ())}
+
 def apply_filters():
     """Apply filters to tree data"""
     global total_row_iid, original_tree_data
+    if _table_busy():
+        return
     
-    if not original_tree_data:
+    if not original_tree_data and not _filters_use_store():
         store_original_data()
     
     # Get filter values
@@ -818,11 +974,12 @@ def apply_filters():
     # Clear tree except total row
     for item in tree.get_children():
         if item != total_row_iid:
+            _forget_row_thumbnail(item)
             tree.delete(item)
     
     # Apply filters and repopulate
     filtered_count = 0
-    for data in original_tree_data:
+    for data in _filter_rows():
         values = data['values']
         
         # Apply filters
@@ -842,8 +999,7 @@ def apply_filters():
         
         if show:
             item = tree.insert('', 'end', values=values)
-            if data.get('image'):
-                tree.item(item, image=data['image'])
+            _set_row_thumbnail(item, data.get('thumb'))
             if data.get('tags'):
                 tree.item(item, tags=data['tags'])
             filtered_count += 1
@@ -912,7 +1068,7 @@ def show_advanced_filter():
     
     # Get unique names
     names = set()
-    for data in original_tree_data:
+    for data in _filter_rows():
         if len(data['values']) > 2:
             names.add(str(data['values'][2]))
     
@@ -978,11 +1134,12 @@ def show_advanced_filter():
         # Clear tree
         for item in tree.get_children():
             if item != total_row_iid:
+                _forget_row_thumbnail(item)
                 tree.delete(item)
         
         # Apply filters
         filtered_count = 0
-        for data in original_tree_data:
+        for data in _filter_rows():
             values = data['values']
             show = True
             
@@ -1022,8 +1179,7 @@ def show_advanced_filter():
             
             if show:
                 item = tree.insert('', 'end', values=values)
-                if data.get('image'):
-                    tree.item(item, image=data['image'])
+                _set_row_thumbnail(item, data.get('thumb'))
                 filtered_count += 1
         
         # Move total row to end
@@ -1108,7 +1264,7 @@ buttons_frame.grid_columnconfigure(1, weight=1)
 def edit_cell(event):
     item = tree.identify_row(event.y)
     column = tree.identify_column(event.x)
-    if not item or not column:
+    if not item or not column or _table_busy():
         return
     col_index = int(column[1:]) - 1
     if col_index in [5, 6, 7, 8]:
@@ -1118,10 +1274,29 @@ def edit_cell(event):
         e.insert(0, tree.item(item, 'values')[col_index])
         e.focus()
         def save_edit(_):
+            if not e.winfo_exists():  # <Return> already saved, this is the <FocusOut>
+                return
+            text = e.get()
+            e.destroy()
             vals = list(tree.item(item, 'values'))
-            vals[col_index] = e.get()
+            index = _row_part_index(vals)
+            if index is None or index >= len(order_prices):
+                return
+            # the input is parsed once; the table keeps qty and prices as integers
+            if col_index == 5:
+                qty = _parse_float(text)
+                if qty is None:
+                    return
+                vals[5] = int(qty)
+                order_prices.set(index, qty=int(qty))
+            else:
+                gr = money.parse_grosze(text)
+                if gr is None:
+                    return
+                vals[col_index] = format_grosze_pln(gr)
+                field = {6: 'unit', 7: 'bending', 8: 'additional'}[col_index]
+                order_prices.set(index, **{field: gr})
             tree.item(item, values=vals)
-            e.destroy()
             update_original_data(item)  # Update stored data after edit
             update_total()  # Recalculate total after edit
         e.bind("<Return>", save_edit); e.bind("<FocusOut>", save_edit)
@@ -1130,6 +1305,25 @@ def edit_cell(event):
 
 
 tree.bind("<Double-1>", edit_cell)
+
+# rows whose L+M price is kept by UPDATE PRICES BASED ON TIME
+LOCKED_TAG = "locked"
+tree.tag_configure(LOCKED_TAG, foreground="#FFD700")
+
+def toggle_locked_rows():
+    """Locks the selected rows (or unlocks them when all are locked)."""
+    if _table_busy():
+        return
+    selected = [iid for iid in tree.selection() if iid != total_row_iid]
+    if not selected:
+        messagebox.showinfo("Lock rows", "Select the rows to lock in the table first.")
+        return
+    unlock = all(LOCKED_TAG in tree.item(iid, 'tags') for iid in selected)
+    for iid in selected:
+        tags = [t for t in tree.item(iid, 'tags') if t != LOCKED_TAG]
+        tree.item(iid, tags=tags if unlock else tags + [LOCKED_TAG])
+        update_original_data(iid)
+    analysis_logger.log(f"{len(selected)} row(s) {'unlocked' if unlock else 'locked'}", "INFO")
 panel_a.add(subpanel1, minsize=220)
 
 # --- PANEL 2 ---
@@ -1194,6 +1388,11 @@ bending_percent_entry_TKW = ttk.Entry(subpanel2)
 bending_percent_entry_TKW.grid(row=4, column=5, padx=(0,5), sticky="we")
 bending_percent_entry_TKW.insert(tk.INSERT, "75,00")
 
+# e.g. "1; 10; 50; 100; 500" - extra price columns in the offer (empty = off)
+ttk.Label(subpanel2, text="Quantity tiers [pcs]:").grid(row=5, column=4, sticky="w", padx=(20,10))
+quantity_tiers_entry = ttk.Entry(subpanel2)
+quantity_tiers_entry.grid(row=5, column=5, padx=(0,5), sticky="we")
+
 # (opcjonalnie) dopasowanie szerokości kolumn dla lepszego layoutu
 subpanel2.grid_columnconfigure(3, weight=1)
 subpanel2.grid_columnconfigure(5, weight=1)
@@ -1240,6 +1439,14 @@ ttk.Label(subpanel2, text="TOTAL OF ALL COSTS [PLN]:").grid(row=11, column=0, co
 total_all_costs_label = ttk.Label(subpanel2, text="0,00", relief="sunken", anchor="e", width=30, font=("Arial", 11, "bold"))
 total_all_costs_label.grid(row=11, column=2, columnspan=2, sticky="ew", padx=(20,5))
 
+ttk.Label(subpanel2, text="Min. margin over TKW [%]:").grid(row=12, column=0, sticky="w", padx=(5,10))
+min_margin_tkw_entry = ttk.Entry(subpanel2, width=20)
+min_margin_tkw_entry.grid(row=12, column=1, sticky="ew", padx=(0,20))
+min_margin_tkw_entry.insert(tk.INSERT, "0,00")
+lock_rows_button = ttk.Button(subpanel2, text="Lock / unlock selected rows", command=lambda: toggle_locked_rows())
+lock_rows_button.grid(
+    row=12, column=2, columnspan=2, sticky="ew", padx=(20,5))
+
 ttk.Label(subpanel2, text="TOTAL FOR CORRECTION [PLN]:").grid(row=13, column=0, columnspan=2, sticky="w", padx=(5,10))
 total_all_costs_entry = ttk.Entry(subpanel2, width=30, font=("Arial", 11, "bold"))
 total_all_costs_entry.grid(row=13, column=2, columnspan=2, sticky="ew", padx=(20,5))
@@ -1293,6 +1500,10 @@ apply_margins_btn.pack(pady=(5, 0))
 ttk.Label(button_frame, text="Click above to apply the proposed margins to all prices", 
          font=("Arial", 9, "italic")).pack(pady=(2, 0))
 
+# order total / TKW result over a grid of margins and hourly rates (costing.sweep)
+margin_sweep_button = ttk.Button(button_frame, text="Margin / rate sweep...", command=lambda: show_margin_sweep())
+margin_sweep_button.pack(pady=(8, 0))
+
 subpanel2.update_idletasks()
 panel2_height = subpanel2.winfo_reqheight() + 50  # Added extra height
 panel_a.add(subpanel2, height=panel2_height, minsize=panel2_height)
@@ -1336,44 +1547,79 @@ gas_var = tk.StringVar(); gas_cb = ttk.Combobox(cut_frame, textvariable=gas_var,
 btn_find_cut = ttk.Button(cut_frame, text="Find cutting price", command=lambda: ui_find_cutting_price()); btn_find_cut.grid(row=4, column=0, columnspan=2, pady=4, sticky="we")
 cutting_result_label = ttk.Label(cut_frame, text="Cutting Result: —"); cutting_result_label.grid(row=5, column=0, columnspan=2, sticky="w")
 
+policy_frame = tk.Frame(subpanel3, bg="#2c2c2c")
+policy_frame.grid(row=2, column=0, columnspan=2, sticky="we", padx=4)
+ttk.Label(policy_frame, text="Thickness not in price list:").pack(side="left")
+price_policy_var = tk.StringVar(value=price_policy)
+price_policy_cb = ttk.Combobox(policy_frame, textvariable=price_policy_var, values=PRICE_POLICIES, width=12, state="readonly")
+price_policy_cb.pack(side="left", padx=(6, 0))
+price_policy_cb.bind("<<ComboboxSelected>>", lambda e: set_price_policy(price_policy_var.get()))
+def _on_price_date_entry(event=None):
+    try:
+        when = parse_date(price_date_var.get())
+    except ValueError as e:
+        messagebox.showerror("Error", str(e)); return
+    if when != price_date:
+        set_price_date(when)
+ttk.Label(policy_frame, text="Material prices as of:").pack(side="left", padx=(12, 0))
+price_date_var = tk.StringVar()
+price_date_entry = ttk.Entry(policy_frame, textvariable=price_date_var, width=11)
+price_date_entry.pack(side="left", padx=(6, 0))
+price_date_entry.bind("<Return>", _on_price_date_entry)
+price_date_entry.bind("<FocusOut>", _on_price_date_entry)
+
 btn_load_both = ttk.Button(subpanel3, text="Load both price lists and refresh lists",
                           command=lambda: (load_material_prices(True), load_cutting_prices(True)))
 btn_load_both.grid(row=1, column=0, columnspan=2, sticky="we", padx=4, pady=(2,6))
+# pick up edits of the price workbooks without "Load" (see start_price_reload)
+price_reload_var = tk.BooleanVar(value=True)
+tk.Checkbutton(subpanel3, text="Reload price lists when the files change", variable=price_reload_var,
+               command=lambda: toggle_price_reload(),
+               bg="#2c2c2c", fg="white", selectcolor="#2c2c2c",
+               activebackground="#2c2c2c", activeforeground="white").grid(row=3, column=0, columnspan=2, padx=4, sticky="w")
 subpanel3.grid_columnconfigure(0, weight=1); subpanel3.grid_columnconfigure(1, weight=1)
 
 panel_a.add(subpanel3, minsize=200)
 right_paned.add(panel_a)
 
 # CORRECTED Dynamic margin calculation functions
-def calculate_material_margin(plate_area_m2):
-    """Calculate material margin based on plate area using linear interpolation
-    250% to 0% for areas from 0 to 1m²"""
-    min_area = _parse_float(min_area_var.get()) or 0.00  # Default 0 m²
-    max_area = _parse_float(max_area_var.get()) or 1.0   # Default 1.0 m²
-    
-    if plate_area_m2 <= min_area:
-        return 250.0  # 250% margin for zero or very small areas
-    elif plate_area_m2 >= max_area:
-        return 0.0    # 0% margin for areas >= 1m²
-    else:
-        # Linear interpolation between 250% and 0%
-        ratio = (plate_area_m2 - min_area) / (max_area - min_area)
-        return 250.0 * (1.0 - ratio)
-
-def calculate_cutting_margin(cutting_length_mm):
-    """Calculate cutting margin based on cutting length using linear interpolation
-    200% to 0% for lengths from 0 to 5000mm"""
-    min_length = _parse_float(min_cutting_var.get()) or 0.0     # Default 0mm
-    max_length = _parse_float(max_cutting_var.get()) or 5000.0  # Default 5000mm
-    
-    if cutting_length_mm <= min_length:
-        return 200.0  # 200% margin for zero or very short cutting
-    elif cutting_length_mm >= max_length:
-        return 0.0    # 0% margin for lengths >= 5000mm
-    else:
-        # Linear interpolation between 200% and 0%
-        ratio = (cutting_length_mm - min_length) / (max_length - min_length)
-        return 200.0 * (1.0 - ratio)
+def _margin_policy():
+    """MarginPolicy from the margin panel: the curve texts when given, otherwise the
+    min/max ramps. Read once per analysis on the Tk thread; workers only get the policy."""
+    ramps = MarginPolicy.ramps(_parse_float(min_area_var.get()) or 0.00,      # Default 0 m²
+                               _parse_float(max_area_var.get()) or 1.0,       # Default 1.0 m²
+                               _parse_float(min_cutting_var.get()) or 0.0,    # Default 0mm
+                               _parse_float(max_cutting_var.get()) or 5000.0)  # Default 5000mm
+    return MarginPolicy(_margin_curve(area_curve_var.get(), ramps.area),
+                        _margin_curve(cut_curve_var.get(), ramps.cut_length))
+
+def _margin_curve(text, default):
+    if not text.strip():
+        return default
+    try:
+        return MarginCurve.parse(text)
+    except ValueError:
+        return default  # reported by _validate_margin_curve when the entry is left
+
+def _validate_margin_curve(var, what):
+    text = var.get()
+    if not text.strip():
+        return
+    try:
+        curve = MarginCurve.parse(text)
+    except ValueError as e:
+        analysis_logger.log(f"{what} margin curve ignored ({e}) - using the min/max ramp", "WARNING")
+        messagebox.showerror("Error", f"{what} margin curve: {e}\n\nExample: 0:250; 0.5:100; 1:0  or  step 0:200; 2000:50")
+        return
+    var.set(str(curve))
+
+def calculate_material_margin(plate_area_m2, policy=None):
+    """Suggested material margin [%] for one plate area (see margin_policy.py)"""
+    return float((policy or _margin_policy()).material_margins(plate_area_m2))
+
+def calculate_cutting_margin(cutting_length_mm, policy=None):
+    """Suggested cutting margin [%] for one cut length in mm (see margin_policy.py)"""
+    return float((policy or _margin_policy()).cutting_margins(cutting_length_mm))
 
 def parse_plate_size(plate_size_str):
     """Parse plate size string like '500*300' or '500x300' to get area in m²"""
@@ -1396,9 +1642,26 @@ def parse_plate_size(plate_size_str):
     return 0.0
 
 # USER-TRIGGERED FUNCTION TO APPLY MARGINS
+def _order_overheads():
+    """(order extras, sheet operating cost) per part from the Panel 2 fixed costs."""
+    return costing.overhead_per_part(
+        total_sheets, total_parts_qty,
+        _parse_float(op_cost_entry.get()) or 0.0,
+        _parse_float(tech_order_entry.get()) or 0.0,
+        _parse_float(add_order_cost_entry.get()) or 0.0)
+
+def _tkw_rates():
+    """((O2, N2, AL N2) own hourly rates, bending share [%]) from Panel 2."""
+    return ((_parse_float(oxygen_rate_entry_TKW.get()) or 262.50,
+             _parse_float(nitrogen_rate_entry_TKW.get()) or 412.50,
+             _parse_float(al_nitrogen_rate_entry_TKW.get()) or 487.50),
+            _parse_float(bending_percent_entry_TKW.get()) or 75.0)
+
 def update_with_margins():
     """Update all costs with dynamic margins - USER MUST CLICK BUTTON TO TRIGGER THIS"""
-    global all_parts, total_row_iid, avg_material_margin, avg_cutting_margin
+    global all_parts, total_row_iid, avg_material_margin, avg_cutting_margin, applied_margins
+    if _table_busy():
+        return
     
     if not all_parts:
         messagebox.showwarning("Warning", "No data to update. Perform analysis first.")
@@ -1413,67 +1676,30 @@ def update_with_margins():
         
         analysis_logger.log(f"Applying user-selected margins: Material {proposed_material}%, Cutting {proposed_cutting}%", "INFO")
         
-        total_new_cost = 0.0
-        
-        for i, part in enumerate(all_parts):
-            # Get current values from treeview
-            item_iid = list(tree.get_children())[i] if i < len(tree.get_children()) else None
-            if not item_iid or item_iid == total_row_iid:
-                continue
-            
-            # Get current tree values in case user edited them
-            vals = tree.item(item_iid, 'values')
-            current_qty = int(vals[5] or 0)
-            current_bending = _parse_float(vals[7]) or 0.0
-            current_additional = _parse_float(vals[8]) or 0.0
-            
-            # Calculate base costs with mandatory 7% minimum margin for material
-            base_material_cost = part.get('adj_weight', 0.0) * part.get('base_price_per_kg', 0.0) * 1.07
-            base_cut_cost = part.get('cut_length', 0.0) * part.get('base_rate_per_cut_length', 0.0)
-            
-            # Apply user-selected margins
-            material_cost_with_margin = base_material_cost * (1.0 + proposed_material / 100.0)
-            cutting_cost_with_margin = base_cut_cost * (1.0 + proposed_cutting / 100.0)
-            
-            # Add other costs
-            contour_cost = part.get('contours_qty', 0.0) * part.get('rate_per_contour', 0.0)
-            marking_cost = part.get('marking_length', 0.0) * part.get('rate_per_marking_length', 0.0)
-            defilm_cost = part.get('defilm_length', 0.0) * part.get('rate_per_defilm_length', 0.0)
-            
-            # Calculate overhead per part
-            op_cost_per_sheet = _parse_float(op_cost_entry.get()) or 0.0
-            tech_per_order = _parse_float(tech_order_entry.get()) or 0.0
-            add_costs_order = _parse_float(add_order_cost_entry.get()) or 0.0
-            
-            if total_parts_qty > 0:
-                extra_per_part = (tech_per_order + add_costs_order) / total_parts_qty
-                op_cost_per_part = (total_sheets * op_cost_per_sheet) / total_parts_qty
-            else:
-                extra_per_part = 0.0
-                op_cost_per_part = 0.0
-            
-            # Final unit cost
-            new_unit_cost = (material_cost_with_margin + cutting_cost_with_margin + contour_cost + 
-                           marking_cost + defilm_cost + extra_per_part + op_cost_per_part)
-            
-            # Update part data
-            part['cost_per_unit'] = round(new_unit_cost, 2)
-            part['qty'] = current_qty
-            part['bending_per_unit'] = current_bending
-            part['additional_per_unit'] = current_additional
-            
-            # Update treeview
+        # Overheads are read once, not per part
+        extra_per_part, op_cost_per_part = _order_overheads()
+
+        # New unit costs of all parts in one vectorised step, rounded once to grosze
+        new_unit_gr = money.to_grosze(costing.unit_costs(costing.PartCostArrays.from_parts(all_parts),
+                                                         proposed_material, proposed_cutting,
+                                                         extra_per_part, op_cost_per_part))
+
+        # Quantities and per-unit extras (possibly edited in the table) stay in order_prices
+        rows = [(iid, index, vals) for iid, index, vals in _tree_part_rows() if index < len(order_prices)]
+        for item_iid, index, vals in rows:
+            order_prices.set(index, unit=int(new_unit_gr[index]))
+            all_parts[index]['cost_per_unit'] = money.to_pln(new_unit_gr[index])
+
             new_vals = list(vals)
-            new_vals[6] = format_pln(new_unit_cost)  # L+M Cost column
+            new_vals[6] = format_grosze_pln(new_unit_gr[index])  # L+M Cost column
             tree.item(item_iid, values=new_vals)
-            
-            # Calculate total for this part
-            total_new_cost += (new_unit_cost + current_bending + current_additional) * current_qty
-        
+
+        applied_margins = (proposed_material, proposed_cutting)
+
         # Update total row
-        if total_row_iid:
-            tree.set(total_row_iid, column="7", value=format_pln(total_new_cost))
-            SetTotalPricePerOrder(total_new_cost)
+        total_new_gr = order_prices.total([index for _, index, _ in rows])
+        _set_order_total(total_new_gr)
+        total_new_cost = money.to_pln(total_new_gr)
         
         # Update cost calculations
         update_cost_calculations()
@@ -1488,9 +1714,211 @@ def update_with_margins():
         analysis_logger.log(f"Error applying margins: {str(e)}", "ERROR")
         messagebox.showerror("Error", f"Failed to apply margins: {str(e)}")
 
+# ---- margin / rate sensitivity sweep ----
+SWEEP_MAX_POINTS = 200  # per axis
+SWEEP_CELL_TEXT_MAX = 12  # heat map cells get their value printed up to this many columns
+
+def _sweep_axis(start_var, stop_var, steps_var, name):
+    start, stop = _parse_float(start_var.get()), _parse_float(stop_var.get())
+    steps = int(_parse_float(steps_var.get()) or 0)
+    if start is None or stop is None:
+        raise ValueError(f"{name}: enter the range 'from' and 'to'")
+    if not 1 <= steps <= SWEEP_MAX_POINTS:
+        raise ValueError(f"{name}: number of points must be 1..{SWEEP_MAX_POINTS}")
+    return np.linspace(start, stop, steps)
+
+def run_margin_sweep(material_margins, cutting_margins, rate_factors):
+    """Order total / TKW result of the current order for every grid point (costing.sweep)."""
+    # quantities and per-unit extras as edited in the table
+    qty = order_prices.qty.astype(float)
+    bending = money.to_pln(order_prices.bending)
+    additional = money.to_pln(order_prices.additional)
+
+    extra_per_part, op_cost_per_part = _order_overheads()
+    hourly_rates, bending_percent = _tkw_rates()
+    return costing.sweep(costing.PartCostArrays.from_parts(all_parts), qty, bending, additional,
+                         material_margins, cutting_margins, rate_factors, hourly_rates,
+                         bending_percent, extra_per_part, op_cost_per_part)
+
+def _heat_color(value, scale):
+    """Red (loss) - white - green (profit)."""
+    t = max(-1.0, min(1.0, value / scale)) if scale > 0 else 0.0
+    fade = int(255 * (1.0 - abs(t)))
+    return f"#ff{fade:02x}{fade:02x}" if t < 0 else f"#{fade:02x}ff{fade:02x}"
+
+def show_margin_sweep():
+    """Dialog: ranges of both margins and of the TKW hourly rates -> heat map of the TKW result."""
+    if _table_busy():
+        return
+    if not all_parts:
+        messagebox.showwarning("Warning", "No data to sweep. Perform analysis first.")
+        return
+    win = tk.Toplevel(root)
+    win.title("Margin / rate sweep")
+    win.geometry("900x700")
+    win.configure(bg="#2c2c2c")
+
+    ranges = tk.Frame(win, bg="#2c2c2c")
+    ranges.pack(fill="x", padx=10, pady=10)
+    material = _parse_float(material_margin_var.get()) or 0.0
+    cutting = _parse_float(cutting_margin_var.get()) or 0.0
+    axes = {}
+    for row, (name, start, stop, steps) in enumerate((
+            ("Material margin [%]", 0.0, max(2 * material, 100.0), 21),
+            ("Cutting margin [%]", 0.0, max(2 * cutting, 100.0), 21),
+            ("TKW hourly rates [% of Panel 2]", 80.0, 120.0, 5))):
+        ttk.Label(ranges, text=name).grid(row=row, column=0, sticky="e", padx=(0, 5), pady=2)
+        entry_vars = [tk.StringVar(value=f"{start:g}"), tk.StringVar(value=f"{stop:g}"), tk.StringVar(value=str(steps))]
+        for col, (label, var) in enumerate(zip(("from", "to", "points"), entry_vars)):
+            ttk.Label(ranges, text=label).grid(row=row, column=1 + 2 * col, padx=(10, 2))
+            ttk.Entry(ranges, textvariable=var, width=10).grid(row=row, column=2 + 2 * col)
+        axes[name] = entry_vars
+
+    controls = tk.Frame(win, bg="#2c2c2c")
+    controls.pack(fill="x", padx=10)
+    ttk.Label(controls, text="Show at TKW rates [%]:").pack(side="left")
+    rate_var = tk.StringVar()
+    rate_combo = ttk.Combobox(controls, textvariable=rate_var, state="readonly", width=10)
+    rate_combo.pack(side="left", padx=5)
+    info_label = ttk.Label(controls, text="")
+    info_label.pack(side="right")
+
+    canvas = tk.Canvas(win, bg="#2c2c2c", highlightthickness=0)
+    canvas.pack(fill="both", expand=True, padx=10, pady=10)
+    ttk.Label(win, text="Rows: material margin, columns: cutting margin; colour: order total - TKW. "
+                        "Click a cell to copy its margins to the margin settings.",
+              font=("Arial", 9, "italic")).pack(pady=(0, 10))
+    state = {}
+
+    def draw(*_):
+        result = state.get('result')
+        canvas.delete("all")
+        if result is None:
+            return
+        k = rate_combo.current() if rate_combo.current() >= 0 else 0
+        values = result.results[:, :, k]
+        a, b = values.shape
+        left, top = 60, 25
+        width = max(canvas.winfo_width() - left - 10, 50)
+        height = max(canvas.winfo_height() - top - 10, 50)
+        cw, ch = width / b, height / a
+        scale = float(np.abs(values).max())
+        show_text = b <= SWEEP_CELL_TEXT_MAX and ch >= 14
+        for i in range(a):
+            for j in range(b):
+                x0, y0 = left + j * cw, top + i * ch
+                canvas.create_rectangle(x0, y0, x0 + cw, y0 + ch, fill=_heat_color(values[i, j], scale), outline="#2c2c2c")
+                if show_text:
+                    canvas.create_text(x0 + cw / 2, y0 + ch / 2, text=format_pln(values[i, j]), font=("Arial", 8))
+        label_every = lambda n, size: max(1, int(math.ceil(n * 16 / max(size, 1))))
+        for i in range(0, a, label_every(a, height)):
+            canvas.create_text(left - 5, top + (i + 0.5) * ch, text=f"{result.material_margins[i]:g}", anchor="e", fill="white", font=("Arial", 8))
+        for j in range(0, b, label_every(b * 3, width)):
+            canvas.create_text(left + (j + 0.5) * cw, top - 5, text=f"{result.cutting_margins[j]:g}", anchor="s", fill="white", font=("Arial", 8))
+        state['grid'] = (left, top, cw, ch, a, b, k)
+
+    def cell_at(event):
+        grid = state.get('grid')
+        if not grid:
+            return None
+        left, top, cw, ch, a, b, k = grid
+        i, j = int((event.y - top) // ch), int((event.x - left) // cw)
+        return (i, j, k) if 0 <= i < a and 0 <= j < b and event.x >= left and event.y >= top else None
+
+    def on_motion(event):
+        cell = cell_at(event)
+        if cell is None:
+            info_label.config(text="")
+            return
+        i, j, k = cell
+        result = state['result']
+        info_label.config(text=f"Material {result.material_margins[i]:g}% | Cutting {result.cutting_margins[j]:g}% | "
+                               f"Total {format_pln(result.totals[i, j])} | TKW {format_pln(result.tkw[k])} | "
+                               f"Result {format_pln(result.results[i, j, k])} PLN")
+
+    def on_click(event):
+        cell = cell_at(event)
+        if cell is None:
+            return
+        i, j, _ = cell
+        result = state['result']
+        material_margin_var.set(f"{result.material_margins[i]:.2f}".replace('.', ','))
+        cutting_margin_var.set(f"{result.cutting_margins[j]:.2f}".replace('.', ','))
+        analysis_logger.log(f"Sweep: margins set to material {result.material_margins[i]:g}%, cutting "
+                            f"{result.cutting_margins[j]:g}% - click 'UPDATE WITH DYNAMIC MARGINS' to apply", "INFO")
+
+    def compute():
+        try:
+            grid = [_sweep_axis(*axes[name], name) for name in axes]
+            t0 = time.perf_counter()
+            result = run_margin_sweep(*grid)
+            elapsed = time.perf_counter() - t0
+        except Exception as e:
+            messagebox.showerror("Sweep", str(e), parent=win)
+            return
+        state['result'] = result
+        rate_combo['values'] = [f"{f:g}" for f in result.rate_factors]
+        closest = int(np.argmin(np.abs(result.rate_factors - 100.0)))
+        rate_combo.current(closest)
+        best = np.unravel_index(np.argmax(result.results[:, :, closest]), result.results.shape[:2])
+        analysis_logger.log(f"Margin sweep: {result.results.size} points over {len(all_parts)} parts in "
+                            f"{elapsed * 1000:.0f} ms; total {format_pln(result.totals.min())} - "
+                            f"{format_pln(result.totals.max())} PLN, TKW {format_pln(result.tkw.min())} - "
+                            f"{format_pln(result.tkw.max())} PLN", "INFO")
+        analysis_logger.log(f"Margin sweep at {result.rate_factors[closest]:g}% TKW rates: best result "
+                            f"{format_pln(result.results[best + (closest,)])} PLN at material "
+                            f"{result.material_margins[best[0]]:g}%, cutting {result.cutting_margins[best[1]]:g}%", "INFO")
+        draw()
+
+    ttk.Button(controls, text="Compute", command=compute).pack(side="left", padx=10)
+    rate_combo.bind("<<ComboboxSelected>>", draw)
+    canvas.bind("<Configure>", draw)
+    canvas.bind("<Motion>", on_motion)
+    canvas.bind("<Button-1>", on_click)
+
+def _order_tkw_unit_costs(parts, bending):
+    """TKW (own) cost of one piece of every part (costing.PartCostArrays), with the Panel 2 own rates."""
+    extra_per_part, op_cost_per_part = _order_overheads()
+    hourly_rates, bending_percent = _tkw_rates()
+    return costing.tkw_unit_costs(parts, np.asarray(bending, dtype=float),
+                                  hourly_rates, bending_percent, extra_per_part, op_cost_per_part)
+
+def _parse_quantity_tiers(text):
+    """Tier quantities from "1; 10; 50" (also spaces / commas); ValueError on bad input."""
+    tiers = []
+    for token in re.split(r"[;,\s]+", text.strip()):
+        if not token:
+            continue
+        if not token.isdigit() or int(token) <= 0:
+            raise ValueError(f"'{token}' is not a positive whole number of pieces")
+        tiers.append(int(token))
+    return sorted(set(tiers))
+
+def quantity_tier_prices(part_file, tiers):
+    """costing.QuantityTiers of the order (at the prices in order_prices) for the tier quantities.
+
+    part_file: index of the export file of every part ((subnr or 1) - 1).
+    Sheets are scaled per export file when the parts come from the last
+    analysis, else over the whole order."""
+    unit = money.to_pln(order_prices.unit) + money.to_pln(order_prices.bending) + money.to_pln(order_prices.additional)
+    results = list(file_results.values())
+    if results and len(part_file) == sum(res['part_count'] for res in results):
+        file_sheets = [res['sheets'] for res in results]
+        file_parts_qty = [res['parts_qty'] for res in results]
+    else:
+        part_file = [0] * len(part_file)
+        file_sheets, file_parts_qty = [total_sheets], [total_parts_qty]
+    return costing.quantity_tiers(unit, part_file, file_sheets, file_parts_qty, tiers,
+                                  _parse_float(op_cost_entry.get()) or 0.0,
+                                  _parse_float(tech_order_entry.get()) or 0.0,
+                                  _parse_float(add_order_cost_entry.get()) or 0.0)
+
 def update_prices_based_on_time():
-    """Update unit prices in treeview based on time calculations and proportional distribution"""
+    """Spread TOTAL FOR CORRECTION over the shown parts (target_price.solve): exact to the grosz,
+    no part below the minimum margin over its TKW cost, locked rows and bending/additional kept."""
     global all_parts, total_row_iid
+    if _table_busy():
+        return
     
     if not all_parts:
         messagebox.showwarning("Warning", "No data to update. Perform analysis first.")
@@ -1504,72 +1932,55 @@ def update_prices_based_on_time():
     if not target_total or target_total <= 0:
         messagebox.showerror("Error", "Invalid total costs.")
         return
-    
-    # Calculate current total from treeview (excluding total row)
-    current_total = 0.0
-    items_data = []
-    
-    for item in tree.get_children():
-        if item == total_row_iid:
-            continue
-        vals = tree.item(item, 'values')
-        qty = _parse_float(vals[5]) or 0
-        cost = _parse_float(vals[6]) or 0
-        bending = _parse_float(vals[7]) or 0
-        additional = _parse_float(vals[8]) or 0
-        
-        item_total = (cost + bending + additional) * qty
-        current_total += item_total
-        
-        items_data.append({
-            'item': item,
-            'qty': qty,
-            'cost': cost,
-            'bending': bending,
-            'additional': additional,
-            'item_total': item_total,
-            'proportion': 0.0
-        })
-    
-    if current_total <= 0:
+    min_margin = _parse_float(min_margin_tkw_entry.get()) or 0.0
+
+    rows = [(iid, index, vals) for iid, index, vals in _tree_part_rows() if index < len(order_prices)]
+    if not rows:
         messagebox.showerror("Error", "No costs to recalculate.")
         return
-    
-    # Calculate proportions for each item
-    for item_data in items_data:
-        item_data['proportion'] = item_data['item_total'] / current_total
-    
-    # Apply proportional distribution of the new total
-    new_grand_total = 0.0
-    for idx, item_data in enumerate(items_data):
-        # Calculate new item total based on proportion
-        new_item_total = target_total * item_data['proportion']
-        
-        # Calculate new unit cost (preserving bending and additional costs)
-        if item_data['qty'] > 0:
-            new_unit_cost = (new_item_total / item_data['qty']) - item_data['bending'] - item_data['additional']
-            
-            # Ensure non-negative cost
-            new_unit_cost = max(0, new_unit_cost)
-            
-            # Update tree item
-            vals = list(tree.item(item_data['item'], 'values'))
-            vals[6] = format_pln(new_unit_cost)
-            tree.item(item_data['item'], values=vals)
-            
-            # Update all_parts array
-            if idx < len(all_parts):
-                all_parts[idx]['cost_per_unit'] = new_unit_cost
-            
-            new_grand_total += (new_unit_cost + item_data['bending'] + item_data['additional']) * item_data['qty']
+    indices = [index for _, index, _ in rows]
+    parts = costing.PartCostArrays.from_parts(all_parts[index] for index in indices)
+    qty = order_prices.qty[indices]
+    cost = money.to_pln(order_prices.unit[indices])
+    bending = money.to_pln(order_prices.bending[indices])
+    additional = money.to_pln(order_prices.additional[indices])
+    locked = [LOCKED_TAG in tree.item(iid, 'tags') for iid, _, _ in rows]
+    current_total = money.to_pln(order_prices.total(indices))
+
+    floors = target_price.margin_floor(_order_tkw_unit_costs(parts, bending), bending, additional, min_margin)
+    solution = target_price.solve(target_total, qty, cost, bending, additional, floors, locked)
+
+    # only the rows whose price changed are rewritten
+    for k in np.flatnonzero(solution.changed):
+        iid, index, vals = rows[k]
+        unit_gr = int(solution.unit_grosze[k])
+        new_vals = list(vals)
+        new_vals[6] = format_grosze_pln(unit_gr)
+        tree.item(iid, values=new_vals)
+        order_prices.set(index, unit=unit_gr)
+        all_parts[index]['cost_per_unit'] = money.to_pln(unit_gr)
     
     # Update the total row
-    tree.set(total_row_iid, column="7", value=format_pln(new_grand_total))
-    SetTotalPricePerOrder(new_grand_total)
-    
-    messagebox.showinfo("Success", f"Prices have been updated proportionally.\n"
-                                  f"Old sum: {format_pln(current_total)}\n"
-                                  f"New sum: {format_pln(new_grand_total)}")
+    _set_order_total(order_prices.total(indices))
+
+    summary = (f"Old sum: {format_pln(current_total)}\n"
+               f"New sum: {format_pln(solution.total)}\n"
+               f"Rows changed: {int(solution.changed.sum())}, locked: {sum(locked)}")
+    if solution.exact:
+        analysis_logger.log(f"Prices spread over the target {format_pln(solution.target)} PLN "
+                            f"(min. margin {min_margin:g}% over TKW)", "SUCCESS")
+        messagebox.showinfo("Success", "Prices have been updated to the target.\n" + summary)
+    elif solution.total > solution.target:
+        analysis_logger.log(f"Target {format_pln(solution.target)} PLN is below the minimum "
+                            f"{format_pln(solution.minimum)} PLN (min. margin {min_margin:g}% over TKW, "
+                            f"locked rows, bending and additional costs)", "WARNING")
+        messagebox.showwarning("Target too low", f"The target cannot be reached: the lowest possible total is "
+                                                 f"{format_pln(solution.minimum)} PLN.\n" + summary)
+    else:
+        analysis_logger.log(f"Target {format_pln(solution.target)} PLN cannot be hit to the grosz with these "
+                            f"quantities; reached {format_pln(solution.total)} PLN", "WARNING")
+        messagebox.showwarning("Target not exact", f"Closest reachable total: {format_pln(solution.total)} PLN "
+                                                   f"({format_pln(solution.shortfall)} PLN off).\n" + summary)
 
 def validate_total_entry():
     """Validate and format the manually entered total"""
@@ -1587,210 +1998,275 @@ def validate_total_entry():
         pass
 
 # ---- Price list loaders ----
-def _tree_preview_clear_and_headers(headers):
-    for item in tree.get_children():
-        tree.delete(item)
-    tree.insert('', 'end', values=(0, '', ' | '.join(headers), '', '', '', '', '', ''))
+def _read_material_rows():
+    """(material, thickness, price, format, date, supplier, note) rows of MATERIALS_FILE;
+    from its snapshot while the file is unchanged."""
+    if not os.path.exists(MATERIALS_FILE):
+        raise FileNotFoundError(f"File not found: {MATERIALS_FILE}")
+    rows = price_snapshot.load(MATERIALS_FILE, "material")
+    if rows is not None:
+        return rows
+    signature = price_snapshot.source_signature(MATERIALS_FILE)
+    wb = load_workbook(MATERIALS_FILE, data_only=True)
+    sheet = wb.active
+    headers = [str(c.value).strip().lower() if c.value is not None else "" for c in next(sheet.iter_rows(min_row=1, max_row=1))]
+    need = ("material", "thickness", "price")
+    idx = {n: headers.index(n) for n in need if n in headers}
+    if not set(need).issubset(idx):
+        raise ValueError("Missing required columns: material, thickness, price")
+    # format / date / from (dostawca) / note - opcjonalne
+    opt_idx = {n: headers.index(n) if n in headers else None for n in ("format", "date", "from", "note")}
+    opt = lambda row, n: row[opt_idx[n]] if opt_idx[n] is not None else None
+    rows = []
+    for row in sheet.iter_rows(min_row=2, values_only=True):
+        mat = _norm_s(row[idx["material"]]); thk = _parse_float(row[idx["thickness"]]); prc = _parse_float(row[idx["price"]])
+        if mat and thk is not None and prc is not None:
+            try: date = parse_date(opt(row, "date"))
+            except ValueError: date = None
+            rows.append((mat, thk, prc, _norm_s(opt(row, "format")), date,
+                         str(opt(row, "from") or "").strip(), str(opt(row, "note") or "").strip()))
+    price_snapshot.save(MATERIALS_FILE, "material", rows, signature)
+    return rows
+
+def _read_cutting_rows():
+    """(thickness, material, gas, price, speed, hour_price, utilization) rows of CUTTING_FILE;
+    from its snapshot while the file is unchanged."""
+    if not os.path.exists(CUTTING_FILE):
+        raise FileNotFoundError(f"File not found: {CUTTING_FILE}")
+    rows = price_snapshot.load(CUTTING_FILE, "cutting")
+    if rows is not None:
+        return rows
+    signature = price_snapshot.source_signature(CUTTING_FILE)
+
+    wb = load_workbook(CUTTING_FILE, data_only=True)
+    sheet = wb.active
+    headers = [str(c.value).strip().lower() if c.value is not None else "" for c in next(sheet.iter_rows(min_row=1, max_row=1))]
+
+    # Rozszerzone wymagane kolumny
+    required = ("thickness", "material", "gas", "price")
+    optional = ("speed", "hour_price", "utilization")
+
+    # Indeksy dla wymaganych kolumn
+    idx = {n: headers.index(n) for n in required if n in headers}
+    if not set(required).issubset(idx):
+        raise ValueError(f"Missing required columns: {set(required) - set(idx.keys())}")
+
+    # Indeksy dla opcjonalnych kolumn
+    opt_idx = {n: headers.index(n) if n in headers else None for n in optional}
+
+    rows = []
+    for row in sheet.iter_rows(min_row=2, values_only=True):
+        thk = _parse_float(row[idx["thickness"]])
+        mat = _norm_s(row[idx["material"]])
+        gas = _norm_s(row[idx["gas"]])
+        prc = _parse_float(row[idx["price"]])
+        if thk is not None and mat and gas and prc is not None:
+            rows.append((thk, mat, gas, prc) + tuple(
+                _parse_float(row[opt_idx[n]]) if opt_idx[n] is not None else None for n in optional))
+    price_snapshot.save(CUTTING_FILE, "cutting", rows, signature)
+    return rows
+
+def _material_tables(rows, when=None):
+    """Price dict, history and index of parsed material rows (no Tk - also run by the reload thread)."""
+    prices = {}
+    for mat, thk, prc, *_ in rows:
+        prices[(mat, thk)] = prc
+    history = MaterialPriceHistory.build(MaterialQuote(mat, thk, fmt, supplier, date, prc, note)
+                                         for mat, thk, prc, fmt, date, supplier, note in rows)
+    return {'prices': prices, 'history': history, 'when': when,
+            'index': _build_material_index(prices, history, when)}
+
+def _cutting_tables(rows):
+    """Price dict and index of parsed cutting rows (no Tk - also run by the reload thread)."""
+    prices = {}
+    for thk, mat, gas, prc, speed, hour_price, utilization in rows:
+        # Struktura danych z dodatkowymi polami
+        prices[(thk, mat, gas)] = {
+            'price': prc,
+            'speed': speed,
+            'hour_price': hour_price,
+            'utilization': utilization
+        }
+    return {'prices': prices, 'index': _build_cutting_index(prices)}
+
+def _build_material_index(prices, history, when):
+    current = prices if when is None else history.prices_as_of(when)
+    return PriceIndex.build((mat, thk, (prc,)) for (mat, thk), prc in current.items())
+
+def _build_cutting_index(prices):
+    return PriceIndex.build((((mat, gas), thk, tuple(data[f] for f in CUTTING_FIELDS))
+                             for (thk, mat, gas), data in prices.items()), CUTTING_FIELDS)
+
+def _install_material_tables(tables):
+    """Swaps in new material tables; the old dict is left untouched for anyone still reading it."""
+    global material_prices, material_history, material_index
+    if tables['when'] != price_date:  # offer date changed while the tables were built
+        tables['index'] = _build_material_index(tables['prices'], tables['history'], price_date)
+    material_prices, material_history, material_index = tables['prices'], tables['history'], tables['index']
+
+def _install_cutting_tables(tables):
+    global cutting_prices, cutting_index
+    cutting_prices, cutting_index = tables['prices'], tables['index']
+
+def _refresh_price_list_widgets():
+    """Comboboxes and LEDs of Panel 3 (and _mat_set/_thk_set/_gas_set) from the loaded lists."""
+    global _mat_set, _thk_set, _gas_set
+    thk_values = lambda ts: [f"{t:.2f}".rstrip("0").rstrip(".") for t in sorted(ts)]
+    mat_mats = {m for m, _ in material_prices}; mat_thks = {t for _, t in material_prices}
+    cut_mats = {m for _, m, _ in cutting_prices}; cut_thks = {t for t, _, _ in cutting_prices}
+    _mat_set, _thk_set = mat_mats | cut_mats, mat_thks | cut_thks
+    _gas_set = {g for _, _, g in cutting_prices}
+    material_cb["values"] = sorted(mat_mats or cut_mats); thickness_mat_cb["values"] = thk_values(mat_thks or cut_thks)
+    material_cut_cb["values"] = sorted(cut_mats or mat_mats); thickness_cut_cb["values"] = thk_values(cut_thks or mat_thks)
+    gas_cb["values"] = sorted(_gas_set)
+    _update_led(material_led, len(material_prices) > 0)
+    _update_led(cutting_led, len(cutting_prices) > 0)
+
+def _material_price_text(prc):
+    return "—" if prc is None else f"{format_pln(prc)} PLN/kg"
+
+def _cutting_price_text(data):
+    if data is None:
+        return "—"
+    speed_str = f"{data['speed']:.1f}" if data['speed'] is not None else "N/A"
+    hour_price_str = f"{data['hour_price']:.0f}" if data['hour_price'] is not None else "N/A"
+    util_str = f"{data['utilization']:.2f}" if data['utilization'] is not None else "N/A"
+    return f"{format_pln(data['price'])} PLN/m | Speed: {speed_str} | H.Price: {hour_price_str} | Util: {util_str}"
 
 def load_material_prices(preview=False):
-    global material_prices, _mat_set, _thk_set
-    material_prices.clear(); _mat_set.clear(); _thk_set.clear()
+    """(Re)loads MATERIALS_FILE; preview lists the prices in the analysis log."""
     try:
-        if not os.path.exists(MATERIALS_FILE):
-            raise FileNotFoundError(f"File not found: {MATERIALS_FILE}")
-        wb = load_workbook(MATERIALS_FILE, data_only=True)
-        sheet = wb.active
-        headers = [str(c.value).strip().lower() if c.value is not None else "" for c in next(sheet.iter_rows(min_row=1, max_row=1))]
-        need = ("material", "thickness", "price")
-        idx = {n: headers.index(n) for n in need if n in headers}
-        if not set(need).issubset(idx):
-            raise ValueError("Missing required columns: material, thickness, price")
-        if preview: _tree_preview_clear_and_headers(["materials prices.xlsx → material/thickness/price"])
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            mat = _norm_s(row[idx["material"]]); thk = _parse_float(row[idx["thickness"]]); prc = _parse_float(row[idx["price"]])
-            if mat and thk is not None and prc is not None:
-                material_prices[(mat, thk)] = prc; _mat_set.add(mat); _thk_set.add(thk)
-                if preview: tree.insert('', 'end', values=("", "", f"{mat} @ {thk:.2f} mm → {format_pln(prc)} PLN/kg", "", "", "", "", "", ""))
-        mats_sorted = sorted(_mat_set); thk_sorted = [f"{t:.2f}".rstrip("0").rstrip(".") for t in sorted(_thk_set)]
-        material_cb["values"] = mats_sorted; material_cut_cb["values"] = mats_sorted
-        thickness_mat_cb["values"] = thk_sorted
-        if not thickness_cut_cb["values"]: thickness_cut_cb["values"] = thk_sorted
-        _update_led(material_led, len(material_prices) > 0)
+        tables = _material_tables(_read_material_rows(), price_date)
     except Exception as e:
-        _update_led(material_led, False); messagebox.showerror("Error", f"Loading material prices:\n{e}")
+        tables = _material_tables([], price_date)
+        messagebox.showerror("Error", f"Loading material prices:\n{e}")
+    _install_material_tables(tables)
+    _refresh_price_list_widgets()
+    if preview:
+        analysis_logger.log(f"materials prices.xlsx → {len(material_prices)} material/thickness price(s)", "PHASE")
+        for (mat, thk), prc in material_prices.items():
+            analysis_logger.log(f"{mat} @ {thk:.2f} mm → {_material_price_text(prc)}", "INFO")
 
 def load_cutting_prices(preview=False):
-    global cutting_prices, _mat_set, _thk_set, _gas_set
-    cutting_prices.clear()
-    _gas_set.clear()
-    
+    """(Re)loads CUTTING_FILE; preview lists the prices in the analysis log."""
     try:
-        if not os.path.exists(CUTTING_FILE):
-            raise FileNotFoundError(f"File not found: {CUTTING_FILE}")
-        
-        wb = load_workbook(CUTTING_FILE, data_only=True)
-        sheet = wb.active
-        headers = [str(c.value).strip().lower() if c.value is not None else "" for c in next(sheet.iter_rows(min_row=1, max_row=1))]
-        
-        # Rozszerzone wymagane kolumny
-        required = ("thickness", "material", "gas", "price")
-        optional = ("speed", "hour_price", "utilization")
-        
-        # Indeksy dla wymaganych kolumn
-        idx = {n: headers.index(n) for n in required if n in headers}
-        if not set(required).issubset(idx):
-            raise ValueError(f"Missing required columns: {set(required) - set(idx.keys())}")
-        
-        # Indeksy dla opcjonalnych kolumn
-        opt_idx = {n: headers.index(n) if n in headers else None for n in optional}
-        
-        if preview: 
-            _tree_preview_clear_and_headers(["cutting prices.xlsx → thickness/material/gas/price/speed/hour_price/utilization"])
-        
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            thk = _parse_float(row[idx["thickness"]])
-            mat = _norm_s(row[idx["material"]])
-            gas = _norm_s(row[idx["gas"]])
-            prc = _parse_float(row[idx["price"]])
-            
-            if thk is not None and mat and gas and prc is not None:
-                # Struktura danych z dodatkowymi polami
-                cutting_data = {
-                    'price': prc,
-                    'speed': _parse_float(row[opt_idx["speed"]]) if opt_idx["speed"] is not None else None,
-                    'hour_price': _parse_float(row[opt_idx["hour_price"]]) if opt_idx["hour_price"] is not None else None,
-                    'utilization': _parse_float(row[opt_idx["utilization"]]) if opt_idx["utilization"] is not None else None
-                }
-                
-                cutting_prices[(thk, mat, gas)] = cutting_data
-                _mat_set.add(mat)
-                _thk_set.add(thk)
-                _gas_set.add(gas)
-                
-                if preview:
-                    speed_str = f"{cutting_data['speed']:.1f}" if cutting_data['speed'] is not None else "N/A"
-                    hour_price_str = f"{cutting_data['hour_price']:.0f}" if cutting_data['hour_price'] is not None else "N/A"
-                    util_str = f"{cutting_data['utilization']:.2f}" if cutting_data['utilization'] is not None else "N/A"
-                    
-                    tree.insert('', 'end', values=(
-                        "", "", 
-                        f"{thk:.2f} mm / {mat} / {gas} → {format_pln(prc)} PLN/m | Speed: {speed_str} | H.Price: {hour_price_str} | Util: {util_str}", 
-                        "", "", "", "", "", ""
-                    ))
-        
-        # Sortowanie i aktualizacja comboboxów
-        mats_sorted = sorted(_mat_set)
-        thk_sorted = [f"{t:.2f}".rstrip("0").rstrip(".") for t in sorted(_thk_set)]
-        gas_sorted = sorted(_gas_set)
-        
-        material_cut_cb["values"] = mats_sorted
-        if not material_cb["values"]: 
-            material_cb["values"] = mats_sorted
-        thickness_cut_cb["values"] = thk_sorted
-        if not thickness_mat_cb["values"]: 
-            thickness_mat_cb["values"] = thk_sorted
-        gas_cb["values"] = gas_sorted
-        
-        _update_led(cutting_led, len(cutting_prices) > 0)
-        
+        tables = _cutting_tables(_read_cutting_rows())
     except Exception as e:
-        _update_led(cutting_led, False)
+        tables = _cutting_tables([])
         messagebox.showerror("Error", f"Loading cutting prices:\n{e}")
+    _install_cutting_tables(tables)
+    _refresh_price_list_widgets()
+    if preview:
+        analysis_logger.log(f"cutting prices.xlsx → {len(cutting_prices)} thickness/material/gas price(s)", "PHASE")
+        for (thk, mat, gas), data in cutting_prices.items():
+            analysis_logger.log(f"{thk:.2f} mm / {mat} / {gas} → {_cutting_price_text(data)}", "INFO")
+
+def _compile_material_index():
+    global material_index
+    material_index = _build_material_index(material_prices, material_history, price_date)
+
+def set_price_policy(policy):
+    """How lookups treat a thickness that is not in the price list (see price_index.py)."""
+    global price_policy
+    if policy not in PRICE_POLICIES:
+        raise ValueError(f"unknown price policy '{policy}'")
+    price_policy = policy
+    analysis_logger.log(f"Price lookup policy: {policy}", "INFO")
+
+def set_price_date(when):
+    """Prices materials as of ``when`` (a date; None = the last rows of the list, as before)."""
+    global price_date
+    price_date = when
+    _compile_material_index()
+    if when is None:
+        analysis_logger.log("Material prices: current price list", "INFO")
+    else:
+        analysis_logger.log(f"Material prices as of {when:%Y-%m-%d}: {len(material_index)} price(s)", "INFO")
 
+def get_material_quote(material, thickness, when=None, fmt=None, supplier=None):
+    """Najnowsza oferta (MaterialQuote) z datą <= when; dowolny format / dostawca gdy nie podano"""
+    return material_history.as_of(material, thickness, when, fmt or None, supplier or None)
 
+def cheapest_material_quote(material, thickness, fmt=None, when=None):
+    """Najtańszy dostawca dla formatu arkusza (lub dowolnego) obowiązujący w dniu when"""
+    return material_history.cheapest(material, thickness, when, fmt or None)
 
+# Pobieranie pojedynczych wartości (tolerancja grubości, polityka price_policy)
+#   price = get_material_price("S235", 2.0)
+#   price = get_cutting_price(2.0, "ALUMINIUM", "N")
+#   speed / hour_price / utilization: get_cutting_speed(...) itd.
+# Wszystkie dane naraz: get_cutting_all_data(thickness, material, gas)
 
-# Metody do pobierania danych
-#  Jeśli w aktualnym kodzie masz fragmenty w stylu:
-#    pythonprice = cutting_prices[(thickness, material, gas)]
-#  Musisz je zmienić na:
-#    pythonprice = cutting_prices[(thickness, material, gas)]['price']
-# LUB lepiej:
-#    price = get_cutting_price(thickness, material, gas)
-#   
+def get_material_price(material, thickness):
+    """Cena materiału [PLN/kg] z indeksu cennika (None gdy brak)"""
+    return material_index.lookup(material, thickness, policy=price_policy)
 
-# Pobieranie pojedynczych wartości
-#   pythonthickness, material, gas = 2.0, "ALUMINIUM", "N"
-#   price = get_cutting_price(thickness, material, gas)
-#   speed = get_cutting_speed(thickness, material, gas) 
-#   hour_price = get_cutting_hour_price(thickness, material, gas)
-#   utilization = get_cutting_utilization(thickness, material, gas)
 
-# Pobieranie wszystkich danych naraz
-#   all_data = get_cutting_all_data(thickness, material, gas)
+def _cutting_value(thickness, material, gas, field):
+    return cutting_index.lookup((material, gas), thickness, field, policy=price_policy)
+
+
+def _cutting_entry(thickness, material, gas):
+    """Wszystkie pola cennika cięcia jako krotka (None gdy brak ceny)"""
+    if _cutting_value(thickness, material, gas, "price") is None:
+        return None
+    return tuple(_cutting_value(thickness, material, gas, f) for f in CUTTING_FIELDS)
+
 
 def get_cutting_price(thickness, material, gas):
     """Pobiera cenę cięcia dla podanych parametrów"""
-    key = (thickness, material, gas)
-    if key in cutting_prices:
-        return cutting_prices[key]['price']
-    return None
+    return _cutting_value(thickness, material, gas, "price")
 
 
 def get_cutting_speed(thickness, material, gas):
     """Pobiera prędkość cięcia dla podanych parametrów"""
-    key = (thickness, material, gas)
-    if key in cutting_prices:
-        return cutting_prices[key]['speed']
-    return None
+    return _cutting_value(thickness, material, gas, "speed")
 
 
 def get_cutting_hour_price(thickness, material, gas):
     """Pobiera cenę godzinową dla podanych parametrów"""
-    key = (thickness, material, gas)
-    if key in cutting_prices:
-        return cutting_prices[key]['hour_price']
-    return None
+    return _cutting_value(thickness, material, gas, "hour_price")
 
 
 def get_cutting_utilization(thickness, material, gas):
     """Pobiera wykorzystanie dla podanych parametrów"""
-    key = (thickness, material, gas)
-    if key in cutting_prices:
-        return cutting_prices[key]['utilization']
-    return None
+    return _cutting_value(thickness, material, gas, "utilization")
 
 
 def get_cutting_all_data(thickness, material, gas):
     """Pobiera wszystkie dane cięcia dla podanych parametrów"""
-    key = (thickness, material, gas)
-    if key in cutting_prices:
-        data = cutting_prices[key].copy()
-        data['thickness'] = thickness
-        data['material'] = material
-        data['gas'] = gas
-        return data
-    return None
+    entry = _cutting_entry(thickness, material, gas)
+    if entry is None:
+        return None
+    data = dict(zip(CUTTING_FIELDS, entry))
+    data['thickness'] = thickness
+    data['material'] = material
+    data['gas'] = gas
+    return data
 
 
 def get_cutting_data_dict(thickness, material, gas):
     """Zwraca słownik z wszystkimi danymi cięcia"""
-    key = (thickness, material, gas)
-    if key in cutting_prices:
-        return {
-            'thickness': thickness,
-            'material': material,
-            'gas': gas,
-            'price': cutting_prices[key]['price'],
-            'speed': cutting_prices[key]['speed'],
-            'hour_price': cutting_prices[key]['hour_price'],
-            'utilization': cutting_prices[key]['utilization']
-        }
-    return None
+    return get_cutting_all_data(thickness, material, gas)
 
 # ---- UI tests (Panel 3) ----
 def ui_find_material_price():
     mat = _norm_s(material_var.get()); thk = _parse_float(thickness_mat_var.get())
     if not mat or thk is None:
         messagebox.showerror("Error", "Fill in Material and Thickness (mm)."); return
-    price = material_prices.get((mat, thk))
-    material_result_label.config(text="Material Result: not found" if price is None else f"Material Result: {format_pln(price)} PLN/kg")
+    price = get_material_price(mat, thk)
+    text = "Material Result: not found" if price is None else f"Material Result: {format_pln(price)} PLN/kg"
+    best = cheapest_material_quote(mat, thk, when=price_date)
+    if best is not None:
+        text += f"\nCheapest: {best.supplier or '?'} {best.format} {format_pln(best.price)} PLN/kg" + (
+            f" ({best.date:%Y-%m-%d})" if best.date else "")
+    material_result_label.config(text=text)
 
 def ui_find_cutting_price():
     mat = _norm_s(material_cut_var.get()); thk = _parse_float(thickness_cut_var.get()); gas = _norm_s(gas_var.get())
     if not mat or thk is None or not gas:
         messagebox.showerror("Error", "Fill in Material, Thickness (mm) and Gas."); return
-    price = cutting_prices.get((thk, mat, gas))
+    price = get_cutting_price(thk, mat, gas)
     cutting_result_label.config(text="Cutting Result: not found" if price is None else f"Cutting Result: {format_pln(price)} PLN/m")
 
 # ---- Folder analysis ----
@@ -1806,24 +2282,6 @@ def _ensure_cenniki_loaded():
         except Exception: ok = False
     return ok
 
-def get_total_cut_length(ws, text="Total") -> float:
-    """
-    Searches in column A for the first cell containing 'text' (case-insensitive),
-    then reads the value from column H (8) in the same row.
-    Returns float; handles Polish format '312,51'.
-    """
-    for cell in ws['A']:
-        val = cell.value
-        if val and str(text).lower() in str(val).lower():
-            raw = ws.cell(row=cell.row, column=8).value  # col. H
-            if isinstance(raw, (int, float)):
-                return float(raw)
-            try:
-                return float(str(raw).replace(" ", "").replace("\xa0", "").replace(",", "."))
-            except Exception:
-                return 0.0
-    raise ValueError(f"No row with text '{text}' found in column A")
-
 def parse_duration_to_hours(value) -> float:
     """
     Converts '1h26min21s', '1h26m21s', '86min', '90s', '1:26:21', '1:26' etc. to float hours.
@@ -1869,25 +2327,9 @@ def parse_duration_to_hours(value) -> float:
 
     return h + m/60.0 + sec/3600.0
 
-def _interp(x, pts):
-    """Linear interpolation over sorted (x, y) points. Clamps outside the range."""
-    pts = sorted(pts, key=lambda p: p[0])
-    if x <= pts[0][0]:
-        return pts[0][1]
-    if x >= pts[-1][0]:
-        return pts[-1][1]
-    for (x0, y0), (x1, y1) in zip(pts[:-1], pts[1:]):
-        if x0 <= x <= x1:
-            if x1 == x0:
-                return y0
-            t = (x - x0) / (x1 - x0)
-            return y0 + t * (y1 - y0)
-    return pts[-1][1]
-
 def update_cost_calculations():
     """Update all cost calculation displays in Panel 2"""
     global oxygen_cutting_time, nitrogen_cutting_time, aluminum_nitrogen_cutting_time, total_material_cost
-    global oxygen_rate_entry_tkw, nitrogen_rate_entry_tkw, al_nitrogen_rate_entry_tkw, bending_percent_entry_tkw
 
     # Get rates from entries
     oxygen_rate = _parse_float(oxygen_rate_entry.get()) or 350.0
@@ -1896,89 +2338,771 @@ def update_cost_calculations():
     op_cost_per_sheet = _parse_float(op_cost_entry.get()) or 40.0
     tech_per_order = _parse_float(tech_order_entry.get()) or 0.0
     add_costs_order = _parse_float(add_order_cost_entry.get()) or 0.0
-    
-    oxygen_rate_tkw = _parse_float(oxygen_rate_entry_TKW.get()) or 262.50
-    nitrogen_rate_tkw = _parse_float(nitrogen_rate_entry_TKW.get()) or 412.50
-    al_nitrogen_rate_tkw = _parse_float(al_nitrogen_rate_entry_TKW.get()) or 487.50
-    bending_percent_entry_tkw = _parse_float(bending_percent_entry_TKW.get()) or 75.0
 
-    # Calculate cutting costs
-    oxygen_cost = oxygen_cutting_time * oxygen_rate
-    nitrogen_cost = nitrogen_cutting_time * nitrogen_rate + aluminum_nitrogen_cutting_time * al_nitrogen_rate
-    total_cutting_cost = oxygen_cost + nitrogen_cost
-    
-    # Calculate operational costs
-    operational_costs = (total_sheets * op_cost_per_sheet) + tech_per_order + add_costs_order
-    
-    # Calculate total
-    total_all_costs = total_material_cost + total_cutting_cost + operational_costs
-    
+    costs = costing.order_costs(
+        (oxygen_cutting_time, nitrogen_cutting_time, aluminum_nitrogen_cutting_time),
+        (oxygen_rate, nitrogen_rate, al_nitrogen_rate), total_material_cost,
+        total_sheets, op_cost_per_sheet, tech_per_order, add_costs_order)
+
     # Update display labels
     oxygen_time_label.config(text=f"{oxygen_cutting_time:.2f}".replace('.', ','))
     nitrogen_time_label.config(text=f"{nitrogen_cutting_time + aluminum_nitrogen_cutting_time:.2f}".replace('.', ','))
-    oxygen_cost_label.config(text=format_pln(oxygen_cost))
-    nitrogen_cost_label.config(text=format_pln(nitrogen_cost))
-    material_cost_label.config(text=format_pln(total_material_cost))
-    total_cutting_cost_label.config(text=format_pln(total_cutting_cost))
-    operational_cost_label.config(text=format_pln(operational_costs))
-    total_all_costs_label.config(text=format_pln(total_all_costs))
+    oxygen_cost_label.config(text=format_pln(costs.oxygen))
+    nitrogen_cost_label.config(text=format_pln(costs.nitrogen))
+    material_cost_label.config(text=format_pln(costs.material))
+    total_cutting_cost_label.config(text=format_pln(costs.cutting))
+    operational_cost_label.config(text=format_pln(costs.operational))
+    total_all_costs_label.config(text=format_pln(costs.total))
+
+def _set_order_total(total_gr):
+    """Shows an order total [gr] in the total row and keeps it for the reports."""
+    if total_row_iid:
+        tree.set(total_row_iid, column="7", value=format_grosze_pln(total_gr))
+    SetTotalPricePerOrder(money.to_pln(total_gr))
 
 def update_total():
-    """Update total in the tree view"""
-    global total_row_iid
-    
-    total = 0.0
-    for item in tree.get_children():
-        if item == total_row_iid:
-            continue
-        vals = tree.item(item, 'values')
-        qty = _parse_float(vals[5]) or 0
-        cost = _parse_float(vals[6]) or 0
-        bending = _parse_float(vals[7]) or 0
-        additional = _parse_float(vals[8]) or 0
-        total += (cost + bending + additional) * qty
-    
+    """Update total in the tree view (exact sum of the shown rows from order_prices)"""
     if total_row_iid:
-        tree.set(total_row_iid, column="7", value=format_pln(total))
-        SetTotalPricePerOrder(total)
+        _set_order_total(order_prices.total(_shown_price_rows()))
+
+# Part thumbnails are read from the export zips on demand (thumbnails.py);
+# Treeview rows get their image when they scroll into view.
+thumbnail_store = ThumbnailStore()
+TREE_THUMBNAILS_MAX = 300  # PhotoImages kept for rows that scrolled out of view
+# Row iid -> thumbnail source, row iid -> PhotoImage (references prevent GC)
+tree_thumb_sources = {}
+thumbnail_imgs = OrderedDict()
+_thumb_load_pending = False
+
+def _order_parts_store():
+    """The PartsStore that owns the parts of the order when "Disk parts store" is
+    ticked, else None (an open store is closed)."""
+    global parts_store, file_results
+    if not parts_store_var.get():
+        if parts_store is not None:
+            parts_store.close()
+            parts_store = None
+            # per-file results whose parts were in the store are gone with it
+            file_results = {f: res for f, res in file_results.items() if 'parts' in res}
+        return None
+    if parts_store is None:
+        parts_store = PartsStore()
+    return parts_store
+
+def _adopt_parts(parts):
+    """The parts list to keep as all_parts: ``parts`` itself, or a view of the
+    disk parts store holding them when that option is ticked."""
+    store = _order_parts_store()
+    if store is None:
+        return parts
+    stored = store.replace(parts)
+    analysis_logger.log(f"Parts store: {len(stored)} parts in {parts_store.path}", "INFO")
+    return stored
+
+def _row_part_index(vals):
+    """Index in all_parts of a table row (by its Nr column), None for other rows."""
+    try:
+        index = int(vals[0]) - 1
+    except (IndexError, TypeError, ValueError):
+        return None
+    return index if 0 <= index < len(all_parts) else None
+
+def _part_columns(*keys):
+    """Tuples of the part keys ``keys`` (subnr, id, name, material, thickness,
+    file_name) of every part in order; read from the store's columns when it
+    holds the parts."""
+    if isinstance(all_parts, StoredParts):
+        return all_parts.store.columns(*keys)
+    return (tuple(p.get(k) for k in keys) for p in all_parts)
+
+def _tree_part_rows():
+    """(row iid, index in all_parts, values) of the part rows shown in the table.
+
+    Rows are matched to parts by their Nr column, so sorted or filtered rows
+    still get the right part."""
+    rows = []
+    for iid in tree.get_children():
+        if iid == total_row_iid:
+            continue
+        vals = tree.item(iid, 'values')
+        index = _row_part_index(vals)
+        if index is not None:
+            rows.append((iid, index, vals))
+    return rows
+
+def _shown_price_rows():
+    """Indices in order_prices of the part rows shown in the table."""
+    return [index for _, index, _ in _tree_part_rows() if index < len(order_prices)]
+
+def _reset_order_prices():
+    """order_prices from the qty and prices of all_parts (after an analysis or a project load)."""
+    global order_prices, applied_margins
+    order_prices = money.PriceTable.from_parts(all_parts)
+    applied_margins = None
+
+def _part_thumb_source(part):
+    """(export path, zip member) of a part's thumbnail, or the PNG bytes of a loaded project."""
+    return part.get('thumb_ref') or part.get('thumb_data')
+
+def _part_thumb_png(part):
+    """PNG bytes of a part's thumbnail for reports and project files (None if unavailable)."""
+    return thumbnail_store.png(_part_thumb_source(part))
+
+def _set_row_thumbnail(iid, source):
+    if source:
+        tree_thumb_sources[iid] = source
+        _schedule_thumbnail_load()
+
+def _forget_row_thumbnail(iid):
+    tree_thumb_sources.pop(iid, None)
+    thumbnail_imgs.pop(iid, None)
+
+def _clear_row_thumbnails():
+    tree_thumb_sources.clear()
+    thumbnail_imgs.clear()
+
+def _on_tree_scroll(first, last):
+    scrollbar.set(first, last)
+    _schedule_thumbnail_load()
+
+def _schedule_thumbnail_load():
+    global _thumb_load_pending
+    if not _thumb_load_pending:
+        _thumb_load_pending = True
+        root.after_idle(_load_visible_thumbnails)
+
+def _load_visible_thumbnails():
+    """Gives the rows in view (and one screen around them) their thumbnails."""
+    global _thumb_load_pending
+    _thumb_load_pending = False
+    children = tree.get_children()
+    if not children or not tree_thumb_sources:
+        return
+    first, last = (float(f) for f in tree.yview())
+    n = len(children)
+    margin = max(1, int(round((last - first) * n)))
+    start = max(0, int(first * n) - margin)
+    end = min(n, int(math.ceil(last * n)) + margin)
+    visible = children[start:end]
+    for iid in visible:
+        if iid in thumbnail_imgs:
+            thumbnail_imgs.move_to_end(iid)
+            continue
+        source = tree_thumb_sources.get(iid)
+        if source is None:
+            continue
+        img = _make_tree_thumbnail(source)
+        if img is not None:
+            tree.item(iid, image=img)
+        thumbnail_imgs[iid] = img  # None: not readable, not retried
+    # Rows far out of view give their images back
+    while len(thumbnail_imgs) > max(TREE_THUMBNAILS_MAX, len(visible)):
+        iid, img = thumbnail_imgs.popitem(last=False)
+        if img is not None and tree.exists(iid):
+            tree.item(iid, image='')
+
+def _margin_settings():
+    """Margin-suggestion policy the per-file results were computed with."""
+    return _margin_policy()
+
+def _file_price_inputs(material_name, mat_norm, thk_val, gas_key):
+    """Price list values used for one file's costs (to detect price list changes)."""
+    return (get_material_price(mat_norm, thk_val),
+            _cutting_entry(thk_val, mat_norm, gas_key),
+            _cutting_entry(thk_val, material_name, gas_key))
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_size, st.st_mtime_ns)
+    except OSError:
+        return None
+
+def _is_file_result_current(res, signature):
+    """True when a cached per-file result can be reused as is."""
+    return (signature is not None and res.get('signature') == signature
+            and res['margin_settings'] == _margin_settings()
+            and res['price_inputs'] == _file_price_inputs(*res['price_key']))
+
+def _preflight_header(importer, header):
+    """Cheap check of one export from its format and its All Task List header.
+
+    importer: importers.sniff() result; header: cypnest_reader.ExportHeader
+    (None for other formats). Returns (errors, price_key): errors make the
+    file unusable, price_key is (material, thickness, gas key) or None when
+    B4/C4/E4 are not valid. Problems further down the sheets are found when
+    the file is costed.
+    """
+    if importer is None:
+        return ["unreadable or not a supported export format"], None
+    if importer.name != "cypnest":
+        return [f"{importer.name} file - no nesting data to cost"], None
+    errors = []
+    if not header.has_task_sheet:
+        errors.append("missing 'All Task List' sheet")
+    if not header.has_cost_sheet:
+        errors.append("missing 'Cost List' sheet")
+    price_key = None
+    if header.has_task_sheet:
+        mat_norm = _norm_s(header.material)
+        thk_val = _parse_float(header.thickness)
+        gas_key = _map_gas_to_key(header.gas)
+        if not mat_norm:
+            errors.append("All Task List!B4 (Material) – no value")
+        if thk_val is None:
+            errors.append("All Task List!C4 (Thickness(mm)) – no number")
+        if not gas_key:
+            errors.append(f"All Task List!E4 (Gas) – unsupported gas type '{header.gas}'")
+        if mat_norm and thk_val is not None and gas_key:
+            price_key = (mat_norm, thk_val, gas_key)
+    return errors, price_key
+
+def _preflight(paths):
+    """Pre-flight pass over all exports of a batch (analysis worker thread).
+
+    Every file is only sniffed (importers.sniff) and its All Task List header
+    read (cypnest_reader.read_export_header), so the pass costs a few small
+    XML reads per file and the files can be parsed and costed one by one
+    afterwards. Returns (skipped, report): {file name: [errors]} of files the
+    main pass must skip, and the diagnostics report as (level, message)
+    lines. Files whose material/thickness/gas is missing from a price list
+    are reported once per combination and still costed with 0.00.
+    """
+    skipped = {}
+    needs = {}  # (material, thickness, gas) -> file names
+    for path in paths:
+        fname = os.path.basename(path)
+        importer = sniff(path)
+        header = None
+        if importer is not None and importer.name == "cypnest":
+            try:
+                header = read_export_header(path)
+            except Exception as e:
+                skipped[fname] = [f"cannot read file: {e}"]
+                continue
+        errors, price_key = _preflight_header(importer, header)
+        if errors:
+            skipped[fname] = errors
+        elif price_key:
+            needs.setdefault(price_key, []).append(fname)
+
+    # every combination of the batch priced in one vectorised lookup per list
+    keys = sorted(needs)
+    thicknesses = [k[1] for k in keys]
+    material_groups = [k[0] for k in keys]
+    cutting_groups = [(k[0], k[2]) for k in keys]
+    found = {
+        "material": material_index.lookup_many(material_groups, thicknesses, policy=price_policy),
+        "cutting": cutting_index.lookup_many(cutting_groups, thicknesses, policy=price_policy),
+    }
+    exact = found
+    if price_policy != "exact":
+        exact = {
+            "material": material_index.lookup_many(material_groups, thicknesses, policy="exact"),
+            "cutting": cutting_index.lookup_many(cutting_groups, thicknesses, policy="exact"),
+        }
+    missing = []
+    approximated = []
+    for i, (mat_norm, thk_val, gas_key) in enumerate(keys):
+        fnames = needs[keys[i]]
+        files = f"({len(fnames)} file(s): {', '.join(fnames)})"
+        lists = [name for name in ("material", "cutting") if np.isnan(found[name][i])]
+        if lists:
+            missing.append(f"No {' / '.join(lists)} price for {mat_norm} {thk_val}mm {gas_key} "
+                           f"{files} - using 0.00")
+        lists = [name for name in ("material", "cutting")
+                 if np.isnan(exact[name][i]) and not np.isnan(found[name][i])]
+        if lists:
+            approximated.append(f"No {' / '.join(lists)} price listed for {mat_norm} {thk_val}mm {gas_key}, "
+                                f"{price_policy}: " + ", ".join(f"{found[n][i]:.2f}" for n in lists) + f" {files}")
+
+    report = [("INFO", f"Checked {len(paths)} file(s): {len(paths) - len(skipped)} OK, "
+                       f"{len(skipped)} skipped, {len(missing)} price combination(s) missing")]
+    for fname, errors in skipped.items():
+        report.append(("ERROR", f"Skipping {fname}: {'; '.join(errors)}"))
+    report.extend(("WARNING", line) for line in missing)
+    report.extend(("INFO", line) for line in approximated)
+    return skipped, report
+
+def _analyze_export(export, fname, policy):
+    """Calculates one parsed export (base prices + 7% material margin).
+
+    Returns the file's contribution to the analysis: its parts (costs before
+    overhead), group for the DOCX, margin suggestion data, cutting time and
+    sheet/part counts. Raises on missing sheets or data.
+
+    Runs on the analysis worker thread: GUI values come in as arguments.
+    Missing prices and header problems are reported by the pre-flight pass.
+    """
+    for warning in export.warnings:
+        analysis_logger.log(f"{fname}: {warning}", "WARNING")
+
+    # Check for required sheets
+    if not export.has_task_sheet:
+        analysis_logger.log(f"Missing 'All Task List' sheet in {fname}", "ERROR")
+        raise KeyError("No 'All Task List' sheet")
+
+    if not export.has_parts_sheet:
+        analysis_logger.log(f"Missing 'All Parts List' sheet in {fname}", "WARNING")
+    file_thumbnails = export.thumbnail_members
+    if file_thumbnails:
+        analysis_logger.log(f"Found {len(file_thumbnails)} thumbnails", "INFO")
+
+    # Parse key data
+    cut_time = parse_duration_to_hours(export.cut_time)
+    if cut_time == 0:
+        analysis_logger.log(f"Cut time is zero or invalid in {fname}", "WARNING")
+
+    if export.total_cut_length is None:
+        raise ValueError("No row with text 'Total' found in column A")
+    total_cut_length = export.total_cut_length
+    if total_cut_length == 0:
+        analysis_logger.log(f"Total cut length is zero in {fname}", "WARNING")
+
+    material_name = export.material
+    thickness_raw = export.thickness
+    gas_raw = export.gas
+
+    mat_norm = _norm_s(material_name)
+    thk_val = _parse_float(thickness_raw)
+    gas_key = _map_gas_to_key(gas_raw)
+
+    # Validate critical data
+    if not mat_norm:
+        analysis_logger.log(f"Material name missing in All Task List!B4", "ERROR")
+        raise ValueError("All Task List!B4 (Material) – no value")
+    if thk_val is None:
+        analysis_logger.log(f"Thickness value invalid in All Task List!C4", "ERROR")
+        raise ValueError("All Task List!C4 (Thickness(mm)) – no number")
+    if not gas_key:
+        analysis_logger.log(f"Gas type '{gas_raw}' not recognized (should be O/N)", "ERROR")
+        raise ValueError("All Task List!E4 (Gas) – unsupported gas type")
+
+    analysis_logger.log(f"Material: {mat_norm}, Thickness: {thk_val}mm, Gas: {gas_key}", "INFO")
+
+    # Analyze plate sizes for margin CALCULATION (not application)
+    analysis_logger.log("Calculating suggested margins (will not be applied automatically)", "INFO")
+
+    if export.plate_size_col:
+        analysis_logger.log(f"Found 'Plate Size' in column {export.plate_size_col}", "INFO")
+    else:
+        analysis_logger.log("No 'Plate Size(mm*mm)' column found in row 7", "WARNING")
+    if export.sheets_qty_col:
+        analysis_logger.log(f"Found 'Sheets' quantity in column {export.sheets_qty_col}", "INFO")
+
+    # Process data rows (starting from row 8): plate area, sheets, cut length
+    task_rows = []
+    for task_row in export.task_rows:
+        try:
+            task_rows.append((task_row.row,
+                              parse_plate_size(task_row.plate_size),
+                              _parse_float(task_row.sheets_qty) or 0,
+                              _parse_float(task_row.cut_length)*1000 or 0.0))
+        except Exception as e:
+            analysis_logger.log(f"Error processing row {task_row.row}: {e}", "WARNING")
+    areas = [r[1] for r in task_rows]
+    sheets_qtys = [r[2] for r in task_rows]
+    cut_lengths = [r[3] for r in task_rows]
+
+    # Margins for SUGGESTION ONLY, all rows at once; averages weighted by sheets / cut length
+    material_margins, cutting_margins, avg_file_material_margin, avg_file_cutting_margin = \
+        policy.suggest(areas, sheets_qtys, cut_lengths)
+    for (row_idx, _, _, _), material_margin, cutting_margin in zip(task_rows, material_margins.tolist(),
+                                                                    cutting_margins.tolist()):
+        analysis_logger.log(f"Row {row_idx}: Calculated suggested margins - "
+                          f"Material {material_margin:.1f}%, Cutting {cutting_margin:.1f}%", "INFO")
+
+    file_total_area = sum(a * q for a, q in zip(areas, sheets_qtys))
+    file_total_cutting = sum(cut_lengths)
+    row_count = len(task_rows)
+
+    analysis_logger.log(f"File suggested margins: Material {avg_file_material_margin:.1f}%, "
+                      f"Cutting {avg_file_cutting_margin:.1f}%", "INFO")
+
+    # Cutting time bucket by gas type
+    gas_bucket = None
+    if gas_key == "O":
+        gas_bucket = "O"
+        analysis_logger.log(f"Added {cut_time:.2f}h to O₂ cutting time", "INFO")
+    elif gas_key == "N":
+        if 'AL' in mat_norm:
+            gas_bucket = "AL_N"
+            analysis_logger.log(f"Added {cut_time:.2f}h to AL N₂ cutting time", "INFO")
+        else:
+            gas_bucket = "N"
+            analysis_logger.log(f"Added {cut_time:.2f}h to N₂ cutting time", "INFO")
+
+    # Look up prices
+    base_price_per_kg = get_material_price(mat_norm, thk_val) or 0.0
+    if base_price_per_kg == 0.0:
+        analysis_logger.log(f"No material price found for {mat_norm} {thk_val}mm - using 0.00", "WARNING")
+    else:
+        analysis_logger.log(f"Material price found: {base_price_per_kg} PLN/kg", "INFO")
+    base_rate_per_cut_length = get_cutting_price(thk_val, mat_norm, gas_key) or 0.0
+    if base_rate_per_cut_length == 0.0:
+        analysis_logger.log(f"No cutting price found for {mat_norm} {thk_val}mm with {gas_key} - using 0.00", "WARNING")
+    else:
+        analysis_logger.log(f"Cutting price found: {base_rate_per_cut_length} PLN/m", "INFO")
+    # Check Cost List sheet
+    if not export.has_cost_sheet:
+        analysis_logger.log(f"Missing 'Cost List' sheet in {fname}", "ERROR")
+        raise KeyError("No 'Cost List' sheet")
+
+    # Utilization rate
+    if not export.has_utilization:
+        analysis_logger.log("'Average utilization:' not found in Cost List", "ERROR")
+        raise ValueError("Not found 'Average utilization:'")
+
+    util_str = export.utilization
+    util_val = _parse_float(str(util_str).replace("%", "")) if util_str is not None else None
+    utilization_rate = (util_val / 100.0) if (util_val is not None) else 0.0
+
+    if utilization_rate <= 0 or utilization_rate > 1:
+        analysis_logger.log(f"Average utilization out of range: {utilization_rate*100:.1f}%", "WARNING")
+
+    # Material Price row
+    if export.rate_per_contour is None:
+        analysis_logger.log("'Material Price' row not found in Cost List", "ERROR")
+        raise ValueError("No 'Material Price' row")
+
+    rate_per_contour = export.rate_per_contour
+    rate_per_marking_length = export.rate_per_marking_length
+    rate_per_defilm_length = export.rate_per_defilm_length
+
+    # Count sheets
+    sheets_in_file = export.sheets_in_file
+    analysis_logger.log(f"Found {sheets_in_file} sheets in file", "INFO")
+
+    # Parts data
+    if export.parts is None:
+        analysis_logger.log("No starting row found for parts data (col. A – ID)", "ERROR")
+        raise ValueError("No starting row found (col. A – ID)")
+
+    # Process parts
+    parts = []
+    parts_qty = 0
+
+    for part_row in export.parts:
+        lp = part_row.lp
+        part_qty = part_row.qty
+        weight = part_row.weight
+
+        adj_weight = (weight / utilization_rate) if utilization_rate > 0 else weight
+
+        thumbnail_ref = None
+        all_parts_row = 2 + lp
+        if all_parts_row in file_thumbnails:
+            thumbnail_ref = (export.path, file_thumbnails[all_parts_row])
+
+        parts.append({
+            'id': lp,
+            'subnr': None,  # set when the file is merged into all_parts
+            'name': part_row.name,
+            'material': material_name,
+            'gas_key': gas_key,
+            'thickness': thk_val,
+            'qty': int(part_qty) if isinstance(part_qty, (int, float)) else 0,
+            'cuuting_speed_m_min': get_cutting_speed(thk_val, material_name, gas_key),
+            'hour_price' : get_cutting_hour_price(thk_val, material_name, gas_key),
+            'utilization' : get_cutting_utilization(thk_val, material_name, gas_key),
+            'cost_per_unit': 0.0,  # set below from the costing engine
+            'base_cost_per_unit': 0.0,
+            'bending_per_unit': 0.0,
+            'additional_per_unit': 0.0,
+            'raw_weight': weight,
+            'contours_qty': part_row.contours_qty,
+            'cut_length': part_row.cut_length,
+            'marking_length': part_row.marking_length,
+            'defilm_length': part_row.defilm_length,
+            'adj_weight': adj_weight,
+            'base_price_per_kg': base_price_per_kg,
+            'base_rate_per_cut_length': base_rate_per_cut_length,
+            'base_cut_cost': 0.0,
+            'rate_per_contour': rate_per_contour,
+            'rate_per_marking_length': rate_per_marking_length,
+            'rate_per_defilm_length': rate_per_defilm_length,
+            'thumb_ref': thumbnail_ref,
+            'calculated_material_margin': avg_file_material_margin,  # Store for later use
+            'calculated_cutting_margin': avg_file_cutting_margin,    # Store for later use
+            'file_name': fname,
+        })
+        parts_qty += int(part_qty) if isinstance(part_qty, (int, float)) else 0
+
+    # Base costs with ONLY the mandatory 7% material margin, all parts at once
+    costs = _set_base_costs(parts)
+    parts_for_group = []
+    for k, part in enumerate(parts):
+        total_part = float(costs.unit[k])
+
+        # Log detailed cost breakdown for this part
+        analysis_logger.log(f"Part {part['id']} ({part['name']}) cost breakdown:", "INFO")
+        analysis_logger.log(f"  Base material: {costs.material_base[k]:.2f} PLN (weight: {part['adj_weight']:.3f} kg @ {base_price_per_kg:.2f} PLN/kg)", "INFO")
+        analysis_logger.log(f"  Material with 7%: {costs.material[k]:.2f} PLN", "INFO")
+        analysis_logger.log(f"  Cutting: {costs.cutting[k]:.2f} PLN (length: {part['cut_length']:.2f} m @ {base_rate_per_cut_length:.2f} PLN/m)", "INFO")
+        analysis_logger.log(f"  Contours: {costs.contours[k]:.2f} PLN", "INFO")
+        analysis_logger.log(f"  Marking: {costs.marking[k]:.2f} PLN", "INFO")
+        analysis_logger.log(f"  Defilm: {costs.defilm[k]:.2f} PLN", "INFO")
+        analysis_logger.log(f"  Total per unit: {total_part:.2f} PLN", "INFO")
+
+        parts_for_group.append((part['name'], part['cost_per_unit'], part['qty']))
+    parts_count = len(parts)
+
+    analysis_logger.log(f"Processed {parts_count} parts from {fname} with only 7% material margin", "SUCCESS")
+
+    return {
+        'file_name': fname,
+        'parts': parts,  # costs before overhead distribution (moved to the parts store in store mode)
+        'part_count': parts_count,
+        'material_cost': _material_cost(costs, parts),
+        'group': (material_name, thk_val, parts_for_group),
+        # file margin data FOR SUGGESTION
+        'margin': {
+            'filename': fname,
+            'material_margin': avg_file_material_margin,
+            'cutting_margin': avg_file_cutting_margin,
+            'total_area': file_total_area,
+            'total_cutting': file_total_cutting,
+            'row_count': row_count
+        },
+        'gas_bucket': gas_bucket,
+        'cut_time': cut_time,
+        'sheets': sheets_in_file,
+        'parts_qty': parts_qty,
+        # inputs the costs depend on, compared by incremental re-analysis
+        'price_key': (material_name, mat_norm, thk_val, gas_key),
+        'price_inputs': _file_price_inputs(material_name, mat_norm, thk_val, gas_key),
+        'margin_settings': policy,
+        'layouts': [_layout_record(layout, parts) for layout in export.layouts],
+    }
 
-# References to PhotoImage to prevent images from disappearing (GC)
-thumbnail_imgs = []
 
-def analyze_xlsx_folder():
-    """ANALYZE WITHOUT APPLYING MARGINS - ONLY 7% MATERIAL MARGIN IS AUTOMATIC"""
+def _set_base_costs(parts):
+    """Sets the costs of one file's parts before overhead (price lists + 7%
+    material margin); returns their costing.CostBreakdown."""
+    costs = costing.breakdown(costing.PartCostArrays.from_parts(parts))
+    for k, part in enumerate(parts):
+        part['cost_per_unit'] = money.round_pln(float(costs.unit[k]))
+        part['base_cost_per_unit'] = money.round_pln(costs.base_unit[k])
+        part['base_cut_cost'] = float(costs.cutting_base[k])
+    return costs
+
+def _material_cost(costs, parts):
+    """Material of all pieces of a file (with the 7%)."""
+    return float(costs.material @ np.array([p['qty'] for p in parts], dtype=float))
+
+def _part_price_fields(material_name, mat_norm, thk_val, gas_key):
+    """Price list values kept in every part of a file (price_key order)."""
+    return {
+        'base_price_per_kg': get_material_price(mat_norm, thk_val) or 0.0,
+        'base_rate_per_cut_length': get_cutting_price(thk_val, mat_norm, gas_key) or 0.0,
+        'cuuting_speed_m_min': get_cutting_speed(thk_val, material_name, gas_key),
+        'hour_price': get_cutting_hour_price(thk_val, material_name, gas_key),
+        'utilization': get_cutting_utilization(thk_val, material_name, gas_key),
+    }
+
+def _reprice_file_result(res, store=None):
+    """A per-file result re-costed at the current price lists from its kept
+    parts, without reading the export again. In store mode the re-costed
+    parts replace the result's rows in the store."""
+    fields = _part_price_fields(*res['price_key'])
+    parts = [dict(part, **fields) for part in _file_parts(res, store)]
+    costs = _set_base_costs(parts)
+    material_name, _, thk_val, _ = res['price_key']
+    new = dict(res, price_inputs=_file_price_inputs(*res['price_key']), material_cost=_material_cost(costs, parts),
+               group=(material_name, thk_val, [(p['name'], p['cost_per_unit'], p['qty']) for p in parts]))
+    if store is None:
+        new['parts'] = parts
+    else:
+        store.drop_file_parts(res['rows'])
+        new['rows'] = store.add_file_parts(parts)
+    return new
+
+def _layout_record(layout, parts):
+    """Plate layout of one Result sheet; 'part_index' points into the file's parts."""
+    local_index = {}
+    for i, part in enumerate(parts):
+        local_index.setdefault(part['name'], i)
+    return {
+        'subnr': None,  # set on merge, like the parts
+        'sheet': layout.sheet,
+        'task_row': layout.task_row,
+        'material': layout.material,
+        'thickness': layout.thickness,
+        'plate_size': layout.plate_size,
+        'nested_size': layout.nested_size,
+        'cut_number': layout.cut_number,
+        'cut_time_h': parse_duration_to_hours(layout.cut_time),
+        'part_qty': layout.part_qty,
+        'parts': [{
+            'part_index': local_index.get(pp.name),
+            'name': pp.name,
+            'qty_on_plate': pp.qty_on_plate,
+            'qty_total': pp.qty_total,
+            'cut_length': pp.cut_length,
+        } for pp in layout.parts],
+    }
+
+def _index_plate_layouts():
+    """Rebuilds plates_by_part from plate_layouts."""
+    plates_by_part.clear()
+    for li, layout in enumerate(plate_layouts):
+        for pp in layout['parts']:
+            if pp['part_index'] is not None:
+                plates_by_part.setdefault(pp['part_index'], []).append((li, pp['qty_on_plate']))
+
+def plates_for_part(part_index):
+    """[(layout dict, pieces on one plate)] for a row of all_parts - for per-plate cost allocation."""
+    return [(plate_layouts[li], qty) for li, qty in plates_by_part.get(part_index, [])]
+
+def _part_tree_values(nr, p):
+    return (
+        nr,
+        p['subnr'],
+        p['name'],
+        p['material'],
+        f"{p['thickness']}",
+        p['qty'],
+        format_pln(p['cost_per_unit']),
+        "",
+        "",
+        format_pln(p['adj_weight']),
+        format_pln(p['cut_length']),
+    )
+
+def _with_table_prices(values, index):
+    """Row values with the quantity and prices of row ``index`` of order_prices."""
+    values = list(values)
+    if index < len(order_prices):
+        values[5] = int(order_prices.qty[index])
+        values[6] = format_grosze_pln(order_prices.unit[index])
+        values[7] = format_grosze_pln(order_prices.bending[index]) if order_prices.bending[index] else ""
+        values[8] = format_grosze_pln(order_prices.additional[index]) if order_prices.additional[index] else ""
+    return values
+
+def _make_tree_thumbnail(source):
+    try:
+        pil_img = thumbnail_store.image(source)
+        if pil_img is None:
+            return None
+        max_w, max_h = 140, 70
+        w, h = pil_img.size
+        ratio = min(max_w / w, max_h / h, 1.0)
+        new_w = int(w * ratio)
+        new_h = int(h * ratio)
+        pil_img = pil_img.resize((new_w, new_h), Image.LANCZOS)
+        return ImageTk.PhotoImage(pil_img)
+    except Exception as e:
+        analysis_logger.log(f"Failed to create thumbnail: {str(e)}", "WARNING")
+        return None
+
+def _tree_shows_file_results():
+    """True when the Treeview still holds exactly the rows of the last analysis."""
+    expected = [iid for res in file_results.values() for iid in res.get('iids', [])]
+    children = [c for c in tree.get_children() if c != total_row_iid]
+    return (bool(total_row_iid) and tree.exists(total_row_iid)
+            and len(children) == len(expected) and set(children) == set(expected))
+
+def _populate_parts_tree(results, stale):
+    """Shows all_parts in the Treeview.
+
+    Rows of reused file results are renumbered and moved in place (their
+    thumbnails and tags, e.g. locked, are kept); rows of ``stale`` results
+    are deleted and rows of new results are inserted at their position.
+    Quantities and prices are those of order_prices.
+    """
+    for res in stale:
+        for iid in res.get('iids', []):
+            _forget_row_thumbnail(iid)
+            if tree.exists(iid):
+                tree.delete(iid)
+    index = 0
+    parts = iter(all_parts)  # one cursor pass with the disk parts store
+    for res in results:
+        old_iids = res.get('iids')
+        iids = []
+        for k in range(res['part_count']):
+            part = next(parts)
+            values = _with_table_prices(_part_tree_values(index + 1, part), index)
+            if old_iids:
+                iid = old_iids[k]
+                tree.item(iid, values=values)
+                tree.move(iid, '', index)
+            else:
+                iid = tree.insert('', index, values=values)
+                _set_row_thumbnail(iid, _part_thumb_source(part))
+            iids.append(iid)
+            index += 1
+        res['iids'] = iids
+
+def analyze_xlsx_folder(prefetched=None, quiet=False, incremental=None):
+    """ANALYZE WITHOUT APPLYING MARGINS - ONLY 7% MATERIAL MARGIN IS AUTOMATIC
+
+    Files are read and costed on a worker thread; rows appear in the table as
+    files finish and the totals are filled in when all are done.
+
+    prefetched: {file name: CypNestExport} already parsed by the folder watcher.
+    quiet: no summary dialog at the end (auto-ingest).
+    incremental: reuse per-file results (default: the "Incremental
+    re-analysis" checkbox)."""
     global all_parts, last_groups, last_total_cost, last_folder_path, total_sheets, total_parts_qty, total_row_iid
     global oxygen_cutting_time, nitrogen_cutting_time, aluminum_nitrogen_cutting_time, total_material_cost
-    global file_margins, avg_material_margin, avg_cutting_margin
-    
+    global file_margins, avg_material_margin, avg_cutting_margin, file_results, plate_layouts
+    global analysis_job
+
+    if analysis_job is not None or batch_job is not None:
+        analysis_logger.log("Analysis already running", "WARNING")
+        return
+
     # Clear log and start analysis
     analysis_logger.clear()
     analysis_logger.log("STARTING XLSX FOLDER ANALYSIS (BASE PRICES + 7% MATERIAL MARGIN ONLY)", "PHASE")
-    
-    # Initialize cutting time accumulators
-    oxygen_cutting_time = 0.0
-    nitrogen_cutting_time = 0.0
-    aluminum_nitrogen_cutting_time = 0.0
-    total_material_cost = 0.0
-    
-    # Initialize margin tracking
-    file_margins = []
 
-    for item in tree.get_children():
-        tree.delete(item)
-    thumbnail_imgs.clear()
-    all_parts = []
-    
     folder_path = folder_var.get()
+    # With "Disk parts store" the parts of every file go to the store as the
+    # file is costed and file_results only keeps their row range
+    store = _order_parts_store()
+    # Incremental mode reuses per-file results of the last analysis of the same
+    # folder while the table still shows them (no filter / loaded project),
+    # kept in the same place (memory or the store)
+    if incremental is None:
+        incremental = incremental_var.get()
+    incremental = (incremental and bool(file_results) and bool(folder_path) and bool(last_folder_path)
+                   and _same_folder(folder_path, last_folder_path)
+                   and all(('parts' in res) == (store is None) for res in file_results.values())
+                   and _tree_shows_file_results())
+
+    # In incremental mode the current results stay in place until the merge
+    if not incremental:
+        # Initialize cutting time accumulators
+        oxygen_cutting_time = 0.0
+        nitrogen_cutting_time = 0.0
+        aluminum_nitrogen_cutting_time = 0.0
+        total_material_cost = 0.0
+
+        # Initialize margin tracking
+        file_margins = []
+
+        for item in tree.get_children():
+            tree.delete(item)
+        _clear_row_thumbnails()
+        all_parts = []
+        plate_layouts = []
+        plates_by_part.clear()
+        file_results = {}
+        if store is not None:
+            store.drop_file_parts()
+    
     if not folder_path:
         analysis_logger.log("No folder selected", "ERROR")
-        messagebox.showerror("Error", "Please select a folder.")
+        if not quiet:
+            messagebox.showerror("Error", "Please select a folder.")
         return
     
     analysis_logger.log(f"Analyzing folder: {folder_path}", "INFO")
     
     try:
-        files = [f for f in os.listdir(folder_path) if f.lower().endswith(".xlsx")]
+        # Sorted so part numbering does not depend on directory order or on ingestion mode
+        files = sorted(f for f in os.listdir(folder_path) if f.lower().endswith(".xlsx"))
         analysis_logger.log(f"Found {len(files)} XLSX files", "INFO")
     except Exception as e:
         analysis_logger.log(f"Failed to list folder contents: {str(e)}", "ERROR")
@@ -1986,14 +3110,16 @@ def analyze_xlsx_folder():
     
     if not files:
         analysis_logger.log("No XLSX files found in the selected folder", "ERROR")
-        messagebox.showerror("Error", "No .xlsx files in the selected folder.")
+        if not quiet:
+            messagebox.showerror("Error", "No .xlsx files in the selected folder.")
         return
     
     # Check price lists
     analysis_logger.log("CHECKING PRICE LISTS", "PHASE")
     if not _ensure_cenniki_loaded():
         analysis_logger.log("Price lists not loaded - calculations will use 0.00 values", "WARNING")
-        messagebox.showwarning("Warning", "Price lists not loaded – using 0.00, check Panel 3.")
+        if not quiet:
+            messagebox.showwarning("Warning", "Price lists not loaded – using 0.00, check Panel 3.")
 
     global op_cost_per_sheet, tech_per_order, add_costs_order
     op_cost_per_sheet = _parse_float(op_cost_entry.get()) or 0.0
@@ -2002,382 +3128,350 @@ def analyze_xlsx_folder():
     
     analysis_logger.log(f"Fixed costs: Op/sheet={op_cost_per_sheet:.2f}, Tech/order={tech_per_order:.2f}, Add={add_costs_order:.2f}", "INFO")
 
-    total_sheets = 0
-    total_parts_qty = 0
-    groups = []
-    subnr = 0
-
-    # Process each file
+    # Decide which files have to be (re)read
+    signatures = {f: _file_signature(os.path.join(folder_path, f)) for f in files}
+    previous = file_results if incremental else {}
+    plan = reanalysis.plan(files, previous, lambda f, res: _is_file_result_current(res, signatures[f]))
+    reused, to_read, stale = plan.reused, plan.to_read, plan.stale
+    if incremental:
+        added = sum(1 for f in to_read if f not in previous)
+        removed = sum(1 for f in previous if f not in signatures)
+        analysis_logger.log(f"Incremental re-analysis: {len(reused)} unchanged, {added} added, "
+                            f"{len(to_read) - added} modified, {removed} removed", "INFO")
+
+    # Process each file (worker thread)
     analysis_logger.log("PROCESSING FILES AND CALCULATING MARGIN SUGGESTIONS", "PHASE")
-    
-    for file_idx, fname in enumerate(files, 1):
-        analysis_logger.log(f"Processing file {file_idx}/{len(files)}: {fname}", "INFO")
-        path = os.path.join(folder_path, fname)
-        
-        file_material_margins = []
-        file_cutting_margins = []
-        
+    parallel = parallel_ingest_var.get()
+    if parallel:
+        analysis_logger.log("Parallel ingestion enabled - files are parsed in worker processes", "INFO")
+    prefetched = {os.path.join(folder_path, f): rec for f, rec in (prefetched or {}).items()}
+    job = {
+        'folder_path': folder_path,
+        'files': files,
+        'signatures': signatures,
+        'reused': reused,
+        'stale': stale,
+        'incremental': incremental,
+        'quiet': quiet,
+        'store': store,
+        'new_results': {},
+        'skipped': {},  # file name -> reasons, from the pre-flight or the main pass
+        'queue': queue.Queue(),
+        'cancel': threading.Event(),
+    }
+    analysis_job = job
+    _set_analysis_running(True, 2 * len(to_read))  # reading + costing
+    if not to_read:
+        _finish_analysis(job)
+        return
+    worker = threading.Thread(
+        target=_analysis_worker, name="AnalysisWorker", daemon=True,
+        args=(job, [os.path.join(folder_path, f) for f in to_read], parallel, parse_cache_var.get(),
+              prefetched, _margin_policy()))
+    worker.start()
+    root.after(ANALYSIS_POLL_MS, _drain_analysis_queue, job)
+
+def _analysis_worker(job, paths, parallel, use_cache, prefetched, policy):
+    """Reads and costs the files; results go to job['queue'] (never touches Tk)."""
+    q = job['queue']
+    parse_cache = None
+    if use_cache:
         try:
-            wb = load_workbook(path, data_only=True)
-            
-            # Check for required sheets
-            if "All Task List" not in wb.sheetnames:
-                analysis_logger.log(f"Missing 'All Task List' sheet in {fname}", "ERROR")
-                raise KeyError("No 'All Task List' sheet")
-            
-            all_task = wb["All Task List"]
-            
-            if "All Parts List" not in wb.sheetnames:
-                analysis_logger.log(f"Missing 'All Parts List' sheet in {fname}", "WARNING")
-                all_part_list = None
-                file_thumbnails = {}
-            else:
-                all_part_list = wb["All Parts List"]
-                file_thumbnails = {}
-                thumbnail_count = 0
-                for img in all_part_list._images:
-                    row = img.anchor._from.row + 1
-                    col = img.anchor._from.col + 1
-                    if col == 2:  # Column B
-                        img_data = img._data()
-                        file_thumbnails[row] = img_data
-                        thumbnail_count += 1
-                if thumbnail_count > 0:
-                    analysis_logger.log(f"Found {thumbnail_count} thumbnails", "INFO")
-            
-            # Parse key data
-            cut_time = parse_duration_to_hours(all_task['F4'].value)
-            if cut_time == 0:
-                analysis_logger.log(f"Cut time is zero or invalid in {fname}", "WARNING")
-            
-            total_cut_length = get_total_cut_length(all_task, "Total")
-            if total_cut_length == 0:
-                analysis_logger.log(f"Total cut length is zero in {fname}", "WARNING")
-            
-            material_name = all_task["B4"].value
-            thickness_raw = all_task["C4"].value
-            gas_raw = all_task["E4"].value
-            
-            mat_norm = _norm_s(material_name)
-            thk_val = _parse_float(thickness_raw)
-            gas_key = _map_gas_to_key(gas_raw)
-
-            # Validate critical data
-            if not mat_norm:
-                analysis_logger.log(f"Material name missing in All Task List!B4", "ERROR")
-                raise ValueError("All Task List!B4 (Material) – no value")
-            if thk_val is None:
-                analysis_logger.log(f"Thickness value invalid in All Task List!C4", "ERROR")
-                raise ValueError("All Task List!C4 (Thickness(mm)) – no number")
-            if not gas_key:
-                analysis_logger.log(f"Gas type '{gas_raw}' not recognized (should be O/N)", "ERROR")
-                raise ValueError("All Task List!E4 (Gas) – unsupported gas type")
-            
-            analysis_logger.log(f"Material: {mat_norm}, Thickness: {thk_val}mm, Gas: {gas_key}", "INFO")
-
-            # Analyze plate sizes for margin CALCULATION (not application)
-            analysis_logger.log("Calculating suggested margins (will not be applied automatically)", "INFO")
-            
-            # Find header row
-            plate_size_col = None
-            sheets_qty_col = None
-            
-            for col in range(1, all_task.max_column + 1):
-                header_val = all_task.cell(row=7, column=col).value
-                if header_val and "Plate Size" in str(header_val):
-                    plate_size_col = col
-                    analysis_logger.log(f"Found 'Plate Size' in column {col}", "INFO")
-                if header_val and ("Sheets" in str(header_val) or col == 4):
-                    sheets_qty_col = col
-                    analysis_logger.log(f"Found 'Sheets' quantity in column {col}", "INFO")
-            
-            if not plate_size_col:
-                analysis_logger.log("No 'Plate Size(mm*mm)' column found in row 7", "WARNING")
-                plate_size_col = 3  # Default to column C
-            
-            if not sheets_qty_col:
-                sheets_qty_col = 4  # Default to column D
-            
-            # Process data rows (starting from row 8)
-            row_idx = 8
-            file_total_area = 0.0
-            file_total_cutting = 0.0
-            row_count = 0
-            
-            while all_task.cell(row=row_idx, column=sheets_qty_col).value is not None:
+            parse_cache = ParseCache(PARSE_CACHE_DIR)
+        except OSError as e:
+            analysis_logger.log(f"Parse cache unavailable: {e}", "WARNING")
+    try:
+        # Pre-flight on the format and the All Task List header only, so the
+        # first file's rows still show up as soon as that file is costed
+        skipped, report = _preflight(paths)
+        q.put(('preflight', skipped, report))
+        to_cost = [p for p in paths if os.path.basename(p) not in skipped]
+        # Records arrive in the order of `paths`, so the merge is the same in every mode
+        exports = read_exports(to_cost, parallel=parallel, cache=parse_cache, prefetched=prefetched)
+        try:
+            # Main pass - every file is costed as soon as it is read; a bad file
+            # is skipped, never the whole batch
+            for path, export, read_error in exports:
+                if job['cancel'].is_set():
+                    q.put(('cancelled',))
+                    return
+                fname = os.path.basename(path)
+                q.put(('read', fname))
+                if read_error is not None:
+                    q.put(('skipped', fname, f"cannot read file: {read_error}"))
+                    continue
+                analysis_logger.log(f"Processing file {paths.index(path) + 1}/{len(paths)}: {fname}", "INFO")
                 try:
-                    # Get plate size and calculate area
-                    plate_size_str = all_task.cell(row=row_idx, column=plate_size_col).value
-                    plate_area_m2 = parse_plate_size(plate_size_str)
-                    
-                    # Get number of sheets
-                    sheets_qty = _parse_float(all_task.cell(row=row_idx, column=sheets_qty_col).value) or 0
-                    
-                    # Calculate cutting length for this row (from column H)
-                    row_cutting_length = _parse_float(all_task.cell(row=row_idx, column=8).value)*1000 or 0.0
-                    
-                    # Calculate margins for SUGGESTION ONLY
-                    material_margin = calculate_material_margin(plate_area_m2)
-                    cutting_margin = calculate_cutting_margin(row_cutting_length)
-                    
-                    # Accumulate weighted averages
-                    file_material_margins.append((material_margin, sheets_qty))
-                    file_cutting_margins.append((cutting_margin, row_cutting_length))
-                    
-                    file_total_area += plate_area_m2 * sheets_qty
-                    file_total_cutting += row_cutting_length
-                    row_count += 1
-                    
-                    analysis_logger.log(f"Row {row_idx}: Calculated suggested margins - "
-                                      f"Material {material_margin:.1f}%, Cutting {cutting_margin:.1f}%", "INFO")
-                    
+                    res = _analyze_export(export, fname, policy)
                 except Exception as e:
-                    analysis_logger.log(f"Error processing row {row_idx}: {e}", "WARNING")
-                
-                row_idx += 1
-            
-            # Calculate average margins for SUGGESTION
-            avg_file_material_margin = 0.0
-            avg_file_cutting_margin = 0.0
-            
-            if file_material_margins:
-                total_weight = sum(weight for margin, weight in file_material_margins)
-                if total_weight > 0:
-                    avg_file_material_margin = sum(margin * weight for margin, weight in file_material_margins) / total_weight
-            
-            if file_cutting_margins:
-                total_length = sum(length for margin, length in file_cutting_margins)
-                if total_length > 0:
-                    avg_file_cutting_margin = sum(margin * length for margin, length in file_cutting_margins) / total_length
-            
-            analysis_logger.log(f"File suggested margins: Material {avg_file_material_margin:.1f}%, "
-                              f"Cutting {avg_file_cutting_margin:.1f}%", "INFO")
-
-            # Accumulate cutting time by gas type
-            if gas_key == "O":
-                oxygen_cutting_time += cut_time
-                analysis_logger.log(f"Added {cut_time:.2f}h to O₂ cutting time", "INFO")
-            elif gas_key == "N":
-                if 'AL' in mat_norm:
-                    aluminum_nitrogen_cutting_time += cut_time
-                    analysis_logger.log(f"Added {cut_time:.2f}h to AL N₂ cutting time", "INFO")
-                else:
-                    nitrogen_cutting_time += cut_time
-                    analysis_logger.log(f"Added {cut_time:.2f}h to N₂ cutting time", "INFO")
-
-            # Look up prices
-            base_price_per_kg = material_prices.get((mat_norm, thk_val), 0.0)
-            if base_price_per_kg == 0.0:
-                analysis_logger.log(f"No material price found for {mat_norm} {thk_val}mm - using 0.00", "WARNING")
-                messagebox.showerror("Warning", f"No material price found for {mat_norm} {thk_val}mm - using 0.00")
-            else:
-                analysis_logger.log(f"Material price found: {base_price_per_kg} PLN/kg", "INFO")
-            base_rate_per_cut_length = cutting_prices.get((thk_val, mat_norm, gas_key), 0.0)
-            if base_rate_per_cut_length == 0.0:
-                analysis_logger.log(f"No cutting price found for {mat_norm} {thk_val}mm with {gas_key} - using 0.00", "WARNING")
-                messagebox.showerror("Warning", f"No cutting price found for {mat_norm} {thk_val}mm with {gas_key} - using 0.00")
-            else:
-                analysis_logger.log(f"Cutting price found: {base_rate_per_cut_length} PLN/m", "INFO")
-            # Check Cost List sheet
-            if "Cost List" not in wb.sheetnames:
-                analysis_logger.log(f"Missing 'Cost List' sheet in {fname}", "ERROR")
-                raise KeyError("No 'Cost List' sheet")
-                messagebox.showerror("Error", "No 'Cost List' sheet")
-            cost_sheet = wb["Cost List"]
-
-            # Find utilization rate
-            util_row = None
-            for r in range(1, cost_sheet.max_row + 1):
-                for c in range(1, cost_sheet.max_column + 1):
-                    v = cost_sheet.cell(row=r, column=c).value
-                    if v and "Average utilization:" in str(v):
-                        util_row = r
-                        break
-                if util_row:
-                    break
-            
-            if util_row is None:
-                analysis_logger.log("'Average utilization:' not found in Cost List", "ERROR")
-                raise ValueError("Not found 'Average utilization:'")
-            
-            util_str = cost_sheet.cell(row=util_row, column=11).value
-            util_val = _parse_float(str(util_str).replace("%", "")) if util_str is not None else None
-            utilization_rate = (util_val / 100.0) if (util_val is not None) else 0.0
-            
-            if utilization_rate <= 0 or utilization_rate > 1:
-                analysis_logger.log(f"Average utilization out of range: {utilization_rate*100:.1f}%", "WARNING")
-
-            # Find Material Price row
-            mat_price_row = None
-            for r in range(1, cost_sheet.max_row + 1):
-                v = cost_sheet.cell(row=r, column=1).value
-                if v and "Material Price" in str(v):
-                    mat_price_row = r
-                    break
-            
-            if mat_price_row is None:
-                analysis_logger.log("'Material Price' row not found in Cost List", "ERROR")
-                raise ValueError("No 'Material Price' row")
-                messagebox.showerror("Warning", f"Material Price' row not found in Cost List")
-            def parse_num(cellv):
-                if cellv is None:
-                    return 0.0
-                s = str(cellv).strip()
-                s = ''.join(ch for ch in s.split()[0] if ch.isdigit() or ch in ('.', ','))
-                s = s.replace(",", ".")
-                try:
-                    return float(s or "0.0")
-                except Exception:
-                    analysis_logger.log(f"Failed to parse number: {cellv}", "WARNING")
-                    return 0.0
-
-            rate_per_contour = parse_num(cost_sheet.cell(row=mat_price_row, column=7).value)
-            rate_per_marking_length = parse_num(cost_sheet.cell(row=mat_price_row, column=9).value)
-            rate_per_defilm_length = parse_num(cost_sheet.cell(row=mat_price_row, column=10).value)
-
-            # Count sheets
-            r_idx = 8
-            sheets_in_file = 0
-            while all_task.cell(row=r_idx, column=4).value is not None:
-                v = all_task.cell(row=r_idx, column=4).value
-                if isinstance(v, (int, float)):
-                    sheets_in_file += int(v)
-                r_idx += 1
-            total_sheets += sheets_in_file
-            analysis_logger.log(f"Found {sheets_in_file} sheets in file", "INFO")
-
-            # Find parts data starting row
-            start_row = None
-            for r in range(1, cost_sheet.max_row + 1):
-                a_val = cost_sheet.cell(row=r, column=1).value
-                if a_val and isinstance(a_val, (int, float)):
-                    start_row = r
-                    break
-            
-            if start_row is None:
-                analysis_logger.log("No starting row found for parts data (col. A – ID)", "ERROR")
-                raise ValueError("No starting row found (col. A – ID)")
-
-            # Process parts
-            parts_for_group = []
-            subnr += 1
-            lp = 0
-            row = start_row
-            parts_count = 0
-            
-            while row <= cost_sheet.max_row and isinstance(cost_sheet.cell(row=row, column=1).value, (int, float)):
-                lp += 1
-                part_name = cost_sheet.cell(row=row, column=2).value
-                part_qty = cost_sheet.cell(row=row, column=5).value or 0
-                weight = parse_num(cost_sheet.cell(row=row, column=6).value)
-                contours_qty = parse_num(cost_sheet.cell(row=row, column=7).value)
-                cut_length = parse_num(cost_sheet.cell(row=row, column=8).value)
-                marking_length = parse_num(cost_sheet.cell(row=row, column=9).value)
-                defilm_length = parse_num(cost_sheet.cell(row=row, column=10).value)
-
-                adj_weight = (weight / utilization_rate) if utilization_rate > 0 else weight
-
-                # Calculate base costs with ONLY 7% material margin (automatic)
-                base_material_cost = adj_weight * base_price_per_kg
-                base_rate_per_cut_length = get_cutting_price(thk_val,mat_norm, gas_key)
-                base_cut_cost = cut_length * base_rate_per_cut_length
-                
-                # Apply ONLY mandatory 7% minimum material cost increase
-                material_cost = adj_weight * base_price_per_kg * 1.07
-                cut_cost = cut_length * base_rate_per_cut_length  # NO margin on cutting
-                
-                base_total_part = base_material_cost + contours_qty * rate_per_contour + base_cut_cost + marking_length * rate_per_marking_length + defilm_length * rate_per_defilm_length
-                total_part = material_cost + contours_qty * rate_per_contour + cut_cost + marking_length * rate_per_marking_length + defilm_length * rate_per_defilm_length
-
-                thumbnail_data = None
-                all_parts_row = 2 + lp
-                if all_parts_row in file_thumbnails:
-                    thumbnail_data = file_thumbnails[all_parts_row]
-
-                all_parts.append({
-                    'id': lp,
-                    'subnr': subnr,
-                    'name': part_name,
-                    'material': material_name,
-                    'gas_key': gas_key,
-                    'thickness': thk_val,
-                    'qty': int(part_qty) if isinstance(part_qty, (int, float)) else 0,
-                    'cuuting_speed_m_min': get_cutting_speed(thk_val, material_name, gas_key),
-                    'hour_price' : get_cutting_hour_price(thk_val, material_name, gas_key),
-                    'utilization' : get_cutting_utilization(thk_val, material_name, gas_key),
-                    'cost_per_unit': float(f"{total_part:.2f}"),
-                    'base_cost_per_unit': float(f"{base_total_part:.2f}"),
-                    'bending_per_unit': 0.0,
-                    'additional_per_unit': 0.0,
-                    'raw_weight': weight,
-                    'contours_qty': contours_qty,
-                    'cut_length': cut_length,
-                    'marking_length': marking_length,
-                    'defilm_length': defilm_length,
-                    'adj_weight': adj_weight,
-                    'base_price_per_kg': base_price_per_kg,
-                    'base_rate_per_cut_length': base_rate_per_cut_length,
-                    'base_cut_cost': base_cut_cost,
-                    'rate_per_contour': rate_per_contour,
-                    'rate_per_marking_length': rate_per_marking_length,
-                    'rate_per_defilm_length': rate_per_defilm_length,
-                    'thumb_data': thumbnail_data,
-                    'calculated_material_margin': avg_file_material_margin,  # Store for later use
-                    'calculated_cutting_margin': avg_file_cutting_margin,    # Store for later use
-                    'file_name': fname,
-                })
-
-                # Log detailed cost breakdown for this part
-                analysis_logger.log(f"Part {lp} ({part_name}) cost breakdown:", "INFO")
-                analysis_logger.log(f"  Base material: {base_material_cost:.2f} PLN (weight: {adj_weight:.3f} kg @ {base_price_per_kg:.2f} PLN/kg)", "INFO")
-                analysis_logger.log(f"  Material with 7%: {material_cost:.2f} PLN", "INFO")
-                analysis_logger.log(f"  Cutting: {cut_cost:.2f} PLN (length: {cut_length:.2f} m @ {base_rate_per_cut_length:.2f} PLN/m)", "INFO")
-                analysis_logger.log(f"  Contours: {contours_qty * rate_per_contour:.2f} PLN", "INFO")
-                analysis_logger.log(f"  Marking: {marking_length * rate_per_marking_length:.2f} PLN", "INFO")
-                analysis_logger.log(f"  Defilm: {defilm_length * rate_per_defilm_length:.2f} PLN", "INFO")
-                analysis_logger.log(f"  Total per unit: {total_part:.2f} PLN", "INFO")
-
-                parts_for_group.append((part_name, float(f"{total_part:.2f}"),
-                                        int(part_qty) if isinstance(part_qty, (int, float)) else 0))
-                total_parts_qty += int(part_qty) if isinstance(part_qty, (int, float)) else 0
-                parts_count += 1
-                row += 1
-
-            analysis_logger.log(f"Processed {parts_count} parts from {fname} with only 7% material margin", "SUCCESS")
-            groups.append((material_name, thk_val, parts_for_group))
-            
-            # Store file margin data FOR SUGGESTION
-            file_margins.append({
-                'filename': fname,
-                'material_margin': avg_file_material_margin,
-                'cutting_margin': avg_file_cutting_margin,
-                'total_area': file_total_area,
-                'total_cutting': file_total_cutting,
-                'row_count': row_count
-            })
-
-        except Exception as e:
+                    q.put(('skipped', fname, str(e)))
+                    continue
+                q.put(('file', fname, res))
+        finally:
+            exports.close()
+        if parse_cache:
+            analysis_logger.log(f"Parse cache: {parse_cache.hits} file(s) reused, {parse_cache.misses} parsed", "INFO")
+        q.put(('done',))
+    except Exception as e:  # e.g. the process pool could not start
+        q.put(('error', '', e))
+    finally:
+        if parse_cache:
+            parse_cache.save()
+
+def _set_analysis_running(running, file_count=0):
+    """Progress bar, Cancel, Analyze and price-editing button state."""
+    analysis_progress.config(maximum=max(file_count, 1), value=0)
+    # rows streamed in during the run are not mapped to all_parts until the merge
+    for button in (btn_analyze, btn_report, update_prices_button, update_margins_button, lock_rows_button,
+                   margin_sweep_button):
+        button.state(['disabled'] if running else ['!disabled'])
+    apply_margins_btn.config(state=tk.DISABLED if running else tk.NORMAL)
+    btn_cancel_analysis.state(['!disabled'] if running else ['disabled'])
+
+def cancel_analysis():
+    for job in (analysis_job, batch_job):
+        if job is not None:
+            job['cancel'].set()
+            analysis_logger.log("Cancelling analysis...", "WARNING")
+
+def _drain_analysis_queue(job):
+    """Tk-thread side of the analysis: shows finished files, then merges."""
+    if job is not analysis_job:
+        return
+    while True:
+        try:
+            msg = job['queue'].get_nowait()
+        except queue.Empty:
+            break
+        analysis_logger.flush()
+        kind = msg[0]
+        if kind == 'read':
+            analysis_progress.step(1)
+        elif kind == 'preflight':
+            _, skipped, report = msg
+            analysis_logger.log("PRE-FLIGHT VALIDATION", "PHASE")
+            for level, line in report:
+                analysis_logger.log(line, level)
+            job['skipped'].update(skipped)
+            job['diagnostics'] = report
+            analysis_progress.step(2 * len(skipped))  # neither read nor costed
+        elif kind == 'file':
+            _, fname, res = msg
+            res['signature'] = job['signatures'][fname]
+            job['new_results'][fname] = res
+            _show_streamed_rows(job, res)
+            if job['store'] is not None:
+                # the store owns the parts from here on; the result keeps their rows
+                res['rows'] = job['store'].add_file_parts(res.pop('parts'))
+            analysis_progress.step(1)
+        elif kind == 'skipped':
+            _, fname, reason = msg
+            analysis_logger.log(f"Skipping {fname}: {reason}", "ERROR")
+            job['skipped'][fname] = [reason]
+            analysis_progress.step(1)
+        elif kind == 'error':
+            _, fname, e = msg
+            _abort_analysis(job)
             analysis_logger.log(f"Critical error processing {fname}: {str(e)}", "ERROR")
-            messagebox.showerror("Error", f"Error processing file {fname}: {e}")
+            if not job['quiet']:
+                messagebox.showerror("Error", f"Error processing file {fname}: {e}")
             return
-
-    # Calculate overall average margins FOR SUGGESTION
-    analysis_logger.log("CALCULATING SUGGESTED MARGINS (NOT APPLIED)", "PHASE")
-    
+        elif kind == 'cancelled':
+            _abort_analysis(job)
+            analysis_logger.log("Analysis cancelled", "WARNING")
+            return
+        elif kind == 'done':
+            _finish_analysis(job)
+            return
+    analysis_logger.flush()
+    root.after(ANALYSIS_POLL_MS, _drain_analysis_queue, job)
+
+def _show_streamed_rows(job, res):
+    """Adds the rows of a file as soon as it is costed (before overhead)."""
+    subnr = job['files'].index(res['file_name']) + 1
+    res['iids'] = []
+    nr = len(tree.get_children())
+    for part in res['parts']:
+        nr += 1
+        iid = tree.insert('', 'end', values=_part_tree_values(nr, dict(part, subnr=subnr)))
+        _set_row_thumbnail(iid, _part_thumb_source(part))
+        res['iids'].append(iid)
+
+def _abort_analysis(job):
+    """Drops rows streamed by an analysis that failed or was cancelled."""
+    global analysis_job
+    for res in job['new_results'].values():
+        for iid in res.get('iids', []):
+            _forget_row_thumbnail(iid)
+            if tree.exists(iid):
+                tree.delete(iid)
+        if 'rows' in res:
+            job['store'].drop_file_parts(res['rows'])
+    analysis_logger.flush()
+    analysis_job = None
+    _set_analysis_running(False)
+
+def _file_parts(res, store=None):
+    """The parts of one per-file result: in memory, or read back from the parts store."""
+    if 'parts' in res:
+        return res['parts']
+    return store.file_parts(res['rows'])
+
+def _merge_file_results(results, op_cost_per_sheet, tech_per_order, add_costs_order, store=None):
+    """Merges per-file results (in order) into one order; no GUI access.
+
+    Parts and layouts are numbered by position (subnr), overhead is spread
+    over the pieces and all totals are summed from the per-file values.
+    Returns a dict with the parts, plate layouts, DOCX groups, file margins,
+    cutting times, sheet/piece counts, suggested margins and costs.
+
+    With a PartsStore the per-file parts are read from it and the merged
+    parts are written into it file by file; 'parts' is then its StoredParts
+    view and no list of all parts is built.
+    """
+    oxygen_cutting_time = 0.0
+    nitrogen_cutting_time = 0.0
+    aluminum_nitrogen_cutting_time = 0.0
+    total_sheets = 0
+    total_parts_qty = 0
+    groups = []
+    file_margins = []
+    layouts = []
+    part_count = 0
+    for subnr, res in enumerate(results, 1):
+        if res['gas_bucket'] == "O":
+            oxygen_cutting_time += res['cut_time']
+        elif res['gas_bucket'] == "AL_N":
+            aluminum_nitrogen_cutting_time += res['cut_time']
+        elif res['gas_bucket'] == "N":
+            nitrogen_cutting_time += res['cut_time']
+        total_sheets += res['sheets']
+        total_parts_qty += res['parts_qty']
+        first_part = part_count
+        part_count += res['part_count']
+        for layout in res['layouts']:
+            layout = dict(layout, subnr=subnr, file_name=res['file_name'])
+            layout['parts'] = [dict(pp, part_index=None if pp['part_index'] is None else first_part + pp['part_index'])
+                               for pp in layout['parts']]
+            layouts.append(layout)
+        groups.append(res['group'])
+        file_margins.append(res['margin'])
+
+    # Weighted average margins FOR SUGGESTION
+    avg_material_margin = 0.0
+    avg_cutting_margin = 0.0
     if file_margins:
         total_material_weight = sum(fm['total_area'] for fm in file_margins)
         total_cutting_length = sum(fm['total_cutting'] for fm in file_margins)
-        
         if total_material_weight > 0:
             avg_material_margin = sum(fm['material_margin'] * fm['total_area'] for fm in file_margins) / total_material_weight
-        else:
-            avg_material_margin = 0.0
-        
         if total_cutting_length > 0:
             avg_cutting_margin = sum(fm['cutting_margin'] * fm['total_cutting'] for fm in file_margins) / total_cutting_length
-        else:
-            avg_cutting_margin = 0.0
-        
+
+    # Distribution of overheads per piece
+    extra_per_part, op_cost_per_part = costing.overhead_per_part(
+        total_sheets, total_parts_qty, op_cost_per_sheet, tech_per_order, add_costs_order)
+
+    def merged_parts():
+        for subnr, res in enumerate(results, 1):
+            for part in _file_parts(res, store):
+                p = dict(part)
+                p['subnr'] = subnr
+                p['cost_per_unit'] = money.round_pln(p['cost_per_unit'] + extra_per_part + op_cost_per_part)
+                p['base_cost_per_unit'] = money.round_pln(p['base_cost_per_unit'] + extra_per_part + op_cost_per_part)
+                yield p
+
+    parts = list(merged_parts()) if store is None else store.replace(merged_parts())
+
+    # Material incl. the 7% minimum
+    total_material_cost = sum(res['material_cost'] for res in results)
+
+    return {
+        'parts': parts,
+        'plate_layouts': layouts,
+        'groups': groups,
+        'file_margins': file_margins,
+        'oxygen_cutting_time': oxygen_cutting_time,
+        'nitrogen_cutting_time': nitrogen_cutting_time,
+        'aluminum_nitrogen_cutting_time': aluminum_nitrogen_cutting_time,
+        'total_sheets': total_sheets,
+        'total_parts_qty': total_parts_qty,
+        'avg_material_margin': avg_material_margin,
+        'avg_cutting_margin': avg_cutting_margin,
+        'extra_per_part': extra_per_part,
+        'op_cost_per_part': op_cost_per_part,
+        'total_material_cost': total_material_cost,
+        'total_order': money.to_pln(money.PriceTable.from_parts(parts).total()),
+    }
+
+def _merged_groups(groups):
+    """DOCX groups with the prices in whole grosze, and their total [PLN]."""
+    total_sum = 0
+    merged_groups = []
+    for (mat_name, thk, parts) in groups:
+        adj = []
+        for (nm, cost, qty) in parts:
+            c = money.grosz(cost)
+            adj.append((nm, money.to_pln(c), qty))
+            total_sum += c * qty
+        merged_groups.append((mat_name, thk, adj))
+    return merged_groups, money.to_pln(total_sum)
+
+def _finish_analysis(job):
+    """Merges per-file results and fills in totals (Tk thread)."""
+    global all_parts, last_groups, last_total_cost, last_folder_path, total_sheets, total_parts_qty, total_row_iid
+    global oxygen_cutting_time, nitrogen_cutting_time, aluminum_nitrogen_cutting_time, total_material_cost
+    global file_margins, avg_material_margin, avg_cutting_margin, file_results, plate_layouts
+    global analysis_job, order_prices
+    analysis_logger.flush()
+    folder_path = job['folder_path']
+    files = job['files']
+    reused = job['reused']
+    new_results = job['new_results']
+    stale = job['stale']
+    incremental = job['incremental']
+    quiet = job['quiet']
+
+    # Merge per-file results in file-name order; totals are re-summed from the
+    # per-file contributions, which gives the same floats as a full run.
+    # Skipped files have no result and are left out.
+    results = [reused.get(f) or new_results[f] for f in files if f in reused or f in new_results]
+    # table rows of the last analysis (an incremental run starts from a table showing exactly them)
+    previous_spans = reanalysis.spans(file_results.values())
+    previous_prices = order_prices
+    file_results = {res['file_name']: res for res in results}
+    store = job['store']
+    order = _merge_file_results(results, op_cost_per_sheet, tech_per_order, add_costs_order, store=store)
+    all_parts = order['parts']
+    if store is not None:
+        for res in stale:
+            store.drop_file_parts(res['rows'])
+        analysis_logger.log(f"Parts store: {len(all_parts)} parts in {store.path}", "INFO")
+    if incremental and len(previous_prices) == sum(count for _, count in previous_spans.values()):
+        # unchanged files keep their table rows as they are (edits, applied
+        # margins, solver prices); only the rows of re-read files are new
+        order_prices = reanalysis.carry_prices(money.PriceTable.from_parts(all_parts), previous_prices,
+                                               previous_spans, reanalysis.spans(results), reused)
+    else:
+        _reset_order_prices()
+    plate_layouts = order['plate_layouts']
+    file_margins = order['file_margins']
+    groups = order['groups']
+    oxygen_cutting_time = order['oxygen_cutting_time']
+    nitrogen_cutting_time = order['nitrogen_cutting_time']
+    aluminum_nitrogen_cutting_time = order['aluminum_nitrogen_cutting_time']
+    total_sheets = order['total_sheets']
+    total_parts_qty = order['total_parts_qty']
+    avg_material_margin = order['avg_material_margin']
+    avg_cutting_margin = order['avg_cutting_margin']
+    total_material_cost = order['total_material_cost']
+    _index_plate_layouts()
+    analysis_logger.log(f"Plate layouts: {len(plate_layouts)} nests, "
+                        f"{sum(l['cut_number'] for l in plate_layouts)} plates", "INFO")
+
+    # Overall average margins FOR SUGGESTION
+    analysis_logger.log("CALCULATING SUGGESTED MARGINS (NOT APPLIED)", "PHASE")
+    if file_margins:
         analysis_logger.log(f"Suggested margins: Material {avg_material_margin:.1f}%, Cutting {avg_cutting_margin:.1f}%", "SUCCESS")
         
         # Auto-populate proposed margin fields with calculated averages
@@ -2388,35 +3482,17 @@ def analyze_xlsx_folder():
         avg_material_label.config(text=f"{avg_material_margin:.2f}%")
         avg_cutting_label.config(text=f"{avg_cutting_margin:.2f}%")
     else:
-        avg_material_margin = 0.0
-        avg_cutting_margin = 0.0
         material_margin_var.set("0,00")
         cutting_margin_var.set("0,00")
 
     analysis_logger.log("CALCULATING OVERHEAD DISTRIBUTION", "PHASE")
-    
-    # Distribution of overheads per piece
     if total_parts_qty > 0:
-        extra_per_part = (tech_per_order + add_costs_order) / total_parts_qty
-        op_cost_per_part = (total_sheets * op_cost_per_sheet) / total_parts_qty
-        analysis_logger.log(f"Overhead per part: Tech+Add={extra_per_part:.2f}, Op={op_cost_per_part:.2f}", "INFO")
+        analysis_logger.log(f"Overhead per part: Tech+Add={order['extra_per_part']:.2f}, "
+                            f"Op={order['op_cost_per_part']:.2f}", "INFO")
     else:
-        extra_per_part = 0.0
-        op_cost_per_part = 0.0
         analysis_logger.log("No parts found - overhead is 0", "WARNING")
 
-    for p in all_parts:
-        p['cost_per_unit'] += extra_per_part + op_cost_per_part
-        p['base_cost_per_unit'] += extra_per_part + op_cost_per_part
-        p['cost_per_unit'] = float(f"{p['cost_per_unit']:.2f}")
-        p['base_cost_per_unit'] = float(f"{p['base_cost_per_unit']:.2f}")
-
-    # Calculate material costs
     analysis_logger.log("CALCULATING MATERIAL COSTS", "PHASE")
-    for p in all_parts:
-        material_cost_per_part = p['adj_weight'] * p.get('base_price_per_kg', 0.0) * 1.07  # Include 7% minimum
-        total_material_cost += material_cost_per_part * p['qty']
-    
     analysis_logger.log(f"Total material cost (with 7% margin): {format_pln(total_material_cost)} PLN", "INFO")
     
     # Update Panel 2 display fields
@@ -2424,59 +3500,23 @@ def analyze_xlsx_folder():
 
     # Populate treeview
     analysis_logger.log("POPULATING DATA TABLE", "PHASE")
-    for i, p in enumerate(all_parts, start=1):
-        item_values = (
-            i,
-            p['subnr'],
-            p['name'],
-            p['material'],
-            f"{p['thickness']}",
-            p['qty'],
-            format_pln(p['cost_per_unit']),
-            "",
-            "",
-            format_pln(p['adj_weight']),
-            format_pln(p['cut_length']),
-        )
-        opts = {'values': item_values}
-        if p['thumb_data']:
-            try:
-                pil_img = Image.open(io.BytesIO(p['thumb_data']))
-                max_w, max_h = 140, 70
-                w, h = pil_img.size
-                ratio = min(max_w / w, max_h / h, 1.0)
-                new_w = int(w * ratio)
-                new_h = int(h * ratio)
-                pil_img = pil_img.resize((new_w, new_h), Image.LANCZOS)
-                thumb = ImageTk.PhotoImage(pil_img)
-                thumbnail_imgs.append(thumb)
-                opts['image'] = thumb
-            except Exception as e:
-                analysis_logger.log(f"Failed to create thumbnail: {str(e)}", "WARNING")
-
-        tree.insert('', 'end', **opts)
+    _populate_parts_tree(results, stale)
 
     # Add total row
-    total_order = sum(p['cost_per_unit'] * p['qty'] for p in all_parts)
+    total_order = money.to_pln(order_prices.total())
     SetTotalPricePerOrder(total_order)
-    total_row_iid = tree.insert('', 'end', values=('', '', 'Total', '', '', '', format_pln(total_order), '', '', '', ''))
+    total_values = ('', '', 'Total', '', '', '', format_grosze_pln(order_prices.total()), '', '', '', '')
+    if incremental and total_row_iid and tree.exists(total_row_iid):
+        tree.item(total_row_iid, values=total_values)
+        tree.move(total_row_iid, '', 'end')
+    else:
+        total_row_iid = tree.insert('', 'end', values=total_values)
     
-    analysis_logger.log(f"Total order value (base + 7% material): {format_pln(total_order)} PLN", "SUCCESS")
+    analysis_logger.log(f"Total order value: {format_pln(total_order)} PLN", "SUCCESS")
 
     # Create merged groups
     analysis_logger.log("CREATING MERGED GROUPS", "PHASE")
-    total_sum = 0.0
-    merged_groups = []
-    for (mat_name, thk, parts) in groups:
-        adj = []
-        for (nm, cost, qty) in parts:
-            c = float(f"{cost:.2f}")
-            adj.append((nm, c, qty))
-            total_sum += c * qty
-        merged_groups.append((mat_name, thk, adj))
-    
-    last_groups = merged_groups
-    last_total_cost = total_sum
+    last_groups, last_total_cost = _merged_groups(groups)
     last_folder_path = folder_path
     
     # Update filter options after populating data
@@ -2491,16 +3531,506 @@ def analyze_xlsx_folder():
     analysis_logger.log(f"AL N₂ cutting time: {aluminum_nitrogen_cutting_time:.2f}h", "INFO")
     analysis_logger.log(f"SUGGESTED material margin: {avg_material_margin:.2f}%", "INFO")
     analysis_logger.log(f"SUGGESTED cutting margin: {avg_cutting_margin:.2f}%", "INFO")
-    analysis_logger.log(f"Files processed: {len(files)}", "SUCCESS")
-    
+    analysis_logger.log(f"Files processed: {len(results)}", "SUCCESS")
+    skipped = job['skipped']
+    missing_prices = sum(1 for level, _ in job.get('diagnostics', []) if level == "WARNING")
+    if skipped:
+        analysis_logger.log(f"Files skipped: {len(skipped)} ({', '.join(skipped)})", "WARNING")
+    analysis_job = None
+    _set_analysis_running(False)
+
+    if quiet:
+        return
+    diagnostics = ""
+    if skipped or missing_prices:
+        diagnostics = (f"Diagnostics: {len(skipped)} file(s) skipped, "
+                       f"{missing_prices} missing price(s) – see the analysis log\n\n")
     messagebox.showinfo("Analysis Complete", 
                        f"XLSX analysis completed!\n\n"
+                       f"{diagnostics}"
                        f"Current prices: Base + 7% material margin only\n\n"
                        f"Suggested margins (not applied):\n"
                        f"• Material: {avg_material_margin:.1f}%\n"
                        f"• Cutting: {avg_cutting_margin:.1f}%\n\n"
                        f"To apply these margins, click 'UPDATE WITH DYNAMIC MARGINS'")
 
+# ---- folder watch (auto-ingest) ----
+folder_watch = None  # AutoIngest running on folder_var while "Watch folder" is ticked
+WATCH_DRAIN_MS = 500
+
+def _same_folder(a, b):
+    return os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+def stop_folder_watch():
+    global folder_watch
+    if folder_watch is not None:
+        folder_watch.stop()
+        analysis_logger.log(f"Stopped watching {folder_watch.folder}", "INFO")
+        folder_watch = None
+
+def start_folder_watch():
+    """(Re)starts watching the selected folder for new or changed exports."""
+    global folder_watch
+    stop_folder_watch()
+    folder_path = folder_var.get()
+    if not folder_path or not os.path.isdir(folder_path):
+        analysis_logger.log("Folder watch: select a folder first", "WARNING")
+        return
+    folder_watch = AutoIngest(folder_path).start()
+    analysis_logger.log(f"Watching {folder_path} for new exports ({folder_watch.backend})", "SUCCESS")
+    root.after(WATCH_DRAIN_MS, _drain_folder_watch, folder_watch)
+
+def toggle_folder_watch():
+    if watch_folder_var.get():
+        start_folder_watch()
+    else:
+        stop_folder_watch()
+
+def _drain_folder_watch(watch):
+    """Publishes exports parsed in the background into the parts table."""
+    if watch is not folder_watch:
+        return  # stopped or replaced
+    if analysis_job is not None or batch_job is not None:
+        root.after(WATCH_DRAIN_MS, _drain_folder_watch, watch)
+        return
+    prefetched = {}
+    changed = []
+    while True:
+        try:
+            kind, path, signature, record, error = watch.results.get_nowait()
+        except queue.Empty:
+            break
+        changed.append(os.path.basename(path))
+        # a record read before the file changed again is dropped; the newer
+        # change is still pending in the watcher
+        if record is not None and signature == _file_signature(path):
+            prefetched[os.path.basename(path)] = record
+    if changed and _same_folder(folder_var.get(), watch.folder):
+        update_file_list(folder_var.get())
+        # only the changed exports are published; the rest of the table (edits,
+        # margins, locked rows) stays as it is
+        analyze_xlsx_folder(prefetched=prefetched, quiet=True, incremental=True)
+        analysis_logger.log(f"Auto-ingest: {len(changed)} change(s) published ({', '.join(sorted(set(changed)))})", "SUCCESS")
+    root.after(WATCH_DRAIN_MS, _drain_folder_watch, watch)
+
+# ---- price list hot reload ----
+price_reloader = None  # FileReloader on MATERIALS_FILE / CUTTING_FILE while "Reload price lists" is ticked
+PRICE_RELOAD_DRAIN_MS = 500
+PRICE_CHANGES_LOGGED = 20  # changed prices listed per reload
+
+def _load_price_tables(kind):
+    """Parsed tables of one price list (reload thread, never touches Tk)."""
+    if kind == "material":
+        return _material_tables(_read_material_rows(), price_date)
+    return _cutting_tables(_read_cutting_rows())
+
+def stop_price_reload():
+    global price_reloader
+    if price_reloader is not None:
+        price_reloader.stop()
+        price_reloader = None
+
+def start_price_reload():
+    """(Re)starts watching both price lists; changes are loaded and swapped in without a click."""
+    global price_reloader
+    stop_price_reload()
+    price_reloader = FileReloader({"material": MATERIALS_FILE, "cutting": CUTTING_FILE}, _load_price_tables).start()
+    analysis_logger.log(f"Watching the price lists for changes ({price_reloader.backend})", "INFO")
+    root.after(PRICE_RELOAD_DRAIN_MS, _drain_price_reload, price_reloader)
+
+def toggle_price_reload():
+    if price_reload_var.get():
+        start_price_reload()
+    else:
+        stop_price_reload()
+
+def _price_change_lines(name, old, new, label, text):
+    """Report lines of the differences between two versions of a price dict."""
+    added = [k for k in new if k not in old]
+    removed = [k for k in old if k not in new]
+    changed = [k for k in new if k in old and new[k] != old[k]]
+    lines = [f"Price list {name} reloaded: {len(changed)} changed, {len(added)} added, {len(removed)} removed"]
+    for k in (changed + added + removed)[:PRICE_CHANGES_LOGGED]:
+        lines.append(f"  {label(k)}: {text(old.get(k))} → {text(new.get(k))}")
+    if len(changed) + len(added) + len(removed) > PRICE_CHANGES_LOGGED:
+        lines.append("  ...")
+    return lines
+
+def _drain_price_reload(reloader):
+    """Swaps price lists re-loaded in the background in between analyses."""
+    if reloader is not price_reloader:
+        return  # stopped or replaced
+    if analysis_job is not None or batch_job is not None:
+        # a running analysis keeps the prices it started with
+        root.after(PRICE_RELOAD_DRAIN_MS, _drain_price_reload, reloader)
+        return
+    tables = {}
+    while True:
+        try:
+            kind, path, signature, value, error = reloader.results.get_nowait()
+        except queue.Empty:
+            break
+        if error is not None:
+            analysis_logger.log(f"Price list {os.path.basename(path)} not reloaded: {error} - keeping the loaded prices", "WARNING")
+            tables.pop(kind, None)
+        elif signature == _file_signature(path):
+            tables[kind] = value
+        # else: changed again while it was read - the newer change is still pending
+    if tables:
+        _apply_reloaded_prices(tables)
+    root.after(PRICE_RELOAD_DRAIN_MS, _drain_price_reload, reloader)
+
+def _apply_reloaded_prices(tables):
+    """Installs re-loaded price tables and re-costs the files whose prices changed.
+
+    Only the parts of those files are re-priced, in memory from their per-file
+    results (the exports are not read again). Rows of the other files, and
+    locked rows, keep their table prices; the re-priced rows get the margins
+    last applied with UPDATE WITH DYNAMIC MARGINS, if any."""
+    global total_material_cost, last_groups, last_total_cost
+    report = []
+    if "material" in tables:
+        old = material_prices
+        _install_material_tables(tables["material"])
+        report += _price_change_lines(os.path.basename(MATERIALS_FILE), old, material_prices,
+                                      lambda k: f"{k[0]} {k[1]:g} mm", _material_price_text)
+    if "cutting" in tables:
+        old = cutting_prices
+        _install_cutting_tables(tables["cutting"])
+        report += _price_change_lines(os.path.basename(CUTTING_FILE), old, cutting_prices,
+                                      lambda k: f"{k[1]} {k[0]:g} mm {k[2]}", _cutting_price_text)
+    _refresh_price_list_widgets()
+    for line in report:
+        analysis_logger.log(line, "INFO")
+    affected = reanalysis.price_changes(file_results, _file_price_inputs)
+    if not affected:
+        return
+    part_count = sum(file_results[f]['part_count'] for f in affected)
+    spans = reanalysis.spans(file_results.values())
+    # the table must still hold exactly the rows of the per-file results
+    if not (_tree_shows_file_results()
+            and len(order_prices) == len(all_parts) == sum(count for _, count in spans.values())):
+        analysis_logger.log(f"Prices changed for {len(affected)} file(s), {part_count} part(s) - "
+                            f"run Analyze XLSX to re-cost them", "WARNING")
+        return
+
+    extra_per_part, op_cost_per_part = costing.overhead_per_part(
+        total_sheets, total_parts_qty, op_cost_per_sheet, tech_per_order, add_costs_order)
+    rows_set = 0
+    for f in affected:
+        res = file_results[f] = _reprice_file_result(file_results[f], parts_store)
+        first, count = spans[f]
+        fields = _part_price_fields(*res['price_key'])
+        merged = []
+        for k, part in enumerate(_file_parts(res, parts_store)):
+            target = all_parts[first + k]
+            target.update(fields, base_cut_cost=part['base_cut_cost'],
+                          cost_per_unit=money.round_pln(part['cost_per_unit'] + extra_per_part + op_cost_per_part),
+                          base_cost_per_unit=money.round_pln(part['base_cost_per_unit'] + extra_per_part + op_cost_per_part))
+            merged.append(target)
+        if applied_margins is None:
+            unit_gr = money.to_grosze([p['cost_per_unit'] for p in merged])
+        else:
+            unit_gr = money.to_grosze(costing.unit_costs(costing.PartCostArrays.from_parts(merged), *applied_margins,
+                                                         extra_per_part, op_cost_per_part))
+            for part, gr in zip(merged, unit_gr):
+                part['cost_per_unit'] = money.to_pln(gr)
+        iids = res['iids']
+        locked = [first + k for k, iid in enumerate(iids) if LOCKED_TAG in tree.item(iid, 'tags')]
+        for row in reanalysis.reprice_rows(order_prices, spans[f], unit_gr, keep=locked):
+            iid = iids[row - first]
+            tree.item(iid, values=_with_table_prices(tree.item(iid, 'values'), row))
+            rows_set += 1
+
+    total_material_cost = sum(res['material_cost'] for res in file_results.values())
+    last_groups, last_total_cost = _merged_groups([res['group'] for res in file_results.values()])
+    update_cost_calculations()
+    update_total()
+    store_original_data()
+    analysis_logger.log(f"Re-priced {len(affected)} file(s), {rows_set} of {part_count} row(s) "
+                        f"({part_count - rows_set} locked kept): {', '.join(affected)}", "SUCCESS")
+
+# ---- plate format optimizer ----
+def _plate_rows():
+    """plate_optimizer.PlateRow of every plate layout of the current analysis."""
+    file_names = {}
+    for p in all_parts:
+        file_names.setdefault(p.get('subnr'), p.get('file_name', ''))
+    rows = []
+    for layout in plate_layouts:
+        size = layout.get('nested_size') or layout.get('plate_size')
+        mat = _norm_s(layout.get('material')); thk = _parse_float(layout.get('thickness'))
+        if not size or not mat or thk is None or not layout.get('cut_number'):
+            continue
+        rows.append(plate_optimizer.PlateRow(
+            label=f"{file_names.get(layout.get('subnr'), '')} / {layout['sheet']}",
+            material=mat, thickness=thk, size=tuple(size), sheets=int(layout['cut_number'])))
+    return rows
+
+def optimize_plate_formats():
+    """Cheapest price-list format and supplier for every plate of the analysis, with the savings."""
+    if not plate_layouts:
+        messagebox.showinfo("Plate formats", "No plate layouts - analyze a folder first."); return
+    if not material_prices:
+        _ensure_cenniki_loaded()
+    rows = _plate_rows()
+    keys = {(r.material, r.thickness) for r in rows}
+    plan = plate_optimizer.optimize(
+        rows,
+        {k: material_history.offers(*k, when=price_date) for k in keys},
+        {k: material_history.as_of(*k, when=price_date) for k in keys})
+
+    analysis_logger.log("PLATE FORMAT OPTIMIZATION", "PHASE")
+    quote_text = lambda q: f"{q.format} {q.supplier or '?'} @ {format_pln(q.price)} PLN/kg"
+    for c in plan.choices:
+        size = "×".join(f"{v:.0f}" for v in c.row.size)
+        if c.best is None:
+            analysis_logger.log(f"{c.row.label}: {c.row.sheets}× {size} mm {c.row.material} {c.row.thickness:g} mm - "
+                                f"no quoted format fits", "WARNING")
+        elif c.current_cost is None:
+            analysis_logger.log(f"{c.row.label}: current format does not fit {size} mm; "
+                                f"cheapest: {quote_text(c.best)} = {format_pln(c.best_cost)} PLN", "WARNING")
+        elif c.saving > 0.005:
+            analysis_logger.log(f"{c.row.label}: {c.row.sheets}× {size} mm: {quote_text(c.current)} "
+                                f"{format_pln(c.current_cost)} → {quote_text(c.best)} {format_pln(c.best_cost)} PLN "
+                                f"(saves {format_pln(c.saving)} PLN)", "INFO")
+    unfitted = len(plan.unfitted())
+    summary = (f"{len(plan.choices)} plate row(s): current formats {format_pln(plan.current_cost)} PLN, "
+               f"cheapest {format_pln(plan.best_cost)} PLN, savings {format_pln(plan.saving)} PLN"
+               + (f"; {unfitted} row(s) without a fitting format" if unfitted else ""))
+    analysis_logger.log(summary, "SUCCESS")
+    messagebox.showinfo("Plate formats", summary + "\n\nDetails in the analysis log.")
+    return plan
+
+# ---- multi-order batch ----
+def _order_project_payload(folder, order, settings):
+    """Project file (as written by save_project_ui) for one batch-analysed order."""
+    parts_payload = []
+    for nr, p in enumerate(order['parts'], 1):
+        parts_payload.append({
+            "values": list(_part_tree_values(nr, p)),
+            "thumb_b64": _b64_encode(_part_thumb_png(p)),
+            "cost_per_unit": p['cost_per_unit'],
+            "qty": p['qty'],
+            "bending_per_unit": p['bending_per_unit'],
+            "additional_per_unit": p['additional_per_unit'],
+        })
+    return {
+        "meta": {
+            "saved_at": datetime.datetime.now().isoformat(),
+            "app": "wycena.py",
+            "batch": True,
+        },
+        "header": {"folder": folder, "customer": "", "offer": "", "date": "", "validity": "", "logo": ""},
+        "texts": {"contact": "", "preceding": "", "finishing": ""},
+        **settings['project'],
+        "calculated": {
+            "oxygen_cutting_time": order['oxygen_cutting_time'],
+            "nitrogen_cutting_time": order['nitrogen_cutting_time'],
+            "aluminum_nitrogen_cutting_time": order['aluminum_nitrogen_cutting_time'],
+            "total_material_cost": order['total_material_cost'],
+            "total_price_per_order": order['total_order'],
+            "labels": {},
+        },
+        "parts": parts_payload,
+        "plate_layouts": order['plate_layouts'],
+    }
+
+def _analyze_order(folder, records, settings, order_name):
+    """Costs one order of a batch and writes its project file into Raporty/.
+
+    Runs on the batch worker thread. Returns the summary index row.
+    """
+    analysis_logger.log(f"ORDER {order_name}", "PHASE")
+    skipped, report = _preflight([path for path, _, _ in records])
+    for level, line in report:
+        analysis_logger.log(f"{order_name}: {line}", level)
+    results = []
+    for path, export, read_error in records:
+        fname = os.path.basename(path)
+        if fname in skipped:
+            continue
+        if read_error is not None:
+            analysis_logger.log(f"{order_name}: skipping {fname}: cannot read file: {read_error}", "ERROR")
+            skipped[fname] = [f"cannot read file: {read_error}"]
+            continue
+        try:
+            results.append(_analyze_export(export, fname, settings['margin_policy']))
+        except Exception as e:
+            analysis_logger.log(f"{order_name}: skipping {fname}: {e}", "ERROR")
+            skipped[fname] = [str(e)]
+    order = _merge_file_results(results, *settings['overheads'])
+
+    result_file = ""
+    status = "OK" if not skipped else f"{len(skipped)} file(s) skipped"
+    if results:
+        try:
+            raporty_path = os.path.join(folder, REPORT_DIR)
+            os.makedirs(raporty_path, exist_ok=True)
+            result_file = os.path.join(raporty_path, f"Wycena_batch_{settings['stamp']}.lpf")
+            with open(result_file, "w", encoding="utf-8") as f:
+                json.dump(_order_project_payload(folder, order, settings), f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            analysis_logger.log(f"{order_name}: cannot write results: {e}", "ERROR")
+            result_file = ""
+            status = f"write failed: {e}"
+    else:
+        status = "no usable files"
+
+    return {
+        'order': order_name,
+        'folder': folder,
+        'files': len(records),
+        'skipped': len(skipped),
+        'parts': len(order['parts']),
+        'qty': order['total_parts_qty'],
+        'sheets': order['total_sheets'],
+        'o2_hours': order['oxygen_cutting_time'],
+        'n2_hours': order['nitrogen_cutting_time'] + order['aluminum_nitrogen_cutting_time'],
+        'material_cost': order['total_material_cost'],
+        'total': order['total_order'],
+        'result_file': result_file,
+        'status': status,
+    }
+
+def _batch_worker(job, settings):
+    """Parses the exports of all orders in one bounded process pool and costs
+    the orders one by one as their files arrive (never touches Tk)."""
+    q = job['queue']
+    parse_cache = None
+    if settings['use_cache']:
+        try:
+            parse_cache = ParseCache(PARSE_CACHE_DIR)
+        except OSError as e:
+            analysis_logger.log(f"Parse cache unavailable: {e}", "WARNING")
+    order_paths = [order_exports(folder) for folder in job['orders']]
+    exports = read_exports([p for paths in order_paths for p in paths], parallel=True,
+                           max_workers=BATCH_MAX_WORKERS, cache=parse_cache)
+    try:
+        for folder, paths in zip(job['orders'], order_paths):
+            if job['cancel'].is_set():
+                q.put(('cancelled',))
+                return
+            records = [next(exports) for _ in paths]
+            name = os.path.relpath(folder, job['root'])
+            if name == os.curdir:
+                name = os.path.basename(os.path.normpath(folder))
+            q.put(('order', _analyze_order(folder, records, settings, name)))
+        q.put(('done',))
+    except Exception as e:  # e.g. the process pool could not start
+        q.put(('error', e))
+    finally:
+        exports.close()
+        if parse_cache:
+            parse_cache.save()
+
+def batch_analyze_orders():
+    """Analyses every order folder under a chosen root folder.
+
+    Each order gets a project file in its Raporty/ folder; one summary index
+    (XLSX) goes to the root's Raporty/ folder. The parts table is not touched.
+    """
+    global batch_job
+    if analysis_job is not None or batch_job is not None:
+        analysis_logger.log("Analysis already running", "WARNING")
+        return
+    root_dir = filedialog.askdirectory(title="Select the folder with order folders",
+                                       initialdir=os.path.dirname(folder_var.get()) or None)
+    if not root_dir:
+        return
+    orders = discover_order_folders(root_dir)
+    analysis_logger.clear()
+    analysis_logger.log("STARTING MULTI-ORDER BATCH ANALYSIS", "PHASE")
+    analysis_logger.log(f"Root folder: {root_dir}", "INFO")
+    if not orders:
+        analysis_logger.log("No order folders with XLSX files found", "ERROR")
+        messagebox.showerror("Error", "No order folders with .xlsx files found.")
+        return
+    analysis_logger.log(f"Found {len(orders)} order folder(s), {BATCH_MAX_WORKERS} parser process(es)", "INFO")
+    if not _ensure_cenniki_loaded():
+        analysis_logger.log("Price lists not loaded - calculations will use 0.00 values", "WARNING")
+
+    # GUI values are read here, once; the worker only gets copies
+    settings = {
+        'margin_policy': _margin_policy(),
+        'overheads': (_parse_float(op_cost_entry.get()) or 0.0,
+                      _parse_float(tech_order_entry.get()) or 0.0,
+                      _parse_float(add_order_cost_entry.get()) or 0.0),
+        'project': _project_settings(),
+        'use_cache': parse_cache_var.get(),
+        'stamp': datetime.datetime.now().strftime("%Y%m%d_%H%M"),
+    }
+    job = {
+        'root': root_dir,
+        'orders': orders,
+        'stamp': settings['stamp'],
+        'rows': [],
+        'queue': queue.Queue(),
+        'cancel': threading.Event(),
+    }
+    batch_job = job
+    _set_analysis_running(True, len(orders))
+    threading.Thread(target=_batch_worker, args=(job, settings), name="BatchWorker", daemon=True).start()
+    root.after(ANALYSIS_POLL_MS, _drain_batch_queue, job)
+
+def _drain_batch_queue(job):
+    """Tk-thread side of the batch: progress, then the summary index."""
+    if job is not batch_job:
+        return
+    while True:
+        try:
+            msg = job['queue'].get_nowait()
+        except queue.Empty:
+            break
+        analysis_logger.flush()
+        kind = msg[0]
+        if kind == 'order':
+            row = msg[1]
+            job['rows'].append(row)
+            analysis_progress.step(1)
+            analysis_logger.log(f"Order {row['order']}: {format_pln(row['total'])} PLN, "
+                                f"{row['parts']} parts, {row['status']}", "SUCCESS")
+        elif kind == 'error':
+            analysis_logger.log(f"Batch stopped: {msg[1]}", "ERROR")
+            _finish_batch(job, f"Batch stopped: {msg[1]}")
+            return
+        elif kind == 'cancelled':
+            analysis_logger.log("Batch cancelled", "WARNING")
+            _finish_batch(job, "Batch cancelled.")
+            return
+        elif kind == 'done':
+            _finish_batch(job, "Batch analysis completed!")
+            return
+    analysis_logger.flush()
+    root.after(ANALYSIS_POLL_MS, _drain_batch_queue, job)
+
+def _finish_batch(job, headline):
+    """Writes the summary index of the orders analysed so far."""
+    global batch_job
+    analysis_logger.flush()
+    batch_job = None
+    _set_analysis_running(False)
+    rows = job['rows']
+    index_path = ""
+    if rows:
+        try:
+            raporty_path = os.path.join(job['root'], REPORT_DIR)
+            os.makedirs(raporty_path, exist_ok=True)
+            index_path = write_summary_index(
+                os.path.join(raporty_path, f"Podsumowanie_wycen_{job['stamp']}.xlsx"), rows)
+            analysis_logger.log(f"Summary index: {index_path}", "SUCCESS")
+        except Exception as e:
+            analysis_logger.log(f"Cannot write summary index: {e}", "ERROR")
+    total = sum(row['total'] for row in rows)
+    skipped = sum(row['skipped'] for row in rows)
+    analysis_logger.log(f"Orders analysed: {len(rows)}/{len(job['orders'])}, total {format_pln(total)} PLN", "PHASE")
+    messagebox.showinfo("Batch analysis",
+                        f"{headline}\n\n"
+                        f"Orders analysed: {len(rows)} of {len(job['orders'])}\n"
+                        f"Files skipped: {skipped}\n"
+                        f"Total: {format_pln(total)} PLN\n\n"
+                        f"Summary: {index_path or '-'}")
+
 def get_next_offer_number():
     month_year = datetime.datetime.now().strftime("%m/%Y")
     month_key = datetime.datetime.now().strftime("counter_%Y-%m")
@@ -2540,20 +4070,40 @@ def generate_report():
     raporty_path = os.path.join(folder_path, "Raporty")
     os.makedirs(raporty_path, exist_ok=True)
 
-    # Update all_parts from tree
-    tree_items = tree.get_children()
-    if len(tree_items) != len(all_parts) + 1:  # +1 for total row
+    # Update all_parts from the table's qty and prices
+    if len(order_prices) != len(all_parts):
         messagebox.showerror("Error", "Data mismatch between table and parts list.")
         return
-
-    for idx, item in enumerate(tree_items[:-1]):  # Exclude total row
-        vals = tree.item(item, 'values')
-        if len(vals) < 11:
-            vals = vals + ('', '') * (11 - len(vals))
-        all_parts[idx]['qty'] = int(vals[5] or 0)
-        all_parts[idx]['cost_per_unit'] = _parse_float(vals[6]) or 0.0
-        all_parts[idx]['bending_per_unit'] = _parse_float(vals[7]) or 0.0
-        all_parts[idx]['additional_per_unit'] = _parse_float(vals[8]) or 0.0
+    order_prices.update_parts(all_parts)
+    # every output sums these exact line totals [gr]
+    line_totals = order_prices.line_totals()
+    piece_prices = order_prices.piece_prices()
+    order_total = order_prices.total()
+    SetTotalPricePerOrder(money.to_pln(order_total))
+
+    # Quantity tiers: extra unit price columns in the DOCX and the client XLSX
+    try:
+        tiers = _parse_quantity_tiers(quantity_tiers_entry.get())
+    except ValueError as e:
+        messagebox.showerror("Error", f"Invalid quantity tiers:\n{e}")
+        return
+    part_file = []
+    part_index_by_name = {}
+    for idx, (subnr, name) in enumerate(_part_columns('subnr', 'name')):
+        part_file.append((subnr or 1) - 1)
+        part_index_by_name.setdefault(name, idx)
+    tier_prices = quantity_tier_prices(part_file, tiers) if tiers else None
+
+    # Every cost component of every part (costing engine); quantities and
+    # bending as just written to the parts from order_prices
+    extra_per_part, op_cost_per_part = _order_overheads()
+    (oxygen_rate_tkw, nitrogen_rate_tkw, al_nitrogen_rate_tkw), bending_percent_tkw = _tkw_rates()
+    part_qty = order_prices.qty.astype(float)
+    costs = costing.breakdown(costing.PartCostArrays.from_parts(all_parts),
+                              extra_per_part=extra_per_part, op_cost_per_part=op_cost_per_part,
+                              bending=money.to_pln(order_prices.bending),
+                              hourly_rates=(oxygen_rate_tkw, nitrogen_rate_tkw, al_nitrogen_rate_tkw),
+                              bending_percent=bending_percent_tkw)
 
     # Enhanced log file with detailed cost breakdowns
     log_path = os.path.join(raporty_path, "cost_calculation_log.txt")
@@ -2574,8 +4124,9 @@ def generate_report():
         log.write(f"Applied cutting margin: {_parse_float(cutting_margin_var.get()):.2f}%\n\n")
         
         log.write("Margin Calculation Parameters:\n")
-        log.write(f"Material: 250% to 0% margin for areas {_parse_float(min_area_var.get()):.2f} to {_parse_float(max_area_var.get()):.2f} m²\n")
-        log.write(f"Cutting: 200% to 0% margin for lengths {_parse_float(min_cutting_var.get()):.0f} to {_parse_float(max_cutting_var.get()):.0f} mm\n\n")
+        policy = _margin_policy()
+        log.write(f"Material margin [%] by plate area [m²]: {policy.area}\n")
+        log.write(f"Cutting margin [%] by cut length [mm]: {policy.cut_length}\n\n")
         
         log.write("FILE-BY-FILE MARGIN ANALYSIS\n")
         log.write("-"*40 + "\n")
@@ -2591,19 +4142,7 @@ def generate_report():
         log.write("DETAILED PART-BY-PART COST BREAKDOWN\n")
         log.write("="*80 + "\n\n")
         
-        # Get overhead values
-        op_cost_per_sheet = _parse_float(op_cost_entry.get()) or 0.0
-        tech_per_order = _parse_float(tech_order_entry.get()) or 0.0
-        add_costs_order = _parse_float(add_order_cost_entry.get()) or 0.0
-        
-        if total_parts_qty > 0:
-            extra_per_part = (tech_per_order + add_costs_order) / total_parts_qty
-            op_cost_per_part = (total_sheets * op_cost_per_sheet) / total_parts_qty
-        else:
-            extra_per_part = 0.0
-            op_cost_per_part = 0.0
-        
-        for part in all_parts:
+        for k, part in enumerate(all_parts):
             log.write(f"Part ID: {part['id']} - {part['name']}\n")
             log.write("-"*60 + "\n")
             log.write(f"  File: {part.get('file_name', 'N/A')}\n")
@@ -2613,35 +4152,36 @@ def generate_report():
             log.write(f"  Adjusted weight: {part.get('adj_weight', 0.0):.3f} kg\n\n")
             
             log.write("  Cost Components:\n")
-            mat_cost = part.get('adj_weight', 0.0) * part.get('base_price_per_kg', 0.0) * 1.07
+            mat_cost = costs.material[k]
             log.write(f"    Material cost: {mat_cost:.2f} PLN\n")
             log.write(f"      Weight: {part.get('adj_weight', 0.0):.3f} kg\n")
             log.write(f"      Price: {part.get('base_price_per_kg', 0.0):.2f} PLN/kg\n")
             log.write(f"      With 7% margin: {mat_cost:.2f} PLN\n")
             
-            cut_cost = part.get('cut_length', 0.0) * part.get('base_rate_per_cut_length', 0.0)
-            log.write(f"    Cutting cost: {cut_cost:.2f} PLN\n")
+            log.write(f"    Cutting cost: {costs.cutting_base[k]:.2f} PLN\n")
             log.write(f"      Length: {part.get('cut_length', 0.0):.2f} m\n")
             log.write(f"      Rate: {part.get('base_rate_per_cut_length', 0.0):.2f} PLN/m\n")
             
-            contour_cost = part.get('contours_qty', 0.0) * part.get('rate_per_contour', 0.0)
-            log.write(f"    Contours: {contour_cost:.2f} PLN\n")
+            log.write(f"    Contours: {costs.contours[k]:.2f} PLN\n")
             log.write(f"      Quantity: {part.get('contours_qty', 0.0):.0f}\n")
             log.write(f"      Rate: {part.get('rate_per_contour', 0.0):.2f} PLN/pc\n")
             
-            marking_cost = part.get('marking_length', 0.0) * part.get('rate_per_marking_length', 0.0)
-            log.write(f"    Marking: {marking_cost:.2f} PLN\n")
-            
-            defilm_cost = part.get('defilm_length', 0.0) * part.get('rate_per_defilm_length', 0.0)
-            log.write(f"    Defilm: {defilm_cost:.2f} PLN\n")
-            
-            log.write(f"    Operational overhead: {op_cost_per_part:.2f} PLN\n")
-            log.write(f"    Technology overhead: {extra_per_part:.2f} PLN\n")
+            log.write(f"    Marking: {costs.marking[k]:.2f} PLN\n")
+            log.write(f"    Defilm: {costs.defilm[k]:.2f} PLN\n")
+            log.write(f"    Operational overhead: {costs.operational[k]:.2f} PLN\n")
+            log.write(f"    Technology overhead: {costs.extra[k]:.2f} PLN\n")
             
             log.write(f"\n  Final unit cost: {part['cost_per_unit']:.2f} PLN\n")
             log.write(f"  Total for {part['qty']} pcs: {part['cost_per_unit'] * part['qty']:.2f} PLN\n")
             log.write("\n")
 
+        if tier_prices is not None:
+            log.write("="*80 + "\n")
+            log.write("QUANTITY TIERS (every part ordered in the tier quantity)\n")
+            log.write("="*80 + "\n")
+            for tier, sheets, order_total in zip(tier_prices.tiers, tier_prices.sheets, tier_prices.order_totals):
+                log.write(f"  {tier:.0f} pcs: {sheets:.0f} sheets, order value {order_total:.2f} PLN\n")
+
     # Generate DOCX
     doc = Document()
     sections = doc.sections
@@ -2666,7 +4206,8 @@ def generate_report():
     if preceding_text:
         doc.add_paragraph(preceding_text)
 
-    table = doc.add_table(rows=1, cols=7)
+    tier_count = len(tiers)
+    table = doc.add_table(rows=1, cols=7 + tier_count)
     table.style = 'Table Grid'
     hdr = table.rows[0].cells
     hdr[0].text = 'Lp.'
@@ -2676,6 +4217,8 @@ def generate_report():
     hdr[4].text = 'Net weight'
     hdr[5].text = 'Cost (PLN)'
     hdr[6].text = 'Total (PLN)'
+    for k, tier in enumerate(tiers):
+        hdr[7 + k].text = f'{tier} pcs (PLN/pc)'
     for cell in table.rows[0].cells:
         tcPr = cell._tc.get_or_add_tcPr()
         shd = OxmlElement('w:shd')
@@ -2688,26 +4231,30 @@ def generate_report():
         run.bold = True
         run.font.size = Pt(11)
 
-    total = 0.0
+    total = 0
     lp = 1
+    # groups list the parts in all_parts order; by name only for a table that no longer matches
+    groups_in_order = sum(len(parts) for _, _, parts in last_groups) == len(all_parts)
     for mat_name, thk, parts in last_groups:
         row = table.add_row().cells
         row[0].text = ""
         row[1].text = ""
         row[2].text = f"Material: {mat_name}, Thickness: {thk} mm"
-        row[2].merge(row[6])
+        row[2].merge(row[-1])
         run = row[2].paragraphs[0].runs[0]
         run.font.size = Pt(9)
         run.italic = True
         for nm, cost_per_unit, qty in parts:
-            part = next(p for p in all_parts if p['name'] == nm)
+            index = lp - 1 if groups_in_order else part_index_by_name[nm]
+            part = all_parts[index]
             r = table.add_row().cells
             r[0].text = str(lp)
             # Embed graphic in column 2 (Miniatura)
-            if part['thumb_data']:
+            thumb_png = _part_thumb_png(part)
+            if thumb_png:
                 try:
                     run = r[1].add_paragraph().add_run()
-                    run.add_picture(io.BytesIO(part['thumb_data']))
+                    run.add_picture(io.BytesIO(thumb_png))
                 except Exception:
                     pass
             r[2].text = str(nm) if nm else "No name"
@@ -2716,10 +4263,14 @@ def generate_report():
             r[4].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
             r[4].paragraphs[0].add_run(f"{format_pln(part['raw_weight'])}  ").font.size = Pt(10)
             r[5].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
-            r[5].paragraphs[0].add_run(f"{format_pln(part['cost_per_unit'] + part['bending_per_unit'] + part['additional_per_unit'])}  ").font.size = Pt(10)
-            row_total = (part['cost_per_unit'] + part['bending_per_unit'] + part['additional_per_unit']) * part['qty']
+            r[5].paragraphs[0].add_run(f"{format_grosze_pln(piece_prices[index])}  ").font.size = Pt(10)
+            row_total = int(line_totals[index])
             r[6].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
-            r[6].paragraphs[0].add_run(f"{format_pln(row_total)}  ").font.size = Pt(10)
+            r[6].paragraphs[0].add_run(f"{format_grosze_pln(row_total)}  ").font.size = Pt(10)
+            for k in range(tier_count):
+                r[7 + k].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
+                r[7 + k].paragraphs[0].add_run(
+                    f"{format_grosze_pln(tier_prices.unit_grosze[k, index])}  ").font.size = Pt(10)
             total += row_total
             lp += 1
 
@@ -2727,22 +4278,32 @@ def generate_report():
     srow[1].text = ""
     srow[2].text = "Total"
     srow[4].text = ""
-    srow[6].text = format_pln(total)
+    srow[6].text = format_grosze_pln(total)
     srow[6].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
     for r in srow[2].paragraphs[0].runs:
         r.bold = True
     for r in srow[6].paragraphs[0].runs:
         r.bold = True
+    for k in range(tier_count):
+        srow[7 + k].text = format_grosze_pln(tier_prices.order_total_grosze[k])
+        srow[7 + k].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
+        for r in srow[7 + k].paragraphs[0].runs:
+            r.bold = True
 
-    widths = [Cm(1), Cm(2), Cm(6), Cm(2), Cm(2), Cm(3), Cm(3)]
+    widths = [Cm(1), Cm(2), Cm(6), Cm(2), Cm(2), Cm(3), Cm(3)] + [Cm(2)] * tier_count
     for i, w in enumerate(widths):
         for cell in table.columns[i].cells:
             cell.width = w
 
-    p = doc.add_paragraph(f"Total cost: {format_pln(total)} PLN")
+    p = doc.add_paragraph(f"Total cost: {format_grosze_pln(total)} PLN")
     p.paragraph_format.space_before = Pt(12)
     for r in p.runs:
         r.font.size = Pt(14)
+    if tier_count:
+        p = doc.add_paragraph("Quantity columns: price of one piece when every part is ordered "
+                              "in that quantity; the Total row gives the order value.")
+        for r in p.runs:
+            r.font.size = Pt(9)
     
     if finishing_text:
         pf = doc.add_paragraph(finishing_text)
@@ -2788,62 +4349,22 @@ def generate_report():
         cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
         cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
     
-    # Calculate overhead distribution
-    if total_parts_qty > 0:
-        extra_per_part = (tech_per_order + add_costs_order) / total_parts_qty
-        op_cost_per_part = (total_sheets * op_cost_per_sheet) / total_parts_qty
-    else:
-        extra_per_part = 0.0
-        op_cost_per_part = 0.0
-    
-    # Get TKW rates for calculations
-    oxygen_rate_tkw = _parse_float(oxygen_rate_entry_TKW.get()) or 262.50
-    nitrogen_rate_tkw = _parse_float(nitrogen_rate_entry_TKW.get()) or 412.50
-    al_nitrogen_rate_tkw = _parse_float(al_nitrogen_rate_entry_TKW.get()) or 487.50
-    bending_percent_tkw = _parse_float(bending_percent_entry_TKW.get()) or 75.0
-    
-    # Data for corrected charts
+    # Data for corrected charts (TKW components of the whole order)
     cost_components = {
-        'Materiał': 0.0,
-        'Cięcie laserowe': 0.0,
-        'Koszty operacyjne': 0.0,
-        'Technologia': 0.0,
-        'Gięcie': 0.0,
-        'Koszty dodatkowe': 0.0
+        'Materiał': float(costs.material_base @ part_qty),
+        'Cięcie laserowe': float(costs.tkw_cutting @ part_qty),
+        'Koszty operacyjne': float(costs.operational @ part_qty),
+        'Technologia': float(costs.extra @ part_qty),
+        'Gięcie': float(costs.tkw_bending @ part_qty),
+        'Koszty dodatkowe': float(money.to_pln(order_prices.additional) @ part_qty)
     }
-    tkw_total = 0.0
+    tkw_total = float(costs.tkw @ part_qty)
     row_num = 2
-    for part in all_parts:
-        # Calculate individual cost components
-        mat_cost = part['adj_weight'] * part.get('base_price_per_kg', 0.0) 
-        
-        # Get cutting time per part
-        part_cutting_time = (part.get('cut_length', 0.0) / part.get('cuuting_speed_m_min', 0.0) ) / 60.0  # in hours
-        
-        # Calculate TKW cutting cost based on gas type
-        gas_type = part.get('gas_key', 'O')
-        material_name = part.get('material', '')
-        
-        if gas_type == 'O':
-            cut_cost_tkw = part_cutting_time * oxygen_rate_tkw
-        elif gas_type == 'N':
-            if 'AL' in material_name.upper():
-                cut_cost_tkw = part_cutting_time * al_nitrogen_rate_tkw
-            else:
-                cut_cost_tkw = part_cutting_time * nitrogen_rate_tkw
-        else:
-            cut_cost_tkw = part_cutting_time * oxygen_rate_tkw  # Default to O2
-        
+    for k, part in enumerate(all_parts):
+        # Cost components of one piece
+        part_cutting_time = costs.cutting_hours[k]
+        cut_cost_tkw = costs.tkw_cutting[k]
         bending_cost = part.get('bending_per_unit', 0.0)
-        bending_cost_tkw = bending_cost * (bending_percent_tkw / 100.0)
-        
-        # Accumulate for charts (multiply by quantity for total costs)
-        cost_components['Materiał'] += mat_cost * part['qty']
-        cost_components['Cięcie laserowe'] += cut_cost_tkw * part['qty']
-        cost_components['Koszty operacyjne'] += op_cost_per_part * part['qty']
-        cost_components['Technologia'] += extra_per_part * part['qty']
-        cost_components['Gięcie'] += bending_cost_tkw * part['qty']
-        cost_components['Koszty dodatkowe'] += part.get('additional_per_unit', 0.0) * part['qty']
         
         # Write data with proper column order (Miniatura as column 2)
         detail_ws.cell(row=row_num, column=1, value=part['id'])
@@ -2903,9 +4424,10 @@ def generate_report():
         cell.number_format = '#,##0.00'
         
         # Add thumbnail in column 2 (B)
-        if part.get('thumb_data'):
+        thumb_png = _part_thumb_png(part)
+        if thumb_png:
             try:
-                img = OpenpyxlImage(io.BytesIO(part['thumb_data']))
+                img = OpenpyxlImage(io.BytesIO(thumb_png))
                 img.width = 60
                 img.height = 40
                 detail_ws.add_image(img, f'B{row_num}')
@@ -2919,8 +4441,6 @@ def generate_report():
             if col >= 4:  # Numeric columns (after material name)
                 cell.alignment = Alignment(horizontal="right")
         
-        # Calculate TKW total
-        tkw_total += (mat_cost + cut_cost_tkw + op_cost_per_part + extra_per_part + bending_cost_tkw) * part['qty']
         row_num += 1
     
     # Add totals row with formulas
@@ -3199,7 +4719,7 @@ def generate_report():
         "ID", "Miniatura", "Part name", "Material", 
         "Thickness [mm]", "Unit weight [kg]", 
         "Quantity [pcs]", "Unit cost [PLN]", "Total cost [PLN]"
-    ]
+    ] + [f"Unit cost @ {tier} pcs [PLN]" for tier in tiers]
     
     header_row = 8
     for col, header in enumerate(headers, 1):
@@ -3217,7 +4737,7 @@ def generate_report():
     
     # Add data rows with alternating colors
     data_start_row = header_row + 1
-    client_total = 0.0
+    client_total = 0
     
     for idx, part in enumerate(all_parts):
         row_num = data_start_row + idx
@@ -3225,8 +4745,8 @@ def generate_report():
         # Alternate row colors for better readability
         fill_color = "F2F2F2" if idx % 2 == 0 else "FFFFFF"
         
-        unit_total = part['cost_per_unit'] + part['bending_per_unit'] + part['additional_per_unit']
-        total_part = unit_total * part['qty']
+        unit_total = int(piece_prices[idx])
+        total_part = int(line_totals[idx])
         client_total += total_part
         
         # ID
@@ -3296,9 +4816,10 @@ def generate_report():
         cell = client_ws.cell(row=row_num, column=2, value='')
         cell.fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
 
-        if part.get('thumb_data'):
+        thumb_png = _part_thumb_png(part)
+        if thumb_png:
             try:
-                add_image_inside_cell(client_ws, row=row_num, col=2, img_bytes=part['thumb_data'], padding_px=2)
+                add_image_inside_cell(client_ws, row=row_num, col=2, img_bytes=thumb_png, padding_px=2)
             except Exception as e:
                 # optionally log error
                 pass
@@ -3311,8 +4832,8 @@ def generate_report():
             part['thickness'],
             f"{part.get('raw_weight', 0.0):.3f}",
             part['qty'],
-            f"{unit_total:.2f}",
-            f"{total_part:.2f}"
+            money.format_grosze(unit_total, decimal="."),
+            money.format_grosze(total_part, decimal=".")
         ]
         
         for col, value in enumerate(values, 3):
@@ -3323,6 +4844,12 @@ def generate_report():
             if col in [2, 3]:  # text
                 cell.alignment = Alignment(horizontal="left",vertical="center", wrap_text=True)
             cell.border = Border(left=Side(style='thin'), right=Side(style='thin'))
+
+        for k in range(len(tiers)):
+            cell = client_ws.cell(row=row_num, column=10 + k, value=money.format_grosze(tier_prices.unit_grosze[k, idx], decimal="."))
+            cell.fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
+            cell.alignment = Alignment(horizontal="right", wrap_text=True)
+            cell.border = Border(left=Side(style='thin'), right=Side(style='thin'))
     
     # Total row
     total_row = data_start_row + len(all_parts)
@@ -3336,11 +4863,19 @@ def generate_report():
         cell = client_ws.cell(row=total_row, column=col, value="")
         cell.fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
     
-    cell = client_ws.cell(row=total_row, column=9, value=f"{client_total:.2f}")
+    cell = client_ws.cell(row=total_row, column=9, value=money.format_grosze(client_total, decimal="."))
     cell.font = Font(bold=True, size=12)
     cell.fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
     cell.alignment = Alignment(horizontal="right")
     cell.border = Border(top=Side(style='double'), bottom=Side(style='double'))
+
+    # order value at every quantity tier
+    for k in range(len(tiers)):
+        cell = client_ws.cell(row=total_row, column=10 + k, value=money.format_grosze(tier_prices.order_total_grosze[k], decimal="."))
+        cell.font = Font(bold=True, size=12)
+        cell.fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
+        cell.alignment = Alignment(horizontal="right")
+        cell.border = Border(top=Side(style='double'), bottom=Side(style='double'))
     
     # Add closing text with disclaimers
     disclaimer_start = total_row + 3
@@ -3385,6 +4920,8 @@ def generate_report():
         'H': 18,  # Unit cost
         'I': 18   # Total cost
     }
+    for k in range(len(tiers)):
+        column_widths[get_column_letter(10 + k)] = 18  # Unit cost @ tier
     
     for col, width in column_widths.items():
         client_ws.column_dimensions[col].width = width
@@ -3412,6 +4949,51 @@ btn_analyze.grid(row=1, column=0, padx=5, pady=5, sticky="we")
 btn_report = ttk.Button(buttons_frame, text="Generate report", command=generate_report)
 btn_report.grid(row=1, column=1, padx=5, pady=5, sticky="we")
 
+# analysis progress (files) + cancel
+analysis_progress = ttk.Progressbar(buttons_frame, mode="determinate")
+analysis_progress.grid(row=5, column=0, padx=5, pady=5, sticky="we")
+btn_cancel_analysis = ttk.Button(buttons_frame, text="Cancel", command=cancel_analysis)
+btn_cancel_analysis.grid(row=5, column=1, padx=5, pady=5, sticky="we")
+btn_cancel_analysis.state(['disabled'])
+
+# every order folder under a root, one result file per order + summary index
+ttk.Button(buttons_frame, text="Batch: all orders...", command=batch_analyze_orders).grid(
+    row=6, column=0, columnspan=2, padx=5, pady=5, sticky="we")
+
+# parse exports in worker processes (results are merged in file-name order)
+parallel_ingest_var = tk.BooleanVar(value=False)
+tk.Checkbutton(buttons_frame, text="Parallel ingestion", variable=parallel_ingest_var,
+               bg="#2c2c2c", fg="white", selectcolor="#2c2c2c",
+               activebackground="#2c2c2c", activeforeground="white").grid(row=2, column=0, padx=5, sticky="w")
+
+# only re-read files that were added or changed since the last analysis of the folder
+incremental_var = tk.BooleanVar(value=True)
+tk.Checkbutton(buttons_frame, text="Incremental re-analysis", variable=incremental_var,
+               bg="#2c2c2c", fg="white", selectcolor="#2c2c2c",
+               activebackground="#2c2c2c", activeforeground="white").grid(row=3, column=0, columnspan=2, padx=5, sticky="w")
+
+# watch the selected folder and publish new/changed exports without "Analyze XLSX"
+watch_folder_var = tk.BooleanVar(value=False)
+tk.Checkbutton(buttons_frame, text="Watch folder (auto-ingest)", variable=watch_folder_var, command=toggle_folder_watch,
+               bg="#2c2c2c", fg="white", selectcolor="#2c2c2c",
+               activebackground="#2c2c2c", activeforeground="white").grid(row=4, column=0, columnspan=2, padx=5, sticky="w")
+
+# reuse parsed exports from PARSE_CACHE_DIR (untick to force re-reading every file)
+parse_cache_var = tk.BooleanVar(value=True)
+tk.Checkbutton(buttons_frame, text="Use parse cache", variable=parse_cache_var,
+               bg="#2c2c2c", fg="white", selectcolor="#2c2c2c",
+               activebackground="#2c2c2c", activeforeground="white").grid(row=2, column=1, padx=5, sticky="w")
+
+# keep the parts of the order in a SQLite file instead of memory (very large orders)
+parts_store_var = tk.BooleanVar(value=False)
+tk.Checkbutton(buttons_frame, text="Disk parts store (large orders)", variable=parts_store_var,
+               bg="#2c2c2c", fg="white", selectcolor="#2c2c2c",
+               activebackground="#2c2c2c", activeforeground="white").grid(row=7, column=0, columnspan=2, padx=5, sticky="w")
+
+# cheapest price-list format / supplier per plate (plate_optimizer.py)
+ttk.Button(buttons_frame, text="Plate formats: find savings", command=optimize_plate_formats).grid(
+    row=8, column=0, columnspan=2, padx=5, pady=5, sticky="we")
+
 # make columns expand nicely (do once for buttons_frame)
 buttons_frame.grid_columnconfigure(0, weight=1)
 buttons_frame.grid_columnconfigure(1, weight=1)
@@ -3445,4 +5027,10 @@ root.after_idle(set_sash_positions)
 
 # run
 root.geometry("2100x1200")
-root.mainloop()
\ No newline at end of file
+if __name__ == "__main__":
+    if price_reload_var.get():
+        start_price_reload()
+    root.mainloop()
+    stop_price_reload()
+    if parts_store is not None:
+        parts_store.close()
\ No newline at end of file